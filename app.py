@@ -4,9 +4,15 @@ from datetime import date
 import database as db
 import utils_excel as xls_gen
 import utils_native
-import utils_pdf
+import utils_vectorpdf
+import utils_import
+import utils_dbstats
+import utils_rendercache
+import utils_export
+import utils_syncqueue
 import os
 import shutil
+import tempfile
 import platform
 from PIL import Image
 
@@ -202,10 +208,11 @@ def get_drive_path():
 
 import utils_drive
 
-def sync_to_drive(src_path, dest_subfolder, dest_filename=None):
+def upload_now(src_path, dest_subfolder, dest_filename=None):
     """
     1. Ensures a local backup copy in ./backups/data/
     2. Syncs file to Google Drive (if available).
+    Runs on the sync queue's worker thread; use sync_to_drive() from the UI.
     """
     # --- 1. Robust Local Backup ---
     try:
@@ -252,14 +259,152 @@ def sync_to_drive(src_path, dest_subfolder, dest_filename=None):
             print(f"Cloud Sync Fail: {e}")
             return False
 
+def drive_available():
+    return bool(get_drive_path()) if platform.system() == "Darwin" else "gcp_service_account" in st.secrets
+
+def sync_job(src_path, dest_subfolder, dest_filename=None):
+    """Queue handler. Without any Drive configured the local backup is all there is, so don't retry."""
+    return upload_now(src_path, dest_subfolder, dest_filename) or not drive_available()
+
+def sync_to_drive(src_path, dest_subfolder, dest_filename=None):
+    """
+    Queue a file for backup/Drive upload and return immediately.
+    Re-queuing the same target before it is sent only uploads the latest file.
+    """
+    try:
+        utils_syncqueue.enqueue(src_path, dest_subfolder, dest_filename)
+        return True
+    except Exception as e:
+        print(f"Sync Queue Error: {e}")
+        return False
+
+MASTER_LEDGER_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), xls_gen.MASTER_LEDGER_PATH)
+
+def build_master_ledger():
+    return xls_gen.write_master_ledger(db.iter_sales_ledger(), db.SALES_LEDGER_COLUMNS, MASTER_LEDGER_FILE)
+
+# Master_Sales.xlsx is rebuilt by the sync worker when its upload comes up
+utils_syncqueue.register_builder(MASTER_LEDGER_FILE, build_master_ledger)
+
+def sync_master_ledger():
+    """Queue a rebuild + upload of Master_Sales.xlsx after invoices were saved."""
+    try:
+        utils_syncqueue.enqueue_on_change(MASTER_LEDGER_FILE, "Master", db.get_write_generation())
+    except Exception as e:
+        print(f"Sync Queue Error: {e}")
+
 def sync_db():
-    """Sync the database file to Drive."""
-    sync_to_drive("autobiller.db", "Database")
+    """
+    Queue the database for Drive (a consistent snapshot is taken at upload
+    time). No-op unless something was written since it was last queued.
+    """
+    try:
+        utils_syncqueue.enqueue_on_change(db.DB_FILE, "Database", db.get_write_generation())
+    except Exception as e:
+        print(f"Sync Queue Error: {e}")
 
-# Initial Sync
+# "Office": LibreOffice / Excel first, native renderer as fallback.
+# "Native": utils_vectorpdf only (no office suite needed, ~25 ms per document).
+PDF_ENGINES = ["Office", "Native"]
+DEFAULT_PDF_ENGINE = os.environ.get("AUTOBILLER_PDF_ENGINE", "Office").capitalize()
+
+NATIVE_PDF_MSG = "Rendered by the native PDF engine"
+
+def use_native_pdf():
+    return st.session_state.get('pdf_engine', DEFAULT_PDF_ENGINE) == "Native"
+
+def export_pdf(xls_path, pdf_path, fallback=None):
+    """
+    PDF Generation Cascade:
+    1. LibreOffice (Preferred)  2. macOS AppleScript  3. fallback() -> PDF bytes
+    With the Native engine selected, fallback() is used directly.
+    Returns (success, msg); msg is NATIVE_PDF_MSG when fallback() made the PDF.
+    """
+    success, msg = False, NATIVE_PDF_MSG
+    if not (use_native_pdf() and fallback):
+        success, msg = utils_native.convert_with_libreoffice(xls_path, pdf_path)
+        if not success and platform.system() == "Darwin":
+            success, msg = utils_native.convert_excel_to_pdf(xls_path, pdf_path)
+    if not success and fallback:
+        try:
+            with open(pdf_path, "wb") as f:
+                f.write(fallback())
+            success, msg = True, NATIVE_PDF_MSG
+        except Exception as e:
+            msg = f"Fallback PDF Failed: {e}"
+    return success, msg
+
+def pdf_from_bytes(xls_bytes, fallback=None):
+    """
+    Convert in-memory .xlsx bytes to PDF bytes via export_pdf().
+    The converters need real files, so they work in a throwaway temp dir.
+    Returns (pdf_bytes or None, msg).
+    """
+    if use_native_pdf() and fallback:
+        try:
+            return fallback(), NATIVE_PDF_MSG
+        except Exception as e:
+            return None, f"Fallback PDF Failed: {e}"
+    with tempfile.TemporaryDirectory(prefix="autobiller_") as tmp:
+        xls_path = os.path.join(tmp, "doc.xlsx")
+        pdf_path = os.path.join(tmp, "doc.pdf")
+        with open(xls_path, "wb") as f:
+            f.write(xls_bytes)
+        success, msg = export_pdf(xls_path, pdf_path, fallback=fallback)
+        if not (success and os.path.exists(pdf_path)):
+            return None, msg
+        with open(pdf_path, "rb") as f:
+            return f.read(), msg
+
+def cached_pdf(kind, data, xls_bytes, native_render):
+    """
+    PDF bytes through the render cache, keyed by the engine that made them.
+    A native fallback produced while LibreOffice was down is stored under the
+    native key, so the office entry is filled once conversion works again.
+    """
+    native_variant = f"native:{utils_vectorpdf.RENDER_VERSION}"
+    if use_native_pdf():
+        return utils_rendercache.get_or_render(kind, data, 'pdf', native_render, variant=native_variant)
+    office_key = utils_rendercache.render_key(kind, data, variant="office")
+    pdf_bytes = utils_rendercache.get(office_key, 'pdf')
+    if pdf_bytes is None:
+        pdf_bytes, msg = pdf_from_bytes(xls_bytes, fallback=native_render)
+        if pdf_bytes is not None:
+            key = utils_rendercache.render_key(kind, data, variant=native_variant) if msg == NATIVE_PDF_MSG else office_key
+            utils_rendercache.put(key, 'pdf', pdf_bytes)
+    return pdf_bytes
+
+# --- Keyset Paging Helpers ---
+PAGE_SIZE = 25
+
+def page_cursor(state_key):
+    """Cursor of the page currently shown under state_key (None = first page)."""
+    if state_key not in st.session_state:
+        st.session_state[state_key] = [None]
+    return st.session_state[state_key][-1]
+
+def page_nav(state_key, next_cursor):
+    """Prev / Next buttons. Visited cursors are kept as a stack in session state."""
+    stack = st.session_state[state_key]
+    n1, n2, n3 = st.columns([1, 3, 1])
+    if n1.button("◀ Prev", key=f"{state_key}_prev", disabled=len(stack) == 1):
+        stack.pop()
+        st.rerun()
+    n2.caption(f"Page {len(stack)}")
+    if n3.button("Next ▶", key=f"{state_key}_next", disabled=next_cursor is None):
+        stack.append(next_cursor)
+        st.rerun()
+
+# Background Drive uploads (jobs persist in the DB across restarts)
+utils_syncqueue.start_sync_worker(sync_job)
+
+# Initial Sync, then again on the first rerun after any data write
 if platform.system() == "Darwin" or "gcp_service_account" in st.secrets:
     sync_db()
 
+# Warm up the LibreOffice conversion server in the background (no-op if unavailable)
+utils_native.start_office_server()
+
 st.title("🧾 Auto Biller")
 
 # Sidebar Navigation
@@ -407,6 +552,122 @@ if menu == "Settings":
         if not materials.empty:
             st.dataframe(materials[['name', 'unit']])
 
+    st.divider()
+    st.subheader("Database Performance")
+    perf1, perf2, perf3 = st.columns([1, 1, 1])
+    stats_on = perf1.toggle("Collect query stats", value=utils_dbstats.is_enabled(), key="db_stats_on")
+    slow_ms = perf2.number_input("Slow query threshold (ms)", min_value=0, value=int(utils_dbstats.get_slow_ms()), step=10, key="db_slow_ms")
+    if stats_on:
+        utils_dbstats.enable(slow_ms=slow_ms)
+    else:
+        utils_dbstats.disable()
+    if perf3.button("Reset Stats"):
+        utils_dbstats.reset()
+    
+    stat_rows = utils_dbstats.get_stats_rows()
+    if stat_rows:
+        st.dataframe(pd.DataFrame(stat_rows), use_container_width=True, hide_index=True)
+    elif stats_on:
+        st.info("No data-layer calls recorded yet. Browse the app and come back.")
+    
+    cache = db.get_read_cache_stats()
+    st.caption(f"Read cache: {cache['hits']} hits / {cache['misses']} misses, {cache['size']} entries, write generation {cache['generation']}")
+    
+    slow = utils_dbstats.get_slow_queries()
+    if slow:
+        with st.expander(f"🐢 Slow Queries ({len(slow)})"):
+            for q in reversed(slow):
+                st.markdown(f"**{q['ms']} ms** · {q['time']}")
+                st.code(q['sql'], language="sql")
+                st.caption(f"Params: {', '.join(q['params'])}")
+                st.text("\n".join(q['plan']))
+    
+    st.divider()
+    st.subheader("Drive Sync Queue")
+    sync_queue = utils_syncqueue.get_sync_queue()
+    sq = sync_queue.status()
+    sq1, sq2 = st.columns([3, 1])
+    sq_next = f", next attempt in {sq['next_attempt_in']:.0f}s" if sq['next_attempt_in'] is not None else ""
+    sq1.caption(f"{'Running' if sq['running'] else 'Stopped'} · {sq['pending']} pending ({sq['failing']} retrying{sq_next}) · "
+                f"{sq['uploaded']} uploaded this session · {sq['dropped']} dropped")
+    if sq['last_error']:
+        sq1.caption(f"Last error: {sq['last_error']}")
+    if sq2.button("Retry Now", disabled=not sq['pending']):
+        sync_queue.retry_now()
+        st.rerun()
+    if sq['pending']:
+        st.dataframe(sync_queue.jobs(), hide_index=True)
+    
+    st.divider()
+    st.subheader("PDF Conversion Server")
+    st.radio("PDF Engine", PDF_ENGINES, horizontal=True, key="pdf_engine",
+             index=PDF_ENGINES.index(DEFAULT_PDF_ENGINE) if DEFAULT_PDF_ENGINE in PDF_ENGINES else 0,
+             help="Office: LibreOffice/Excel, native renderer as fallback. Native: built-in renderer only (fast, no office suite).")
+    office = utils_native.get_office_server().status()
+    os1, os2 = st.columns([3, 1])
+    if office['running']:
+        os1.caption(f"Running (pid {office['pid']}, port {office['port']}) · {office['conversions']} conversions · {office['restarts']} restarts")
+    else:
+        os1.caption(f"Not running. PDFs use a one-off LibreOffice process. {office['last_error'] or ''}")
+    if os2.button("Restart Server"):
+        utils_native.get_office_server().stop()
+        utils_native.start_office_server(force=True)
+        st.rerun()
+    
+    rc = utils_rendercache.get_stats()
+    rc1, rc2 = st.columns([3, 1])
+    rc1.caption(f"Render cache: {rc['hits']} hits / {rc['misses']} misses ({rc['hit_rate']:.0%}), "
+                f"{rc['entries']} files, {rc['bytes'] / 1048576:.1f} of {rc['max_bytes'] / 1048576:.0f} MB, {rc['evictions']} evicted")
+    if rc2.button("Clear Render Cache"):
+        utils_rendercache.clear()
+        st.rerun()
+    
+    st.divider()
+    st.subheader("Export Registers")
+    st.caption("Streams straight from the database; large multi-year registers are fine.")
+    ex1, ex2, ex3, ex4 = st.columns([2, 1, 1, 1])
+    ex_reg = ex1.selectbox("Register", list(utils_export.REGISTERS),
+                           format_func=lambda r: utils_export.REGISTERS[r]['label'], key="ex_reg")
+    ex_from = ex2.date_input("From", value=None, key="ex_from")
+    ex_to = ex3.date_input("To", value=None, key="ex_to")
+    ex_fmt = ex4.selectbox("Format", utils_export.FORMATS, key="ex_fmt")
+    ex_cols = st.multiselect("Columns", utils_export.register_columns(ex_reg),
+                             default=utils_export.register_columns(ex_reg), key=f"ex_cols_{ex_reg}")
+    if st.button("📤 Export Register", disabled=not ex_cols):
+        ex_name = utils_export.default_filename(ex_reg, ex_fmt, ex_from, ex_to)
+        try:
+            with st.spinner("Exporting..."):
+                result = utils_export.export_register(ex_reg, os.path.join("generated", "exports", ex_name), fmt=ex_fmt,
+                                                      columns=ex_cols, date_from=ex_from, date_to=ex_to)
+            st.session_state['last_export'] = (result['path'], ex_name)
+            st.success(f"Exported {result['rows']} rows in {result['seconds']:.2f}s")
+        except Exception as e:
+            st.error(f"Export Failed: {e}")
+    if st.session_state.get('last_export') and os.path.exists(st.session_state['last_export'][0]):
+        ex_path, ex_name = st.session_state['last_export']
+        with open(ex_path, "rb") as f:
+            st.download_button(f"⬇️ {ex_name}", f.read(), ex_name)
+    
+    st.divider()
+    st.subheader("Import Historic Challans")
+    st.caption("CSV or Excel with columns: Challan No, Date (DD/MM/YYYY or YYYY-MM-DD), Supplier, Material, Quantity")
+    imp_file = st.file_uploader("Challan File", type=['csv', 'xlsx'], key="imp_challans")
+    imp_create = st.checkbox("Create missing suppliers / materials", key="imp_create")
+    if imp_file and st.button("📥 Import Challans"):
+        bar = st.progress(0.0, text="Importing...")
+        def on_progress(done, total):
+            frac = min(done / total, 1.0) if total else 0.0
+            bar.progress(frac, text=f"Imported {done:,} rows")
+        try:
+            result = utils_import.import_challans(imp_file, create_missing=imp_create, progress=on_progress)
+            bar.progress(1.0, text="Done")
+            st.success(f"Imported {result['inserted']:,} rows in {result['seconds']:.1f}s")
+            if result['errors']:
+                st.warning(f"{len(result['errors'])} rows skipped")
+                st.dataframe(pd.DataFrame(result['errors'], columns=['Line', 'Reason']), hide_index=True)
+        except Exception as e:
+            st.error(f"Import failed: {e}")
+
 elif menu == "New Inward (Challan)":
     st.header("📝 Inward Entry (Challan)")
     
@@ -418,7 +679,8 @@ elif menu == "New Inward (Challan)":
     # Inward Entry Form (Multi-Item Support)
     with st.container():
         c1, c2, c3, c4 = st.columns(4)
-        c_no = c1.text_input("Challan No")
+        proposed_challan_no = db.peek_next_number(db.CHALLAN_SERIES)
+        c_no = c1.text_input("Challan No", value=proposed_challan_no)
         c_date = c2.date_input("Date", value=date.today())
         
         # Suppliers
@@ -458,12 +720,12 @@ elif menu == "New Inward (Challan)":
             st.dataframe(cart_df[['material', 'quantity']], hide_index=True)
             
             if st.button("💾 Save & Generate Challan"):
-                # Save all items to DB
-                success = True
-                for item in st.session_state.challan_cart:
-                    # We pass distinct material/qty for each row
-                    if not db.add_challan(c_no, str(c_date), s_id, item['material_id'], item['quantity']):
-                        success = False
+                reserved = c_no == proposed_challan_no
+                if reserved:
+                    c_no = db.reserve_next_number(db.CHALLAN_SERIES)
+                
+                # Save all items to DB (single transaction: all or nothing)
+                success = db.add_challans_bulk(c_no, str(c_date), s_id, st.session_state.challan_cart)
                 
                 if success:
                     st.success("All items saved successfully!")
@@ -494,38 +756,22 @@ elif menu == "New Inward (Challan)":
                     xls_path_temp = f"generated/{xls_filename}"
                     pdf_path_temp = f"generated/{pdf_filename}"
 
-                    # Excel Generation
-                    xls_gen.generate_challan_excel(challan_data, output_path=xls_path_temp)
+                    # Excel Generation (rendered in memory, persisted for PDF/Drive)
+                    xls_bytes = xls_gen.generate_challan_excel(challan_data, output_path=None)
+                    xls_gen.save_document(xls_bytes, xls_path_temp)
                     
                     with st.spinner("Generating PDF..."):
-                        # PDF Generation (OS Aware)
-                        # PDF Generation Cascade
-                        # 1. Try LibreOffice (Preferred)
-                        success, msg = utils_native.convert_with_libreoffice(xls_path_temp, pdf_path_temp)
-                        
-                        # 2. Try macOS AppleScript (if LibreOffice failed on Mac)
-                        if not success and platform.system() == "Darwin":
-                             # st.info("LibreOffice not found, trying Excel...")
-                             success, msg = utils_native.convert_excel_to_pdf(xls_path_temp, pdf_path_temp)
-
-                        # 3. Last Resort Fallback
+                        # PDF Generation Cascade (native renderer as fallback)
+                        success, msg = export_pdf(xls_path_temp, pdf_path_temp,
+                                                  fallback=lambda: utils_vectorpdf.generate_challan_pdf(challan_data))
                         if not success:
-                            st.warning(f"High-Fidelity PDF failed ({msg}). Using basic fallback.")
-                            try:
-                                pdf_bytes = utils_pdf.generate_challan_pdf(challan_data)
-                                with open(pdf_path_temp, "wb") as f:
-                                    f.write(pdf_bytes)
-                            except Exception as e:
-                                st.error(f"Fallback PDF Failed: {e}")
+                            st.error(msg)
                     
                     # Sync to Drive (New Folder Structure)
                     sync_to_drive(xls_path_temp, "Challan_Excel")
                     if os.path.exists(pdf_path_temp):
                         sync_to_drive(pdf_path_temp, "Challan_PDF")
                     sync_db()
-
-                    with open(xls_path_temp, "rb") as f:
-                        xls_bytes = f.read()
                     
                     pdf_bytes = None
                     if os.path.exists(pdf_path_temp):
@@ -543,6 +789,8 @@ elif menu == "New Inward (Challan)":
                     st.session_state.challan_cart = []
                     st.rerun()
                 else:
+                    if reserved:
+                        db.release_number(db.CHALLAN_SERIES, c_no)
                     st.error("Error saving some items to database.")
 
         # Persistent Success State - Outside the button logic, but inside the container
@@ -680,11 +928,10 @@ elif menu == "Dashboard":
             with st.form("gen_invoice"):
                 c1, c2, c3, c4 = st.columns(4)
                 
-                # Auto Increment Invoice No
-                last = db.get_last_invoice_no()
-                next_val = last + 1 if last >= 500 else 501
+                # Auto Increment Invoice No (reserved atomically on submit)
+                proposed_inv_no = db.peek_next_number(db.INVOICE_SERIES)
                 
-                inv_no = c1.text_input("Invoice No", value=str(next_val))
+                inv_no = c1.text_input("Invoice No", value=proposed_inv_no)
                 inv_date = c2.date_input("Invoice Date", value=date.today())
                 order_no = c3.text_input("Order No")
                 order_date = c4.date_input("Order Date", value=date.today())
@@ -714,6 +961,7 @@ elif menu == "Dashboard":
                         'cgst': cgst,
                         'sgst': sgst,
                         'total': row_tot,
+                        'challan_id': int(row['id']),
                         'challan_no': row['challan_no'],
                         'challan_date': row['date']
                     })
@@ -727,6 +975,11 @@ elif menu == "Dashboard":
                 submitted = st.form_submit_button("Generate Invoice")
                 
             if submitted:
+                # Claim the proposed number; if another session took it first we get the next free one
+                reserved = inv_no == proposed_inv_no
+                if reserved:
+                    inv_no = db.reserve_next_number(db.INVOICE_SERIES)
+                
                 # ... Generation Logic ...
                 combined_challan_nos = ", ".join([str(i['challan_no']) for i in items_list])
                 
@@ -759,47 +1012,27 @@ elif menu == "Dashboard":
                 xls_path_curr = f"generated/{xls_name}"
                 pdf_path_curr = f"generated/{pdf_name}"
 
-                # Excel Generation
-                xls_gen.generate_invoice_excel(inv_data, output_path=xls_path_curr)
+                # Excel Generation (rendered in memory, persisted for PDF/Drive)
+                xls_bytes = xls_gen.generate_invoice_excel(inv_data, output_path=None)
+                xls_gen.save_document(xls_bytes, xls_path_curr)
                 
                 # PDF Generation (OS Aware)
                 success_pdf = False
                 msg = "Unknown Error"
                 with st.spinner("Generating PDF... Please wait..."):
-                    # PDF Generation Cascade
-                    # 1. Try LibreOffice (Preferred)
-                    success_pdf, msg = utils_native.convert_with_libreoffice(xls_path_curr, pdf_path_curr)
-                    
-                    # 2. Try macOS AppleScript (if LibreOffice failed on Mac)
-                    if not success_pdf and platform.system() == "Darwin":
-                         # st.info("LibreOffice not found, trying Excel...")
-                         success_pdf, msg = utils_native.convert_excel_to_pdf(xls_path_curr, pdf_path_curr)
-                    
-                    # Universal Fallback
+                    # PDF Generation Cascade (native renderer as fallback)
+                    success_pdf, msg = export_pdf(xls_path_curr, pdf_path_curr,
+                                                  fallback=lambda: utils_vectorpdf.generate_invoice_pdf(inv_data))
                     if not success_pdf:
-                        st.warning(f"High-Quality PDF failed ({msg}). Using basic fallback.")
-                        try:
-                            pdf_bytes = utils_pdf.generate_invoice_pdf(inv_data)
-                            with open(pdf_path_curr, "wb") as f:
-                                f.write(pdf_bytes)
-                            success_pdf = True
-                        except Exception as e:
-                            st.error(f"Fallback PDF Failed: {e}")
-
-                # Update Master Ledger
-                xls_gen.update_master_ledger(inv_data)
-                
+                        st.error(msg)
+
                 # Sync Everything to Drive (New Folder Structure)
                 sync_to_drive(xls_path_curr, "Invoice_Excel")
                 if success_pdf and os.path.exists(pdf_path_curr):
                     sync_to_drive(pdf_path_curr, "Invoice_PDF")
                 
-                # Sync Master & DB
-                sync_to_drive("generated/Master_Sales.xlsx", "Master")
+                # Sync DB (the master sales ledger is appended inside save_invoice)
                 sync_db()
-
-                with open(xls_path_curr, "rb") as f:
-                    xls_bytes = f.read()
                 
                 # Save to DB (Mark Billed)
                 challan_ids = [int(row['id']) for idx, row in selected_rows.iterrows()]
@@ -809,8 +1042,10 @@ elif menu == "Dashboard":
                 # We'll store 0 or the first rate.
                 first_rate = items_list[0]['rate'] if items_list else 0
                 
-                if db.save_invoice(inv_no, str(inv_date), first_rate, grand_taxable, grand_cgst, grand_sgst, grand_total, challan_ids):
+                if db.save_invoice(inv_no, str(inv_date), first_rate, grand_taxable, grand_cgst, grand_sgst, grand_total, challan_ids,
+                                   items=items_list, order_no=order_no, order_date=str(order_date)):
                     st.success("Invoice Saved & Challans Marked as Billed!")
+                    sync_master_ledger()
                     
                     c_d1, c_d2, c_d3 = st.columns(3)
                     c_d1.download_button(f"⬇️ Excel", data=xls_bytes, file_name=xls_name, mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
@@ -828,6 +1063,8 @@ elif menu == "Dashboard":
                     # Use a small delay/hint? 
                     st.info("Download your file, then click Refresh to update the list.")
                 else:
+                    if reserved:
+                        db.release_number(db.INVOICE_SERIES, inv_no)
                     st.error("Error saving invoice to database.")
                     
         else:
@@ -836,7 +1073,18 @@ elif menu == "Dashboard":
 elif menu == "Invoice History":
     st.header("📜 Invoice History")
     
-    history_df = db.get_invoice_history()
+    # Filters (applied in SQL, one page at a time)
+    f1, f2, f3 = st.columns(3)
+    f_supp = f1.selectbox("Supplier", ["All"] + db.get_suppliers()['name'].tolist(), key="ih_supp")
+    f_from = f2.date_input("From", value=None, key="ih_from")
+    f_to = f3.date_input("To", value=None, key="ih_to")
+    
+    page_key = f"ih_page_{f_supp}_{f_from}_{f_to}"
+    history_df, next_cursor = db.get_invoices_page(
+        page_cursor(page_key), PAGE_SIZE,
+        supplier_name=None if f_supp == "All" else f_supp,
+        date_from=f_from, date_to=f_to
+    )
     
     if history_df.empty:
         st.info("No invoices generated yet.")
@@ -852,56 +1100,33 @@ elif menu == "Invoice History":
                 details_df = db.get_invoice_details(row['id'])
                 st.dataframe(details_df, hide_index=True)
                 
-                # Regenerate Button
-                # Need to reconstruct data for this... 
-                # Ideally we fetch saved Data or reconstruct from DB relationships.
-                # For V1, simplified: We acknowledge it exists. Full Regeneration requires storing Rate per item in DB which we currenly don't (only in ephemeral dashboard state). 
-                # We stored single 'rate' in invoice header. If multi-rates used, we lost them!
-                # CRITICAL: We need `invoice_items` table to truly support multi-rate history regeneration.
-                # Given user request "if i want i can regenerate... by editing", maybe they just want to 're-load' it?
-                # I'll stick to 'View Only' for now or 'Delete/Edit' logic is complex.
-                # I will add a placeholder "Regenerate" that warns about limitations or just hides it if risky.
-                # But user asked for it. 
-                # I'll put a button "Re-Calculate Excel" that *tries* to verify data.
-                
                 # Delete / Revert Button
                 st.write("---")
                 
                 # Check for existing file regeneration
                 h_c1, h_c2 = st.columns(2)
                 
-                # Re-Generate Button
-                if h_c1.button("🔄 Regenerate Files", key=f"regen_{row['id']}"):
-                    # Construct Data
-                    items_df = db.get_invoice_details(row['id'])
-                    # We need supplier details... fetch from DB
-                    supp_name = row['supplier_name']
-                    # We need address gst etc... expensive query but needed
-                    if not suppliers_df.empty:
-                         s_row = suppliers_df[suppliers_df['name'] == supp_name].iloc[0]
-                         s_addr = s_row['address']
-                         s_gst = s_row['gst_no']
-                    else:
-                         s_addr = ""
-                         s_gst = ""
-                    
-                    items_list_regen = []
-                    for _, i_row in items_df.iterrows():
-                         base = i_row['quantity'] * row['base_amount'] / row['total_amount'] * row['rate'] if row['rate'] else 0 # Approximation if rate lost
-                         # Actually we don't have per-item rate in history easily.
-                         # Simplified: Just dump what we have.
-                         items_list_regen.append({'material': i_row['material'], 'qty': i_row['quantity'], 'rate': 0, 'total': 0, 'cgst': 0, 'sgst': 0, 'base_amount': 0})
-
-                    # This is imperfect regeneration. To do it right we need 'invoice_items' table.
-                    st.warning("Regeneration is limited due to historical data format.")
-                
-                # Try to Find Files
+                # File naming matches the Dashboard output
                 safe_inv = row['invoice_no'].replace("/", "_")
                 safe_supp = row['supplier_name'].replace(" ", "_")
                 fname = f"{safe_inv}_{safe_supp}"
                 xls_p = f"generated/{fname}.xlsx"
                 pdf_p = f"generated/{fname}.pdf"
                 
+                # Re-Generate Button (exact rates/amounts come from invoice_items)
+                if h_c1.button("🔄 Regenerate Files", key=f"regen_{row['id']}"):
+                    inv_data = db.get_invoice_for_render(row['id'])
+                    if inv_data:
+                        with st.spinner("Regenerating..."):
+                            xls_gen.generate_invoice_excel(inv_data, output_path=xls_p)
+                            success, msg = export_pdf(xls_p, pdf_p, fallback=lambda: utils_vectorpdf.generate_invoice_pdf(inv_data))
+                        if success:
+                            st.rerun()
+                        st.warning(f"PDF failed ({msg}).")
+                    else:
+                        st.error("Invoice not found.")
+                
+                # Try to Find Files
                 if os.path.exists(xls_p):
                     with open(xls_p, "rb") as f:
                         h_c1.download_button("⬇️ Excel", f.read(), f"{fname}.xlsx", key=f"dl_h_x_{idx}")
@@ -913,10 +1138,8 @@ elif menu == "Invoice History":
                     # Excel exists, PDF missing -> Offer Generation
                     if h_c2.button("📄 Create PDF", key=f"btn_h_pdf_{idx}"):
                         with st.spinner("Converting to PDF..."):
-                            if platform.system() == "Darwin":
-                                success, _ = utils_native.convert_excel_to_pdf(xls_p, pdf_p)
-                            else:
-                                success, _ = utils_native.convert_with_libreoffice(xls_p, pdf_p)
+                            success, _ = export_pdf(xls_p, pdf_p, fallback=lambda: utils_vectorpdf.generate_invoice_pdf(
+                                db.get_invoice_for_render(row['id'])))
                             
                             if success:
                                 st.success("PDF Created!")
@@ -931,10 +1154,21 @@ elif menu == "Invoice History":
                         st.rerun()
                     else:
                         st.error("Error deleting invoice.")
+        
+        page_nav(page_key, next_cursor)
 
 elif menu == "Suppliers":
     st.header("🏢 Supplier Dashboard")
     
+    # All Suppliers Outstanding (served from supplier_ledger)
+    with st.expander("📊 All Suppliers Outstanding", expanded=False):
+        sort_labels = {"Balance": "balance", "Billed": "billed", "Paid": "paid", "Invoices": "invoice_count", "Last Activity": "last_activity", "Name": "name"}
+        so1, so2 = st.columns([3, 1])
+        sort_label = so1.selectbox("Sort by", list(sort_labels.keys()), key="ledger_sort")
+        sort_desc = so2.toggle("Descending", value=True, key="ledger_desc")
+        ledger_df = db.get_supplier_ledger(sort_labels[sort_label], sort_desc)
+        st.dataframe(ledger_df.drop(columns=['id']), use_container_width=True, hide_index=True)
+    
     suppliers = db.get_suppliers()
     if suppliers.empty:
         st.warning("No suppliers found.")
@@ -983,10 +1217,6 @@ elif menu == "Suppliers":
                     c2.write(row['date'])
                     c3.write(f"₹{row['total_amount']:,.2f}")
                     
-                    # Generate Invoice Excel
-                    # 1. Fetch Items
-                    items_df = db.get_invoice_details(row['id'])
-                    items_list = []
                     # On-Demand Generation Logic
                     gen_key = f"sup_inv_gen_{row['id']}"
                     
@@ -1007,58 +1237,17 @@ elif menu == "Suppliers":
                             )
                     else:
                         if c4.button("Prepare Docs", key=f"btn_sup_inv_{idx}"):
-                             # Generate Logic
-                            items_df = db.get_invoice_details(row['id'])
-                            items_list = []
-                            for i_idx, i_row in items_df.iterrows():
-                                qty = i_row['quantity']
-                                rate = row['rate']
-                                base = qty * rate 
-                                cgst = base * 0.025
-                                sgst = base * 0.025
-                                total = base + cgst + sgst
-                                items_list.append({
-                                    'material': i_row['material'],
-                                    'qty': qty,
-                                    'rate': rate,
-                                    'base_amount': base,
-                                    'cgst': cgst,
-                                    'sgst': sgst,
-                                    'total': total
-                                })
-                                
-                            inv_data = {
-                                'invoice_no': row['invoice_no'],
-                                'date': row['date'],
-                                'supplier_name': selected_s,
-                                'supplier_address': s_details['address'],
-                                'supplier_gst': s_details['gst_no'],
-                                'items': items_list,
-                                'challan_no': ", ".join(items_df['challan_no'].astype(str).tolist()),
-                                'challan_date': items_df.iloc[0]['date'] if not items_df.empty else "",
-                                'order_no': "", 
-                                'order_date': "", 
-                                'base_amount': row['base_amount'],
-                                'cgst': row['cgst_amount'],
-                                'sgst': row['sgst_amount'],
-                                'total': row['total_amount']
-                            }
+                            # Generate Logic (stored line items, no recomputation)
+                            inv_data = db.get_invoice_for_render(row['id'])
                             
                             try:
                                 with st.spinner("Generating Docs..."):
-                                    xlsx_path = xls_gen.generate_invoice_excel(inv_data, output_path=f"generated/temp_inv_{row['invoice_no']}.xlsx")
-                                    with open(xlsx_path, "rb") as f: inv_bytes = f.read()
-                                    
-                                    # PDF Generation
-                                    pdf_path = xlsx_path.replace(".xlsx", ".pdf")
-                                    pdf_bytes = None
-                                    if platform.system() == "Darwin":
-                                        success, _ = utils_native.convert_excel_to_pdf(xlsx_path, pdf_path)
-                                    else:
-                                        success, _ = utils_native.convert_with_libreoffice(xlsx_path, pdf_path)
-                                        
-                                    if success and os.path.exists(pdf_path):
-                                        with open(pdf_path, "rb") as f: pdf_bytes = f.read()
+                                    # Unchanged invoices come straight from the render cache
+                                    inv_bytes = utils_rendercache.get_or_render(
+                                        'invoice', inv_data, 'xlsx',
+                                        lambda: xls_gen.generate_invoice_excel(inv_data, output_path=None))
+                                    pdf_bytes = cached_pdf('invoice', inv_data, inv_bytes,
+                                                           lambda: utils_vectorpdf.generate_invoice_pdf(inv_data))
                                     
                                     st.session_state[gen_key] = {'xls': inv_bytes, 'pdf': pdf_bytes}
                                     st.rerun()
@@ -1118,19 +1307,11 @@ elif menu == "Suppliers":
                             
                             try:
                                 with st.spinner("Generating..."):
-                                    xlsx_path = xls_gen.generate_challan_excel(chal_data, output_path=f"generated/temp_ch_{row['challan_no']}.xlsx")
-                                    with open(xlsx_path, "rb") as f: ch_bytes = f.read()
-                                    
-                                    # PDF Generation
-                                    pdf_path = xlsx_path.replace(".xlsx", ".pdf")
-                                    pdf_bytes = None
-                                    if platform.system() == "Darwin":
-                                        success, _ = utils_native.convert_excel_to_pdf(xlsx_path, pdf_path)
-                                    else:
-                                        success, _ = utils_native.convert_with_libreoffice(xlsx_path, pdf_path)
-                                        
-                                    if success and os.path.exists(pdf_path):
-                                        with open(pdf_path, "rb") as f: pdf_bytes = f.read()
+                                    ch_bytes = utils_rendercache.get_or_render(
+                                        'challan', chal_data, 'xlsx',
+                                        lambda: xls_gen.generate_challan_excel(chal_data, output_path=None))
+                                    pdf_bytes = cached_pdf('challan', chal_data, ch_bytes,
+                                                           lambda: utils_vectorpdf.generate_challan_pdf(chal_data))
                                     
                                     st.session_state[gen_key] = {'xls': ch_bytes, 'pdf': pdf_bytes}
                                     st.rerun()
@@ -1189,10 +1370,32 @@ elif menu == "Suppliers":
 elif menu == "Master History":
     st.header("🗄 Master History (Audit Log)")
     
+    # Master_Sales.xlsx is written from the append-only sales ledger: in the
+    # background after every saved invoice (with its Drive upload), or here on demand
+    ml1, ml2, ml3 = st.columns([2, 1, 1])
+    ml1.caption(f"Master sales ledger: {db.get_sales_ledger_size()} invoices · "
+                "Master_Sales.xlsx is rebuilt and synced in the background after each invoice")
+    if ml2.button("📒 Build Master Ledger"):
+        with st.spinner("Writing Master_Sales.xlsx..."):
+            build_master_ledger()
+    if os.path.exists(MASTER_LEDGER_FILE):
+        with open(MASTER_LEDGER_FILE, "rb") as f:
+            ml3.download_button("⬇️ Master_Sales.xlsx", f.read(), "Master_Sales.xlsx",
+                                mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    
     t1, t2 = st.tabs(["ALL Invoices", "ALL Challans"])
     
     with t1:
-        inv_df = db.get_master_history()
+        m1, m2 = st.columns(2)
+        mh_supp = m1.selectbox("Supplier", ["All"] + db.get_suppliers()['name'].tolist(), key="mh_supp")
+        mh_status = m2.selectbox("Status", ["All", "Active", "Deleted"], key="mh_status")
+        
+        page_key = f"mh_page_{mh_supp}_{mh_status}"
+        inv_df, next_cursor = db.get_invoices_page(
+            page_cursor(page_key), PAGE_SIZE,
+            supplier_name=None if mh_supp == "All" else mh_supp,
+            deleted={"All": None, "Active": False, "Deleted": True}[mh_status]
+        )
         if inv_df.empty:
             st.info("No invoices.")
         else:
@@ -1236,10 +1439,25 @@ elif menu == "Master History":
                         # Master History V1 didn't have Excel download yet (it was just a list). 
                         # I'll focus on Suppliers & History tabs first.
             
+            page_nav(page_key, next_cursor)
+            
     with t2:
-        ch_df = db.get_master_challans()
+        mc1, mc2, mc3, mc4 = st.columns(4)
+        mc_supp = mc1.selectbox("Supplier", ["All"] + db.get_suppliers()['name'].tolist(), key="mc_supp")
+        mc_status = mc2.selectbox("Status", ["All", "Pending", "Billed"], key="mc_status")
+        mc_from = mc3.date_input("From", value=None, key="mc_from")
+        mc_to = mc4.date_input("To", value=None, key="mc_to")
+        
+        page_key = f"mc_page_{mc_supp}_{mc_status}_{mc_from}_{mc_to}"
+        ch_df, next_cursor = db.get_challans_page(
+            page_cursor(page_key), PAGE_SIZE,
+            supplier_name=None if mc_supp == "All" else mc_supp,
+            status=None if mc_status == "All" else mc_status,
+            date_from=mc_from, date_to=mc_to
+        )
         if ch_df.empty:
             st.info("No challans.")
         else:
-            st.dataframe(ch_df, use_container_width=True, hide_index=True)
+            st.dataframe(ch_df.drop(columns=['id', 'invoice_id']), use_container_width=True, hide_index=True)
+            page_nav(page_key, next_cursor)
 
@@ -1,13 +1,200 @@
+import os
 import sqlite3
+import threading
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
 import pandas as pd
 from datetime import datetime
+import utils_dbstats as stats
 
 DB_FILE = "autobiller.db"
 
-def init_db():
-    """Initialize the database with necessary tables."""
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
+# --- Connection Manager ---
+# Streamlit runs every rerun on a fresh ScriptRunner thread, so a plain
+# thread-local connection would be reopened (and re-tuned) on each rerun.
+# Instead each thread leases a connection from a small pool; when the thread
+# ends its lease is collected and the connection goes back to the pool for
+# the next rerun. WAL lets readers proceed while a writer is committing.
+BUSY_TIMEOUT_SEC = 10
+POOL_SIZE = 4
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-20000",     # ~20 MB page cache
+    "PRAGMA mmap_size=268435456",   # 256 MB memory-mapped I/O
+    "PRAGMA temp_store=MEMORY",
+)
+
+_local = threading.local()
+_pool_lock = threading.Lock()
+_idle = []  # [(key, conn)] ready for reuse by any thread
+
+def _open_connection():
+    """Open and configure a new connection to DB_FILE."""
+    # TimedConnection only adds work while instrumentation is enabled.
+    # check_same_thread=False: a pooled connection moves between threads
+    # (one at a time) as reruns come and go.
+    conn = sqlite3.connect(DB_FILE, timeout=BUSY_TIMEOUT_SEC, factory=stats.TimedConnection,
+                           check_same_thread=False)
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+def _release(key, conn):
+    """Return a finished thread's connection to the pool (or close it)."""
+    if key[1] != os.getpid():
+        return  # inherited across fork: never touch the parent's connection
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+        with _pool_lock:
+            if key[0] == DB_FILE and len(_idle) < POOL_SIZE:
+                _idle.append((key, conn))
+                return
+        conn.close()
+    except sqlite3.Error:
+        pass
+
+class _Lease:
+    """A thread's claim on a pooled connection; released when the thread's locals are dropped."""
+
+    def __init__(self, key, conn):
+        self.key = key
+        self.conn = conn
+        self.finalizer = weakref.finalize(self, _release, key, conn)
+
+def _acquire(key):
+    with _pool_lock:
+        while _idle:
+            idle_key, conn = _idle.pop()
+            if idle_key == key:
+                return conn
+            if idle_key[1] == os.getpid():
+                conn.close()  # DB_FILE changed; a forked child just drops the parent's
+    return _open_connection()
+
+def get_connection():
+    """
+    Return this thread's connection, leasing one from the pool on first use.
+    Re-leases if DB_FILE changed or we are in a forked child process.
+    """
+    lease = getattr(_local, "lease", None)
+    key = (DB_FILE, os.getpid())
+    if lease is None or lease.key != key:
+        if lease is not None:
+            lease.finalizer()
+        _local.lease = _Lease(key, _acquire(key))
+        _local.depth = 0
+    return _local.lease.conn
+
+def close_connection():
+    """Close this thread's connection (if any) instead of returning it to the pool."""
+    lease = getattr(_local, "lease", None)
+    if lease is not None:
+        lease.finalizer.detach()
+        lease.conn.close()
+    _local.lease = None
+    _local.depth = 0
+
+def close_pool():
+    """Close every idle pooled connection (e.g. before replacing DB_FILE)."""
+    with _pool_lock:
+        idle = list(_idle)
+        _idle.clear()
+    for _, conn in idle:
+        conn.close()
+
+@contextmanager
+def db_session():
+    """
+    Yield the pooled connection. The outermost session commits on success
+    and rolls back on error; nested sessions join the enclosing transaction.
+    Any session that changed rows bumps the write generation (read cache).
+    """
+    conn = get_connection()
+    _local.depth += 1
+    changes_before = conn.total_changes
+    try:
+        yield conn
+        if _local.depth == 1:
+            conn.commit()
+    except:
+        if _local.depth == 1:
+            conn.rollback()
+        raise
+    finally:
+        _local.depth -= 1
+        if conn.total_changes != changes_before:
+            bump_write_generation()
+
+# --- Read Cache ---
+# Reference reads (suppliers, materials, ...) are re-run on nearly every
+# Streamlit rerun. Results are cached per (query, params) and tagged with the
+# write generation they were read at; any write in this process bumps the
+# generation, so a stale entry is never served. Writes made by other processes
+# (e.g. the utils_import CLI) are not seen until clear_read_cache().
+READ_CACHE_SIZE = 64
+
+_cache_lock = threading.Lock()
+_read_cache = OrderedDict()
+_write_generation = 0
+_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+def bump_write_generation():
+    global _write_generation
+    with _cache_lock:
+        _write_generation += 1
+
+def get_write_generation():
+    return _write_generation
+
+def clear_read_cache():
+    with _cache_lock:
+        _read_cache.clear()
+
+def get_read_cache_stats():
+    with _cache_lock:
+        return dict(_cache_stats, size=len(_read_cache), generation=_write_generation)
+
+def cached_read(query, params=()):
+    """pd.read_sql through the LRU cache. Returns a copy callers may mutate."""
+    key = (query, tuple(params))
+    with _cache_lock:
+        entry = _read_cache.get(key)
+        if entry is not None and entry[0] == _write_generation:
+            _read_cache.move_to_end(key)
+            _cache_stats['hits'] += 1
+            return entry[1].copy()
+        _cache_stats['misses'] += 1
+        generation = _write_generation
+
+    with db_session() as conn:
+        df = pd.read_sql(query, conn, params=params)
+
+    with _cache_lock:
+        # Only store if no write happened while we were reading
+        if generation == _write_generation:
+            _read_cache[key] = (generation, df)
+            _read_cache.move_to_end(key)
+            while len(_read_cache) > READ_CACHE_SIZE:
+                _read_cache.popitem(last=False)
+                _cache_stats['evictions'] += 1
+    return df.copy()
+
+# --- Schema Migrations ---
+# The schema version lives in PRAGMA user_version. Each step upgrades the
+# schema by exactly one version; append new steps, never edit shipped ones.
+
+def _column_exists(c, table, column):
+    return any(row[1] == column for row in c.execute(f"PRAGMA table_info({table})"))
+
+def _add_column(c, table, column, decl):
+    if not _column_exists(c, table, column):
+        c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+def _migrate_001_baseline(c):
+    """Core tables plus the soft-delete / snapshot columns added ad hoc earlier."""
 
     # Suppliers Table
     c.execute('''CREATE TABLE IF NOT EXISTS suppliers (
@@ -65,82 +252,331 @@ def init_db():
                     FOREIGN KEY (supplier_id) REFERENCES suppliers (id)
                 )''')
 
-    conn.commit()
-    
-    # Schema Migration for Soft Delete
-    try:
-        c.execute("ALTER TABLE invoices ADD COLUMN is_deleted INTEGER DEFAULT 0")
-        conn.commit()
-    except:
-        pass # Column likely exists
-        
+    # Soft Delete & Restore Snapshot
+    _add_column(c, "invoices", "is_deleted", "INTEGER DEFAULT 0")
+    _add_column(c, "invoices", "challan_ids_snapshot", "TEXT")
+
+def _migrate_002_indexes(c):
+    """Indexes for the pending filter, invoice->challan and supplier joins."""
+    # Dashboard pending list (status filter, grouped by supplier)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_challans_status ON challans (status, supplier_id)")
+    # Invoice history: challan count + supplier lookup per invoice (covering)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_challans_invoice ON challans (invoice_id, supplier_id)")
+    # Supplier docs / stats joins
+    c.execute("CREATE INDEX IF NOT EXISTS idx_challans_supplier ON challans (supplier_id, date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_invoices_deleted ON invoices (is_deleted, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_payments_supplier ON payments (supplier_id, date, amount)")
+
+def _migrate_003_invoice_items(c):
+    """Per-line invoice items so history can be re-rendered exactly."""
+    c.execute('''CREATE TABLE IF NOT EXISTS invoice_items (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    invoice_id INTEGER NOT NULL,
+                    line_no INTEGER NOT NULL,
+                    challan_id INTEGER,
+                    challan_no TEXT,
+                    challan_date TEXT,
+                    material TEXT,
+                    qty REAL NOT NULL,
+                    rate REAL NOT NULL,
+                    base_amount REAL NOT NULL,
+                    cgst REAL NOT NULL,
+                    sgst REAL NOT NULL,
+                    total REAL NOT NULL,
+                    FOREIGN KEY (invoice_id) REFERENCES invoices (id),
+                    FOREIGN KEY (challan_id) REFERENCES challans (id)
+                )''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_invoice_items_invoice ON invoice_items (invoice_id, line_no)")
+
+    # Header fields that were only ever printed, never stored
+    _add_column(c, "invoices", "order_no", "TEXT")
+    _add_column(c, "invoices", "order_date", "TEXT")
+
+def _migrate_004_supplier_ledger(c):
+    """
+    Trigger-maintained per-supplier totals (billed, paid, balance).
+    Needs the invoice's supplier on the invoice row itself, so add and
+    backfill invoices.supplier_id first.
+    """
+    _add_column(c, "invoices", "supplier_id", "INTEGER REFERENCES suppliers (id)")
+
+    # Backfill: active invoices via linked challans, deleted ones via snapshot
+    c.execute("""UPDATE invoices SET supplier_id = (
+                    SELECT ch.supplier_id FROM challans ch WHERE ch.invoice_id = invoices.id LIMIT 1)
+                 WHERE supplier_id IS NULL""")
+    orphans = c.execute("SELECT id, challan_ids_snapshot FROM invoices WHERE supplier_id IS NULL").fetchall()
+    for inv_id, snapshot in orphans:
+        first_id = (snapshot or "").split(",")[0].strip()
+        if first_id.isdigit():
+            c.execute("UPDATE invoices SET supplier_id = (SELECT supplier_id FROM challans WHERE id = ?) WHERE id = ?",
+                      (int(first_id), inv_id))
+    c.execute("CREATE INDEX IF NOT EXISTS idx_invoices_supplier ON invoices (supplier_id, is_deleted)")
+
+    c.execute('''CREATE TABLE IF NOT EXISTS supplier_ledger (
+                    supplier_id INTEGER PRIMARY KEY,
+                    billed REAL NOT NULL DEFAULT 0,
+                    paid REAL NOT NULL DEFAULT 0,
+                    balance REAL NOT NULL DEFAULT 0,
+                    invoice_count INTEGER NOT NULL DEFAULT 0,
+                    last_activity TEXT,
+                    FOREIGN KEY (supplier_id) REFERENCES suppliers (id)
+                )''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_supplier_ledger_balance ON supplier_ledger (balance)")
+
+    # Initial fill from existing history
+    c.execute("DELETE FROM supplier_ledger")
+    c.execute("""INSERT INTO supplier_ledger (supplier_id, billed, paid, balance, invoice_count, last_activity)
+                 SELECT s.id, COALESCE(b.billed, 0), COALESCE(p.paid, 0),
+                        COALESCE(b.billed, 0) - COALESCE(p.paid, 0), COALESCE(b.cnt, 0),
+                        NULLIF(max(COALESCE(b.last_date, ''), COALESCE(p.last_date, '')), '')
+                 FROM suppliers s
+                 LEFT JOIN (SELECT supplier_id, SUM(total_amount) as billed, count(*) as cnt, MAX(date) as last_date
+                            FROM invoices WHERE COALESCE(is_deleted, 0) = 0 GROUP BY supplier_id) b ON b.supplier_id = s.id
+                 LEFT JOIN (SELECT supplier_id, SUM(amount) as paid, MAX(date) as last_date
+                            FROM payments GROUP BY supplier_id) p ON p.supplier_id = s.id""")
+
+    # Triggers keep it current from here on
+    for ddl in _SUPPLIER_LEDGER_TRIGGERS:
+        c.execute(ddl)
+
+_SUPPLIER_LEDGER_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS trg_ledger_supplier_insert AFTER INSERT ON suppliers
+       BEGIN
+           INSERT OR IGNORE INTO supplier_ledger (supplier_id) VALUES (NEW.id);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_ledger_invoice_insert AFTER INSERT ON invoices
+       WHEN NEW.supplier_id IS NOT NULL AND COALESCE(NEW.is_deleted, 0) = 0
+       BEGIN
+           INSERT OR IGNORE INTO supplier_ledger (supplier_id) VALUES (NEW.supplier_id);
+           UPDATE supplier_ledger
+              SET billed = billed + NEW.total_amount,
+                  balance = balance + NEW.total_amount,
+                  invoice_count = invoice_count + 1,
+                  last_activity = max(COALESCE(last_activity, ''), NEW.date)
+            WHERE supplier_id = NEW.supplier_id;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_ledger_invoice_delete AFTER UPDATE OF is_deleted ON invoices
+       WHEN NEW.supplier_id IS NOT NULL AND COALESCE(OLD.is_deleted, 0) = 0 AND NEW.is_deleted = 1
+       BEGIN
+           UPDATE supplier_ledger
+              SET billed = billed - NEW.total_amount,
+                  balance = balance - NEW.total_amount,
+                  invoice_count = invoice_count - 1
+            WHERE supplier_id = NEW.supplier_id;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_ledger_invoice_restore AFTER UPDATE OF is_deleted ON invoices
+       WHEN NEW.supplier_id IS NOT NULL AND OLD.is_deleted = 1 AND COALESCE(NEW.is_deleted, 0) = 0
+       BEGIN
+           INSERT OR IGNORE INTO supplier_ledger (supplier_id) VALUES (NEW.supplier_id);
+           UPDATE supplier_ledger
+              SET billed = billed + NEW.total_amount,
+                  balance = balance + NEW.total_amount,
+                  invoice_count = invoice_count + 1,
+                  last_activity = max(COALESCE(last_activity, ''), NEW.date)
+            WHERE supplier_id = NEW.supplier_id;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_ledger_payment_insert AFTER INSERT ON payments
+       BEGIN
+           INSERT OR IGNORE INTO supplier_ledger (supplier_id) VALUES (NEW.supplier_id);
+           UPDATE supplier_ledger
+              SET paid = paid + NEW.amount,
+                  balance = balance - NEW.amount,
+                  last_activity = max(COALESCE(last_activity, ''), NEW.date)
+            WHERE supplier_id = NEW.supplier_id;
+       END""",
+]
+
+# Invoice numbering historically started at 501
+INVOICE_SERIES = "invoice"
+CHALLAN_SERIES = "challan"
+INVOICE_START_NO = 501
+
+def _migrate_005_sequences(c):
+    """Named number series (invoice, challan, per-financial-year...)."""
+    c.execute('''CREATE TABLE IF NOT EXISTS sequences (
+                    name TEXT PRIMARY KEY,
+                    prefix TEXT NOT NULL DEFAULT '',
+                    next_value INTEGER NOT NULL
+                )''')
+
+    # Seed from the highest purely numeric number already used (deleted
+    # invoices included: invoice_no is UNIQUE across all rows).
+    numeric = "{col} <> '' AND {col} NOT GLOB '*[^0-9]*'"
+    max_inv = c.execute(f"SELECT MAX(CAST(invoice_no AS INTEGER)) FROM invoices WHERE {numeric.format(col='invoice_no')}").fetchone()[0]
+    max_ch = c.execute(f"SELECT MAX(CAST(challan_no AS INTEGER)) FROM challans WHERE {numeric.format(col='challan_no')}").fetchone()[0]
+    c.execute("INSERT OR IGNORE INTO sequences (name, next_value) VALUES (?, ?)",
+              (INVOICE_SERIES, max(INVOICE_START_NO, (max_inv or 0) + 1)))
+    c.execute("INSERT OR IGNORE INTO sequences (name, next_value) VALUES (?, ?)",
+              (CHALLAN_SERIES, (max_ch or 0) + 1))
+
+def _migrate_006_invoice_challan_count(c):
+    """Denormalized challan count so history lists need no correlated subqueries."""
+    _add_column(c, "invoices", "challan_count", "INTEGER NOT NULL DEFAULT 0")
+    # The restore snapshot lists every challan ever linked (also for deleted invoices)
+    c.execute("""UPDATE invoices
+                 SET challan_count = length(challan_ids_snapshot) - length(replace(challan_ids_snapshot, ',', '')) + 1
+                 WHERE COALESCE(challan_ids_snapshot, '') <> ''""")
+    c.execute("""UPDATE invoices
+                 SET challan_count = (SELECT count(*) FROM challans ch WHERE ch.invoice_id = invoices.id)
+                 WHERE COALESCE(challan_ids_snapshot, '') = ''""")
+
+def _migrate_007_sort_indexes(c):
+    """(sort key, id) indexes backing the keyset-paginated history queries."""
+    c.execute("CREATE INDEX IF NOT EXISTS idx_invoices_date ON invoices (date, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_challans_date ON challans (date, id)")
+
+def _migrate_008_sales_ledger(c):
+    """
+    Append-only master sales ledger (one row per saved invoice), written by
+    a trigger in the same transaction as the invoice. Deleting or restoring
+    an invoice does not touch it, like the old Master_Sales.xlsx.
+    """
+    c.execute('''CREATE TABLE IF NOT EXISTS sales_ledger (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    invoice_id INTEGER,
+                    invoice_no TEXT,
+                    date TEXT,
+                    supplier_name TEXT,
+                    taxable REAL,
+                    cgst REAL,
+                    sgst REAL,
+                    total REAL,
+                    FOREIGN KEY (invoice_id) REFERENCES invoices (id)
+                )''')
+    # Seed with every invoice ever saved, in save order
+    c.execute("""INSERT INTO sales_ledger (invoice_id, invoice_no, date, supplier_name, taxable, cgst, sgst, total)
+                 SELECT i.id, i.invoice_no, i.date, s.name, i.base_amount, i.cgst_amount, i.sgst_amount, i.total_amount
+                 FROM invoices i LEFT JOIN suppliers s ON s.id = i.supplier_id
+                 WHERE NOT EXISTS (SELECT 1 FROM sales_ledger)
+                 ORDER BY i.id""")
+    c.execute(_SALES_LEDGER_TRIGGER)
+
+_SALES_LEDGER_TRIGGER = """CREATE TRIGGER IF NOT EXISTS trg_sales_ledger_invoice_insert AFTER INSERT ON invoices
+       BEGIN
+           INSERT INTO sales_ledger (invoice_id, invoice_no, date, supplier_name, taxable, cgst, sgst, total)
+           VALUES (NEW.id, NEW.invoice_no, NEW.date, (SELECT name FROM suppliers WHERE id = NEW.supplier_id),
+                   NEW.base_amount, NEW.cgst_amount, NEW.sgst_amount, NEW.total_amount);
+       END"""
+
+MIGRATIONS = [
+    _migrate_001_baseline,
+    _migrate_002_indexes,
+    _migrate_003_invoice_items,
+    _migrate_004_supplier_ledger,
+    _migrate_005_sequences,
+    _migrate_006_invoice_challan_count,
+    _migrate_007_sort_indexes,
+    _migrate_008_sales_ledger,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn):
+    """
+    Bring the schema up to SCHEMA_VERSION. No-op when already current.
+    Pending steps run in one IMMEDIATE transaction so concurrent app
+    processes cannot both apply them.
+    """
+    if get_schema_version(conn) >= SCHEMA_VERSION:
+        return False
+
+    conn.execute("BEGIN IMMEDIATE")
     try:
-        c.execute("ALTER TABLE invoices ADD COLUMN challan_ids_snapshot TEXT")
+        version = get_schema_version(conn) # Re-check under the write lock
+        c = conn.cursor()
+        for step in MIGRATIONS[version:]:
+            step(c)
+            version += 1
+            c.execute(f"PRAGMA user_version = {version}")
         conn.commit()
     except:
-        pass # Column likely exists
-    
-    conn.close()
+        conn.rollback()
+        raise
+    return True
 
-def get_connection():
-    return sqlite3.connect(DB_FILE)
+@stats.timed
+def init_db():
+    """Initialize the database / apply pending schema migrations."""
+    with db_session() as conn:
+        migrate(conn)
 
 # --- CRUD Operations ---
 
+@stats.timed
 def add_supplier(name, address, gst_no, phone):
     try:
-        conn = get_connection()
-        c = conn.cursor()
-        c.execute("INSERT INTO suppliers (name, address, gst_no, phone) VALUES (?, ?, ?, ?)", 
-                  (name, address, gst_no, phone))
-        conn.commit()
+        with db_session() as conn:
+            conn.execute("INSERT INTO suppliers (name, address, gst_no, phone) VALUES (?, ?, ?, ?)", 
+                         (name, address, gst_no, phone))
         return True
     except Exception as e:
         print(e)
         return False
-    finally:
-        conn.close()
 
+@stats.timed
 def get_suppliers():
-    conn = get_connection()
-    df = pd.read_sql("SELECT * FROM suppliers", conn)
-    conn.close()
-    return df
+    return cached_read("SELECT * FROM suppliers")
 
+@stats.timed
 def add_material(name, unit):
     try:
-        conn = get_connection()
-        c = conn.cursor()
-        c.execute("INSERT INTO materials (name, unit) VALUES (?, ?)", (name, unit))
-        conn.commit()
+        with db_session() as conn:
+            conn.execute("INSERT INTO materials (name, unit) VALUES (?, ?)", (name, unit))
         return True
     except:
         return False
-    finally:
-        conn.close()
 
+@stats.timed
 def get_materials():
-    conn = get_connection()
-    df = pd.read_sql("SELECT * FROM materials", conn)
-    conn.close()
-    return df
+    return cached_read("SELECT * FROM materials")
+
+CHALLAN_INSERT = "INSERT INTO challans (challan_no, date, supplier_id, material_id, quantity) VALUES (?, ?, ?, ?, ?)"
 
+@stats.timed
 def add_challan(challan_no, date, supplier_id, material_id, quantity):
     try:
-        conn = get_connection()
-        c = conn.cursor()
-        c.execute("INSERT INTO challans (challan_no, date, supplier_id, material_id, quantity) VALUES (?, ?, ?, ?, ?)",
-                  (challan_no, date, supplier_id, material_id, quantity))
-        conn.commit()
+        with db_session() as conn:
+            conn.execute(CHALLAN_INSERT, (challan_no, date, supplier_id, material_id, quantity))
+            _advance_sequence(conn, CHALLAN_SERIES, challan_no)
         return True
     except Exception as e:
         print(e)
         return False
-    finally:
-        conn.close()
 
+@stats.timed
+def add_challans_bulk(challan_no, date, supplier_id, items):
+    """
+    Save every item of one challan in a single transaction (all or nothing).
+    items: list of dicts with 'material_id' and 'quantity' (the challan cart).
+    """
+    try:
+        with db_session() as conn:
+            conn.executemany(CHALLAN_INSERT,
+                             [(challan_no, date, supplier_id, it['material_id'], it['quantity']) for it in items])
+            _advance_sequence(conn, CHALLAN_SERIES, challan_no)
+        return True
+    except Exception as e:
+        print(f"Error saving challan items: {e}")
+        return False
+
+@stats.timed
+def insert_challan_rows(rows):
+    """
+    Bulk insert raw (challan_no, date, supplier_id, material_id, quantity)
+    tuples in one transaction. Raises on error; returns the row count.
+    """
+    rows = list(rows)
+    with db_session() as conn:
+        conn.executemany(CHALLAN_INSERT, rows)
+        numeric = [int(r[0]) for r in rows if str(r[0]).isdigit()]
+        if numeric:
+            _advance_sequence(conn, CHALLAN_SERIES, max(numeric))
+    return len(rows)
+
+@stats.timed
 def get_pending_challans():
-    conn = get_connection()
     query = """
     SELECT c.id, c.challan_no, c.date, s.name as supplier, m.name as material, c.quantity 
     FROM challans c
@@ -148,124 +584,199 @@ def get_pending_challans():
     JOIN materials m ON c.material_id = m.id
     WHERE c.status = 'Pending'
     """
-    df = pd.read_sql(query, conn)
-    conn.close()
-    return df
+    return cached_read(query)
 
+@stats.timed
 def update_challan_quantity(challan_id, new_quantity):
     """Update quantity of a specific challan (used for dashboard edits)."""
     try:
-        conn = get_connection()
-        c = conn.cursor()
-        c.execute("UPDATE challans SET quantity = ? WHERE id = ?", (new_quantity, challan_id))
-        conn.commit()
+        with db_session() as conn:
+            conn.execute("UPDATE challans SET quantity = ? WHERE id = ?", (new_quantity, challan_id))
         return True
     except Exception as e:
         print(f"Error updating quantity: {e}")
         return False
-    finally:
-        conn.close()
 
-def save_invoice(invoice_no, date, rate, base, cgst, sgst, total, challan_ids):
-    """Save invoice header and link challans."""
+@stats.timed
+def save_invoice(invoice_no, date, rate, base, cgst, sgst, total, challan_ids, items=None, order_no=None, order_date=None):
+    """
+    Save invoice header, its line items and link challans (one transaction).
+    items: list of dicts as built on the Dashboard (material, qty, rate,
+    base_amount, cgst, sgst, total, challan_id, challan_no, challan_date).
+    """
     try:
-        conn = get_connection()
-        c = conn.cursor()
-        
-        # Store snapshot of IDs for restoration possibility
-        ids_str = ",".join(map(str, challan_ids))
-        
-        # 1. Insert Invoice
-        c.execute("""INSERT INTO invoices 
-                    (invoice_no, date, challan_id, rate, base_amount, cgst_amount, sgst_amount, total_amount, challan_ids_snapshot) 
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""", 
-                    (invoice_no, date, 0, rate, base, cgst, sgst, total, ids_str))
-        
-        inv_id = c.lastrowid
-        
-        # 2. Update Challans status and link to invoice
-        placeholders = ', '.join(['?'] * len(challan_ids))
-        query = f"UPDATE challans SET status = 'Billed', invoice_id = ? WHERE id IN ({placeholders})"
-        args = [inv_id] + challan_ids
-        c.execute(query, args)
-        
-        conn.commit()
+        with db_session() as conn:
+            c = conn.cursor()
+            
+            # Store snapshot of IDs for restoration possibility
+            ids_str = ",".join(map(str, challan_ids))
+            
+            # All challans on an invoice belong to one supplier
+            row = c.execute("SELECT supplier_id FROM challans WHERE id = ?", (challan_ids[0],)).fetchone()
+            supplier_id = row[0] if row else None
+            
+            # 1. Insert Invoice
+            c.execute("""INSERT INTO invoices 
+                        (invoice_no, date, challan_id, rate, base_amount, cgst_amount, sgst_amount, total_amount, challan_ids_snapshot, order_no, order_date, supplier_id, challan_count) 
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", 
+                        (invoice_no, date, 0, rate, base, cgst, sgst, total, ids_str, order_no, order_date, supplier_id, len(challan_ids)))
+            
+            inv_id = c.lastrowid
+            
+            # 2. Line Items
+            if items:
+                c.executemany("""INSERT INTO invoice_items
+                            (invoice_id, line_no, challan_id, challan_no, challan_date, material, qty, rate, base_amount, cgst, sgst, total)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                            [(inv_id, n, it.get('challan_id'), it.get('challan_no'), it.get('challan_date'),
+                              it['material'], it['qty'], it['rate'], it['base_amount'], it['cgst'], it['sgst'], it['total'])
+                             for n, it in enumerate(items, start=1)])
+            
+            # Manually typed numbers must not be handed out again
+            _advance_sequence(c, INVOICE_SERIES, invoice_no)
+            
+            # 3. Update Challans status and link to invoice
+            placeholders = ', '.join(['?'] * len(challan_ids))
+            query = f"UPDATE challans SET status = 'Billed', invoice_id = ? WHERE id IN ({placeholders})"
+            args = [inv_id] + challan_ids
+            c.execute(query, args)
         return True
     except Exception as e:
         print(f"Error saving invoice: {e}")
         return False
-    finally:
-        conn.close()
 
 # --- READ QUERIES (Excluding Deleted) ---
 
+@stats.timed
 def get_invoice_history():
     """Fetch active invoices (Excluding Deleted)."""
-    conn = get_connection()
     query = """
     SELECT i.id, i.invoice_no, i.date, i.total_amount, i.base_amount, 
-           (SELECT count(*) FROM challans c WHERE c.invoice_id = i.id) as challan_count,
-           (SELECT s.name FROM suppliers s 
-            JOIN challans c ON c.supplier_id = s.id 
-            WHERE c.invoice_id = i.id LIMIT 1) as supplier_name
+           i.challan_count, s.name as supplier_name
     FROM invoices i
+    LEFT JOIN suppliers s ON s.id = i.supplier_id
     WHERE (i.is_deleted IS NULL OR i.is_deleted = 0)
     ORDER BY i.id DESC
     """
     try:
-        df = pd.read_sql(query, conn)
+        with db_session() as conn:
+            return pd.read_sql(query, conn)
     except:
-        df = pd.DataFrame()
-    conn.close()
-    return df
+        return pd.DataFrame()
 
+@stats.timed
 def get_invoice_details(invoice_id):
     """Fetch all challans associated with an invoice."""
-    conn = get_connection()
     query = """
     SELECT c.challan_no, c.date, m.name as material, c.quantity
     FROM challans c
     JOIN materials m ON c.material_id = m.id
     WHERE c.invoice_id = ?
     """
-    df = pd.read_sql(query, conn, params=(invoice_id,))
-    conn.close()
-    return df
+    with db_session() as conn:
+        return pd.read_sql(query, conn, params=(invoice_id,))
+
+@stats.timed
+def get_invoice_for_render(invoice_id):
+    """
+    Fetch everything needed to re-render an invoice (header, supplier, items)
+    as the same dict the Dashboard passes to the generators.
+    Returns None if the invoice does not exist.
+    """
+    query = """
+    SELECT i.id, i.invoice_no, i.date, i.order_no, i.order_date, i.rate as header_rate,
+           i.base_amount as inv_base, i.cgst_amount, i.sgst_amount, i.total_amount,
+           s.name as supplier_name, s.address as supplier_address, s.gst_no as supplier_gst,
+           it.material, it.qty, it.rate, it.base_amount, it.cgst, it.sgst, it.total,
+           it.challan_no, it.challan_date
+    FROM invoices i
+    LEFT JOIN suppliers s ON s.id = i.supplier_id
+    LEFT JOIN invoice_items it ON it.invoice_id = i.id
+    WHERE i.id = ?
+    ORDER BY it.line_no
+    """
+    with db_session() as conn:
+        c = conn.cursor()
+        c.row_factory = sqlite3.Row
+        rows = c.execute(query, (invoice_id,)).fetchall()
+
+        if not rows:
+            return None
+        head = rows[0]
+
+        if head['material'] is not None:
+            items = [{
+                'material': r['material'],
+                'qty': r['qty'],
+                'rate': r['rate'],
+                'base_amount': r['base_amount'],
+                'cgst': r['cgst'],
+                'sgst': r['sgst'],
+                'total': r['total'],
+                'challan_no': r['challan_no'],
+                'challan_date': r['challan_date']
+            } for r in rows]
+        else:
+            # Legacy invoice (saved before invoice_items): rebuild from linked
+            # challans using the single header rate.
+            legacy_q = """
+            SELECT c.challan_no, c.date, m.name as material, c.quantity
+            FROM challans c
+            JOIN materials m ON c.material_id = m.id
+            WHERE c.invoice_id = ?
+            """
+            legacy = conn.execute(legacy_q, (invoice_id,)).fetchall()
+            rate = head['header_rate'] or 0.0
+            items = []
+            for challan_no, c_date, material, qty in legacy:
+                base = qty * rate
+                items.append({
+                    'material': material,
+                    'qty': qty,
+                    'rate': rate,
+                    'base_amount': base,
+                    'cgst': base * 0.025,
+                    'sgst': base * 0.025,
+                    'total': base * 1.05,
+                    'challan_no': challan_no,
+                    'challan_date': c_date
+                })
+
+    return {
+        'id': head['id'],
+        'invoice_no': head['invoice_no'],
+        'date': head['date'],
+        'supplier_name': head['supplier_name'] or "",
+        'supplier_address': head['supplier_address'] or "",
+        'supplier_gst': head['supplier_gst'] or "",
+        'items': items,
+        'challan_no': ", ".join(str(it['challan_no']) for it in items),
+        'challan_date': items[0]['challan_date'] if items else "",
+        'order_no': head['order_no'] or "",
+        'order_date': head['order_date'] or "",
+        'base_amount': head['inv_base'],
+        'cgst': head['cgst_amount'],
+        'sgst': head['sgst_amount'],
+        'total': head['total_amount']
+    }
 
+@stats.timed
 def get_supplier_stats(supplier_name):
     """Get total billed amount for a supplier (Excluding Deleted)."""
-    conn = get_connection()
-    query = """
-    SELECT SUM(total_amount) 
-    FROM (
-        SELECT DISTINCT i.id, i.total_amount
-        FROM invoices i
-        JOIN challans c ON c.invoice_id = i.id
-        JOIN suppliers s ON c.supplier_id = s.id
-        WHERE s.name = ? AND (i.is_deleted IS NULL OR i.is_deleted = 0)
-    )
-    """
-    c = conn.cursor()
-    c.execute(query, (supplier_name,))
-    result = c.fetchone()[0]
-    conn.close()
-    return result if result else 0.0
+    return get_supplier_balance(supplier_name)[0]
 
+@stats.timed
 def get_supplier_docs(supplier_name):
     """Get lists of invoices and challans for a supplier (Excluding Deleted Invoices)."""
-    conn = get_connection()
-    
     # Get Invoices
     q_inv = """
-    SELECT DISTINCT i.id, i.invoice_no, i.date, i.total_amount, 
+    SELECT i.id, i.invoice_no, i.date, i.total_amount, 
            i.rate, i.base_amount, i.cgst_amount, i.sgst_amount
     FROM invoices i
-    JOIN challans c ON c.invoice_id = i.id
-    JOIN suppliers s ON c.supplier_id = s.id
+    JOIN suppliers s ON i.supplier_id = s.id
     WHERE s.name = ? AND (i.is_deleted IS NULL OR i.is_deleted = 0)
     ORDER BY i.date DESC
     """
-    invoices = pd.read_sql(q_inv, conn, params=(supplier_name,))
     
     # Get Challans (All)
     q_chal = """
@@ -276,95 +787,84 @@ def get_supplier_docs(supplier_name):
     WHERE s.name = ?
     ORDER BY c.date DESC
     """
-    challans = pd.read_sql(q_chal, conn, params=(supplier_name,))
-    
-    conn.close()
+    with db_session() as conn:
+        invoices = pd.read_sql(q_inv, conn, params=(supplier_name,))
+        challans = pd.read_sql(q_chal, conn, params=(supplier_name,))
     return invoices, challans
 
+@stats.timed
 def restore_invoice(invoice_id):
     """Restore a deleted invoice if its challans are still available."""
     try:
-        conn = get_connection()
-        c = conn.cursor()
-        
-        # 1. Get snapshot IDs
-        c.execute("SELECT challan_ids_snapshot FROM invoices WHERE id = ?", (invoice_id,))
-        row = c.fetchone()
-        if not row or not row[0]:
-            print("No snapshot found to restore.")
-            return False, "No linked challan data found."
+        with db_session() as conn:
+            c = conn.cursor()
             
-        challan_ids = [int(x) for x in row[0].split(',')]
-        
-        # 2. Check validity (Are any challans already billed in ANOTHER active invoice?)
-        # We check if status='Billed' AND invoice_id != this_invoice_id (and invoice_id is not null)
-        # But wait, if they were deleted, they are Pending.
-        # If they were re-billed, they are Billed.
-        
-        placeholders = ', '.join(['?'] * len(challan_ids))
-        check_q = f"SELECT count(*) FROM challans WHERE id IN ({placeholders}) AND status = 'Billed'"
-        c.execute(check_q, challan_ids)
-        billed_count = c.fetchone()[0]
-        
-        if billed_count > 0:
-            return False, "Cannot restore: Some associated challans have already been re-billed in a new invoice."
+            # 1. Get snapshot IDs
+            c.execute("SELECT challan_ids_snapshot FROM invoices WHERE id = ?", (invoice_id,))
+            row = c.fetchone()
+            if not row or not row[0]:
+                print("No snapshot found to restore.")
+                return False, "No linked challan data found."
+                
+            challan_ids = [int(x) for x in row[0].split(',')]
             
-        # 3. Restore
-        # Link Challans back
-        update_q = f"UPDATE challans SET status = 'Billed', invoice_id = ? WHERE id IN ({placeholders})"
-        c.execute(update_q, [invoice_id] + challan_ids)
-        
-        # Set Active
-        c.execute("UPDATE invoices SET is_deleted = 0 WHERE id = ?", (invoice_id,))
-        
-        conn.commit()
+            # 2. Check validity (Are any challans already billed in ANOTHER active invoice?)
+            # We check if status='Billed' AND invoice_id != this_invoice_id (and invoice_id is not null)
+            # But wait, if they were deleted, they are Pending.
+            # If they were re-billed, they are Billed.
+            
+            placeholders = ', '.join(['?'] * len(challan_ids))
+            check_q = f"SELECT count(*) FROM challans WHERE id IN ({placeholders}) AND status = 'Billed'"
+            c.execute(check_q, challan_ids)
+            billed_count = c.fetchone()[0]
+            
+            if billed_count > 0:
+                return False, "Cannot restore: Some associated challans have already been re-billed in a new invoice."
+                
+            # 3. Restore
+            # Link Challans back
+            update_q = f"UPDATE challans SET status = 'Billed', invoice_id = ? WHERE id IN ({placeholders})"
+            c.execute(update_q, [invoice_id] + challan_ids)
+            
+            # Set Active
+            c.execute("UPDATE invoices SET is_deleted = 0 WHERE id = ?", (invoice_id,))
         return True, "Invoice restored successfully."
     except Exception as e:
         print(f"Error restoring: {e}")
         return False, str(e)
-    finally:
-        conn.close()
 
+@stats.timed
 def delete_invoice(invoice_id):
     """Soft Delete invoice and revert challans to Pending."""
     try:
-        conn = get_connection()
-        c = conn.cursor()
-        
-        # 1. Revert Challans
-        c.execute("UPDATE challans SET status = 'Pending', invoice_id = NULL WHERE invoice_id = ?", (invoice_id,))
-        
-        # 2. Soft Delete Invoice
-        c.execute("UPDATE invoices SET is_deleted = 1 WHERE id = ?", (invoice_id,))
-        
-        conn.commit()
+        with db_session() as conn:
+            # 1. Revert Challans
+            conn.execute("UPDATE challans SET status = 'Pending', invoice_id = NULL WHERE invoice_id = ?", (invoice_id,))
+            
+            # 2. Soft Delete Invoice
+            conn.execute("UPDATE invoices SET is_deleted = 1 WHERE id = ?", (invoice_id,))
         return True
     except Exception as e:
         print(f"Error deleting invoice: {e}")
         return False
-    finally:
-        conn.close()
 
 # --- PAYMENT FUNCTIONS ---
 
+@stats.timed
 def add_payment(date, supplier_id, amount, mode, image_path, notes):
     """Record a payment for a supplier."""
     try:
-        conn = get_connection()
-        c = conn.cursor()
-        c.execute("INSERT INTO payments (date, supplier_id, amount, mode, image_path, notes) VALUES (?, ?, ?, ?, ?, ?)",
-                  (date, supplier_id, amount, mode, image_path, notes))
-        conn.commit()
+        with db_session() as conn:
+            conn.execute("INSERT INTO payments (date, supplier_id, amount, mode, image_path, notes) VALUES (?, ?, ?, ?, ?, ?)",
+                         (date, supplier_id, amount, mode, image_path, notes))
         return True
     except Exception as e:
         print(f"Error adding payment: {e}")
         return False
-    finally:
-        conn.close()
 
+@stats.timed
 def get_supplier_payments(supplier_name):
     """Get all payments for a supplier."""
-    conn = get_connection()
     query = """
     SELECT p.id, p.date, p.amount, p.mode, p.image_path, p.notes
     FROM payments p
@@ -372,53 +872,61 @@ def get_supplier_payments(supplier_name):
     WHERE s.name = ?
     ORDER BY p.date DESC
     """
-    df = pd.read_sql(query, conn, params=(supplier_name,))
-    conn.close()
-    return df
+    with db_session() as conn:
+        return pd.read_sql(query, conn, params=(supplier_name,))
 
+@stats.timed
 def get_supplier_balance(supplier_name):
-    """Get Billed, Paid, and Balance for a supplier."""
-    billed = get_supplier_stats(supplier_name) # Uses filtered stats
-    
-    conn = get_connection()
+    """Get Billed, Paid, and Balance for a supplier (from supplier_ledger)."""
     query = """
-    SELECT SUM(p.amount)
-    FROM payments p
-    JOIN suppliers s ON p.supplier_id = s.id
+    SELECT l.billed, l.paid, l.balance
+    FROM suppliers s
+    JOIN supplier_ledger l ON l.supplier_id = s.id
     WHERE s.name = ?
     """
-    c = conn.cursor()
-    c.execute(query, (supplier_name,))
-    paid = c.fetchone()[0]
-    conn.close()
-    
-    paid = paid if paid else 0.0
-    balance = billed - paid
-    return billed, paid, balance
+    with db_session() as conn:
+        row = conn.execute(query, (supplier_name,)).fetchone()
+    if not row:
+        return 0.0, 0.0, 0.0
+    return row
+
+LEDGER_SORT_COLUMNS = ("balance", "billed", "paid", "invoice_count", "last_activity", "name")
+
+@stats.timed
+def get_supplier_ledger(sort_by="balance", descending=True):
+    """All suppliers with billed / paid / outstanding balance, sorted."""
+    if sort_by not in LEDGER_SORT_COLUMNS:
+        raise ValueError(f"Cannot sort ledger by {sort_by!r}")
+    direction = "DESC" if descending else "ASC"
+    query = f"""
+    SELECT s.id, s.name, l.billed, l.paid, l.balance, l.invoice_count, l.last_activity
+    FROM supplier_ledger l
+    JOIN suppliers s ON s.id = l.supplier_id
+    ORDER BY {sort_by} {direction}, s.name
+    """
+    return cached_read(query)
 
 # --- MASTER HISTORY ---
 
+@stats.timed
 def get_master_history():
     """Fetch ALL invoices including Deleted."""
-    conn = get_connection()
     query = """
     SELECT i.id, i.invoice_no, i.date, i.total_amount, i.is_deleted,
-           (SELECT s.name FROM suppliers s 
-            JOIN challans c ON c.supplier_id = s.id 
-            WHERE c.invoice_id = i.id LIMIT 1) as supplier_name
+           s.name as supplier_name
     FROM invoices i
+    LEFT JOIN suppliers s ON s.id = i.supplier_id
     ORDER BY i.id DESC
     """
     try:
-        df = pd.read_sql(query, conn)
+        with db_session() as conn:
+            return pd.read_sql(query, conn)
     except:
-        df = pd.DataFrame()
-    conn.close()
-    return df
+        return pd.DataFrame()
 
+@stats.timed
 def get_master_challans():
     """Fetch ALL challans."""
-    conn = get_connection()
     query = """
     SELECT c.challan_no, c.date, s.name as supplier, m.name as material, c.quantity, c.status
     FROM challans c
@@ -426,30 +934,235 @@ def get_master_challans():
     JOIN materials m ON c.material_id = m.id
     ORDER BY c.date DESC
     """
-    df = pd.read_sql(query, conn)
-    conn.close()
-    return df
+    with db_session() as conn:
+        return pd.read_sql(query, conn)
+
+SALES_LEDGER_COLUMNS = ["Invoice No", "Date", "Supplier Name", "Taxable Amount", "CGST", "SGST", "Total Amount"]
+
+def iter_query(query, params=(), batch_size=500):
+    """
+    Yield row batches (lists of tuples) for a large read. Uses a private
+    connection, closed when the iterator finishes or is dropped, so a consumer
+    that stops early never leaves this thread's db_session open.
+    """
+    conn = _open_connection()
+    try:
+        cursor = conn.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield rows
+    finally:
+        conn.close()
 
+def iter_sales_ledger(batch_size=500):
+    """
+    Stream master sales ledger rows (tuples in SALES_LEDGER_COLUMNS order),
+    numeric invoice numbers first in numeric order, then the rest by text.
+    """
+    query = """
+    SELECT invoice_no, date, supplier_name, taxable, cgst, sgst, total
+    FROM sales_ledger
+    ORDER BY (invoice_no = '' OR invoice_no GLOB '*[^0-9]*'), CAST(invoice_no AS INTEGER), invoice_no, id
+    """
+    for rows in iter_query(query, batch_size=batch_size):
+        yield from rows
+
+@stats.timed
+def get_sales_ledger_size():
+    with db_session() as conn:
+        return conn.execute("SELECT count(*) FROM sales_ledger").fetchone()[0]
+
+@stats.timed
 def get_last_invoice_no():
-    """Get the highest numeric invoice number."""
-    conn = get_connection()
-    # We cast to integer to find max. If starts with non-digit, this might fail or return 0, which is fine as we default to 500.
-    # Logic: Filter for numeric invoice_nos
-    query = "SELECT invoice_no FROM invoices WHERE is_deleted IS NULL OR is_deleted = 0"
+    """Get the highest numeric invoice number (from the invoice sequence)."""
     try:
-        c = conn.cursor()
-        c.execute(query)
-        rows = c.fetchall()
-        max_val = 0
-        for r in rows:
-            try:
-                val = int(r[0])
-                if val > max_val:
-                    max_val = val
-            except:
-                continue
-        return max_val
+        with db_session() as conn:
+            row = conn.execute("SELECT next_value FROM sequences WHERE name = ?", (INVOICE_SERIES,)).fetchone()
+        return row[0] - 1 if row else 0
     except:
         return 0
-    finally:
-        conn.close()
+
+# --- PAGINATED QUERIES ---
+# Keyset pagination: a page is identified by the (sort value, id) of the last
+# row already shown, so every page is an index range scan of page_size rows.
+
+PAGE_SORT_KEYS = ("id", "date")
+
+def _keyset_page(base_query, where, params, alias, sort, descending, cursor, page_size):
+    """
+    Run base_query (a SELECT ... FROM ... JOIN ... without WHERE/ORDER) for one
+    page. Returns (DataFrame, next_cursor); next_cursor is None on the last page.
+    """
+    if sort not in PAGE_SORT_KEYS:
+        raise ValueError(f"Cannot paginate by {sort!r}")
+    where = list(where)
+    params = list(params)
+    op = "<" if descending else ">"
+    direction = "DESC" if descending else "ASC"
+
+    if cursor is not None:
+        if sort == "id":
+            where.append(f"{alias}.id {op} ?")
+            params.append(cursor[-1])
+        else:
+            where.append(f"({alias}.{sort}, {alias}.id) {op} (?, ?)")
+            params.extend(cursor)
+
+    query = base_query
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    if sort == "id":
+        query += f" ORDER BY {alias}.id {direction}"
+    else:
+        query += f" ORDER BY {alias}.{sort} {direction}, {alias}.id {direction}"
+    query += " LIMIT ?"
+    params.append(page_size + 1)
+
+    with db_session() as conn:
+        df = pd.read_sql(query, conn, params=params)
+
+    next_cursor = None
+    if len(df) > page_size:
+        df = df.iloc[:page_size]
+        last = df.iloc[-1]
+        key = last[sort]
+        key = key.item() if hasattr(key, "item") else key # numpy scalar -> plain value
+        next_cursor = (key, int(last['id']))
+    return df, next_cursor
+
+@stats.timed
+def get_invoices_page(cursor=None, page_size=25, sort="id", descending=True,
+                      supplier_name=None, deleted=False, date_from=None, date_to=None):
+    """
+    One page of invoices (newest first by default).
+    deleted: False = active only, True = deleted only, None = all.
+    """
+    base = """
+    SELECT i.id, i.invoice_no, i.date, i.total_amount, i.base_amount, i.cgst_amount, i.sgst_amount,
+           i.rate, i.challan_count, i.is_deleted, s.name as supplier_name
+    FROM invoices i
+    LEFT JOIN suppliers s ON s.id = i.supplier_id
+    """
+    where, params = [], []
+    if supplier_name:
+        where.append("i.supplier_id = (SELECT id FROM suppliers WHERE name = ?)")
+        params.append(supplier_name)
+    if deleted is True:
+        where.append("i.is_deleted = 1")
+    elif deleted is False:
+        where.append("(i.is_deleted IS NULL OR i.is_deleted = 0)")
+    if date_from:
+        where.append("i.date >= ?")
+        params.append(str(date_from))
+    if date_to:
+        where.append("i.date <= ?")
+        params.append(str(date_to))
+    return _keyset_page(base, where, params, "i", sort, descending, cursor, page_size)
+
+@stats.timed
+def get_challans_page(cursor=None, page_size=25, sort="date", descending=True,
+                      supplier_name=None, status=None, date_from=None, date_to=None):
+    """One page of challans (newest first by default). status: 'Pending', 'Billed' or None."""
+    base = """
+    SELECT c.id, c.challan_no, c.date, s.name as supplier, m.name as material, c.quantity, c.status, c.invoice_id
+    FROM challans c
+    JOIN suppliers s ON c.supplier_id = s.id
+    JOIN materials m ON c.material_id = m.id
+    """
+    where, params = [], []
+    if supplier_name:
+        where.append("c.supplier_id = (SELECT id FROM suppliers WHERE name = ?)")
+        params.append(supplier_name)
+    if status:
+        where.append("c.status = ?")
+        params.append(status)
+    if date_from:
+        where.append("c.date >= ?")
+        params.append(str(date_from))
+    if date_to:
+        where.append("c.date <= ?")
+        params.append(str(date_to))
+    return _keyset_page(base, where, params, "c", sort, descending, cursor, page_size)
+
+# --- NUMBER SEQUENCES ---
+
+def financial_year(d):
+    """Indian financial year label (April-March) for a date, e.g. '2025-26'."""
+    start = d.year if d.month >= 4 else d.year - 1
+    return f"{start}-{str(start + 1)[-2:]}"
+
+def financial_year_series(base, d):
+    """Series name and prefix for a per-financial-year series, e.g. ('invoice:2025-26', '2025-26/')."""
+    fy = financial_year(d)
+    return f"{base}:{fy}", f"{fy}/"
+
+@stats.timed
+def peek_next_number(series=INVOICE_SERIES, prefix="", start=1):
+    """Next number the series would hand out, without reserving it (for form defaults)."""
+    with db_session() as conn:
+        row = conn.execute("SELECT prefix, next_value FROM sequences WHERE name = ?", (series,)).fetchone()
+    if not row:
+        return f"{prefix}{start}"
+    return f"{row[0]}{row[1]}"
+
+@stats.timed
+def reserve_next_number(series=INVOICE_SERIES, prefix="", start=1):
+    """
+    Atomically reserve and return the next number of a series (created on
+    first use with the given prefix/start). On its own it runs under
+    BEGIN IMMEDIATE, so concurrent sessions never receive the same number;
+    inside an enclosing db_session it joins that transaction via a SAVEPOINT.
+
+    A reserved number is consumed even if the document is never saved; call
+    release_number() when the save fails so the gap is not left behind.
+    """
+    with db_session() as conn:
+        nested = _local.depth > 1
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        if nested:
+            conn.execute("SAVEPOINT reserve_number")
+        try:
+            conn.execute("INSERT OR IGNORE INTO sequences (name, prefix, next_value) VALUES (?, ?, ?)",
+                         (series, prefix, start))
+            series_prefix, value = conn.execute("SELECT prefix, next_value FROM sequences WHERE name = ?", (series,)).fetchone()
+            conn.execute("UPDATE sequences SET next_value = ? WHERE name = ?", (value + 1, series))
+        except:
+            if nested:
+                conn.execute("ROLLBACK TO reserve_number")
+                conn.execute("RELEASE reserve_number")
+            raise
+        if nested:
+            conn.execute("RELEASE reserve_number")
+    return f"{series_prefix}{value}"
+
+@stats.timed
+def release_number(series, number):
+    """
+    Give back a reserved number whose document failed to save. Only the most
+    recently issued number can be returned (later reservations keep theirs);
+    returns True if the series was rewound.
+    """
+    with db_session() as conn:
+        row = conn.execute("SELECT prefix FROM sequences WHERE name = ?", (series,)).fetchone()
+        number = str(number)
+        if not row or not number.startswith(row[0]) or not number[len(row[0]):].isdigit():
+            return False
+        value = int(number[len(row[0]):])
+        c = conn.execute("UPDATE sequences SET next_value = ? WHERE name = ? AND next_value = ?",
+                         (value, series, value + 1))
+        return c.rowcount == 1
+
+def _advance_sequence(c, series, number):
+    """Keep a series ahead of a manually entered number (same transaction as the insert)."""
+    row = c.execute("SELECT prefix FROM sequences WHERE name = ?", (series,)).fetchone()
+    if not row:
+        return
+    prefix = row[0]
+    number = str(number)
+    if not number.startswith(prefix) or not number[len(prefix):].isdigit():
+        return
+    c.execute("UPDATE sequences SET next_value = max(next_value, ?) WHERE name = ?",
+              (int(number[len(prefix):]) + 1, series))
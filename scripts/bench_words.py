@@ -0,0 +1,36 @@
+import os
+import sys
+import time
+import random
+
+# Add parent dir to sys.path to allow importing utils_words
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Benchmark utils_words against num2words (pip install num2words; no longer an app dependency)
+started = time.perf_counter()
+from num2words import num2words
+print(f"num2words import: {(time.perf_counter() - started) * 1000:.1f} ms")
+
+started = time.perf_counter()
+import utils_words
+print(f"utils_words import: {(time.perf_counter() - started) * 1000:.1f} ms")
+
+random.seed(1)
+amounts = [round(random.uniform(100, 5_000_000), 2) for _ in range(20000)]
+
+# Same wording for whole rupees
+mismatches = [a for a in amounts if utils_words.number_to_words(int(a)) != num2words(int(a), lang='en_IN').title()]
+print(f"Integer wording mismatches: {len(mismatches)}")
+
+def bench(label, func, values):
+    started = time.perf_counter()
+    for v in values:
+        func(v)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<32} {elapsed * 1e6 / len(values):8.2f} us/call")
+
+bench("num2words(en_IN)", lambda v: num2words(v, lang='en_IN').title(), amounts)
+bench("amount_in_words (cold)", utils_words.amount_in_words, amounts)
+# Re-renders repeat the same totals; memo hits only
+repeats = amounts[:2000] * 10
+bench("amount_in_words (memoized)", utils_words.amount_in_words, repeats)
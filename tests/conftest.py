@@ -0,0 +1,108 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database as db
+
+@pytest.fixture
+def db_file(tmp_path, monkeypatch):
+    """Point database at a fresh file for one test; connections are closed afterwards."""
+    path = str(tmp_path / "autobiller.db")
+    monkeypatch.setattr(db, "DB_FILE", path)
+    db.clear_read_cache()
+    yield path
+    db.close_connection()
+    db.close_pool()
+    db.clear_read_cache()
+
+# Schema as created by init_db() before migrations existed (user_version 0)
+BASELINE_SCHEMA = """
+CREATE TABLE suppliers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT UNIQUE NOT NULL,
+    address TEXT,
+    gst_no TEXT,
+    phone TEXT
+);
+CREATE TABLE materials (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT UNIQUE NOT NULL,
+    unit TEXT DEFAULT 'Meters'
+);
+CREATE TABLE challans (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    challan_no TEXT NOT NULL,
+    date TEXT NOT NULL,
+    supplier_id INTEGER NOT NULL,
+    material_id INTEGER NOT NULL,
+    quantity REAL NOT NULL,
+    status TEXT DEFAULT 'Pending',
+    invoice_id INTEGER,
+    FOREIGN KEY (supplier_id) REFERENCES suppliers (id),
+    FOREIGN KEY (material_id) REFERENCES materials (id)
+);
+CREATE TABLE invoices (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    invoice_no TEXT UNIQUE NOT NULL,
+    date TEXT NOT NULL,
+    challan_id INTEGER NOT NULL,
+    rate REAL NOT NULL,
+    base_amount REAL NOT NULL,
+    cgst_amount REAL NOT NULL,
+    sgst_amount REAL NOT NULL,
+    total_amount REAL NOT NULL,
+    FOREIGN KEY (challan_id) REFERENCES challans (id)
+);
+CREATE TABLE payments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    date TEXT NOT NULL,
+    supplier_id INTEGER NOT NULL,
+    amount REAL NOT NULL,
+    mode TEXT,
+    image_path TEXT,
+    notes TEXT,
+    FOREIGN KEY (supplier_id) REFERENCES suppliers (id)
+);
+ALTER TABLE invoices ADD COLUMN is_deleted INTEGER DEFAULT 0;
+ALTER TABLE invoices ADD COLUMN challan_ids_snapshot TEXT;
+"""
+
+def create_baseline(path):
+    """A pre-migration database with history: Alpha has an active and a deleted invoice, Beta one active."""
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.executemany("INSERT INTO suppliers (name, gst_no) VALUES (?, ?)",
+                     [("Alpha Textiles", "24AAAAA0000A1Z5"), ("Beta Mills", None)])
+    conn.execute("INSERT INTO materials (name) VALUES ('Cotton')")
+    conn.executemany("""INSERT INTO challans (challan_no, date, supplier_id, material_id, quantity, status, invoice_id)
+                        VALUES (?, ?, ?, 1, ?, ?, ?)""", [
+        ("101", "2024-04-02", 1, 100, "Billed", 1),
+        ("102", "2024-04-03", 1, 50, "Billed", 1),
+        ("103", "2024-04-05", 1, 20, "Pending", None),   # freed by the deleted invoice 502
+        ("B-7", "2024-04-06", 2, 30, "Billed", 3),
+    ])
+    conn.executemany("""INSERT INTO invoices (invoice_no, date, challan_id, rate, base_amount, cgst_amount,
+                                              sgst_amount, total_amount, is_deleted, challan_ids_snapshot)
+                        VALUES (?, ?, 0, ?, ?, ?, ?, ?, ?, ?)""", [
+        ("501", "2024-04-10", 10, 1500, 135, 135, 1770, 0, "1,2"),
+        ("502", "2024-04-11", 10, 200, 18, 18, 236, 1, "3"),
+        ("INV/9", "2024-04-12", 10, 300, 27, 27, 354, 0, None),
+    ])
+    conn.executemany("INSERT INTO payments (date, supplier_id, amount, mode) VALUES (?, ?, ?, ?)",
+                     [("2024-04-20", 1, 1000, "UPI"), ("2024-04-01", 2, 54, "Cash")])
+    conn.commit()
+    conn.close()
+
+@pytest.fixture
+def baseline_db(db_file):
+    """db_file holding a pre-migration (user_version 0) database with history."""
+    create_baseline(db_file)
+    return db_file
+
+def query(sql, params=()):
+    with db.db_session() as conn:
+        return conn.execute(sql, params).fetchall()
@@ -0,0 +1,68 @@
+import io
+
+from openpyxl import Workbook
+
+import database as db
+import utils_import
+from conftest import query
+
+def setup_reference():
+    db.init_db()
+    db.add_supplier("Alpha Textiles", "", "", "")
+    db.add_material("Cotton", "Meters")
+
+def challans():
+    return query("SELECT challan_no, date, supplier_id, material_id, quantity FROM challans ORDER BY id")
+
+def test_bulk_insert_is_all_or_nothing(db_file):
+    setup_reference()
+    good = {'material_id': 1, 'quantity': 10}
+    assert db.add_challans_bulk("7", "2024-04-01", 1, [good, good])
+    assert db.add_challans_bulk("8", "2024-04-01", 1, [good, {'material_id': 1, 'quantity': None}]) is False
+    assert challans() == [("7", "2024-04-01", 1, 1, 10), ("7", "2024-04-01", 1, 1, 10)]
+    assert db.peek_next_number(db.CHALLAN_SERIES) == "8"
+
+def test_csv_import_stores_iso_dates_and_reports_bad_rows(db_file):
+    setup_reference()
+    data = io.BytesIO("\n".join([
+        "Challan No,Date,Party,Item,Qty",
+        "101,15/04/2023,Alpha Textiles,Cotton,12.5",
+        "102,2023-04-16,Alpha Textiles,Cotton,3",
+        "103,31/02/2023,Alpha Textiles,Cotton,1",
+        "104,16.04.2023,,Cotton,1",
+        "105,16-04-2023,Unknown Mills,Cotton,1",
+        "106,16/04/23,Alpha Textiles,Cotton,lots",
+        ",,,,",
+    ]).encode("utf-8-sig"))
+    data.name = "challans.csv"
+
+    result = utils_import.import_challans(data)
+    assert result['inserted'] == 2
+    assert [line for line, _ in result['errors']] == [4, 5, 6, 7]
+    assert "Unrecognised date" in result['errors'][0][1]
+    assert result['errors'][1][1] == "Missing supplier"
+    assert challans() == [("101", "2023-04-15", 1, 1, 12.5), ("102", "2023-04-16", 1, 1, 3)]
+
+def test_create_missing_never_creates_blank_names(db_file, tmp_path):
+    setup_reference()
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["challan_no", "date", "supplier", "material", "quantity"])
+    ws.append([201.0, "01/05/2023", None, "Cotton", 4])
+    ws.append([202.0, "01/05/2023", "Beta Mills", "   ", 4])
+    ws.append([203.0, "not a date", "Gamma", "Silk", 4])
+    ws.append([204.0, "02/05/2023", "Beta Mills", "Silk", 5])
+    path = tmp_path / "challans.xlsx"
+    wb.save(path)
+
+    progress = []
+    result = utils_import.import_challans(str(path), create_missing=True, batch_size=1,
+                                          progress=lambda done, total: progress.append((done, total)))
+    assert result['inserted'] == 1
+    assert result['errors'] == [(2, "Missing supplier"), (3, "Missing material"),
+                                (4, "Unrecognised date 'not a date'")]
+    # The invalid rows created nothing; only row 5's supplier and material were added
+    assert sorted(db.get_suppliers()['name']) == ["Alpha Textiles", "Beta Mills"]
+    assert sorted(db.get_materials()['name']) == ["Cotton", "Silk"]
+    assert challans() == [("204", "2023-05-02", 2, 2, 5)]
+    assert progress[-1] == (1, 4)
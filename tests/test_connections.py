@@ -0,0 +1,71 @@
+import gc
+import sqlite3
+import threading
+
+import pytest
+
+import database as db
+
+
+def in_thread(fn):
+    """Run fn on a new thread (like a Streamlit rerun) and return its result."""
+    result = {}
+    thread = threading.Thread(target=lambda: result.setdefault('value', fn()))
+    thread.start()
+    thread.join()
+    gc.collect()
+    return result['value']
+
+def test_same_thread_reuses_its_connection(db_file):
+    assert db.get_connection() is db.get_connection()
+    with db.db_session() as conn:
+        assert conn is db.get_connection()
+
+def test_finished_thread_returns_connection_to_pool(db_file):
+    first = in_thread(db.get_connection)
+    assert [conn for _, conn in db._idle] == [first]
+    # The next "rerun" leases the same connection instead of opening one
+    assert in_thread(db.get_connection) is first
+    assert len(db._idle) == 1
+
+def test_released_connection_is_rolled_back(db_file):
+    db.init_db()
+
+    def leave_transaction_open():
+        conn = db.get_connection()
+        conn.execute("INSERT INTO materials (name) VALUES ('Silk')")
+        assert conn.in_transaction
+        return conn
+
+    conn = in_thread(leave_transaction_open)
+    assert not conn.in_transaction
+    assert db.cached_read("SELECT count(*) AS n FROM materials")['n'][0] == 0
+
+def test_pool_keeps_at_most_pool_size_idle(db_file):
+    barrier = threading.Barrier(db.POOL_SIZE + 2)
+
+    def hold():
+        db.get_connection()
+        barrier.wait()
+
+    threads = [threading.Thread(target=hold) for _ in range(db.POOL_SIZE + 2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    gc.collect()
+    assert len(db._idle) == db.POOL_SIZE
+
+def test_close_connection_does_not_pool(db_file):
+    conn = db.get_connection()
+    db.close_connection()
+    assert db._idle == []
+    assert db.get_connection() is not conn
+
+def test_changing_db_file_closes_old_connection(db_file, tmp_path, monkeypatch):
+    old = db.get_connection()
+    monkeypatch.setattr(db, "DB_FILE", str(tmp_path / "other.db"))
+    assert db.get_connection() is not old
+    assert db._idle == []
+    with pytest.raises(sqlite3.ProgrammingError):
+        old.execute("SELECT 1")
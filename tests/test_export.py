@@ -0,0 +1,38 @@
+import csv
+
+import pytest
+from openpyxl import load_workbook
+
+import database as db
+import utils_export
+
+@pytest.fixture
+def invoices(baseline_db):
+    db.init_db()
+
+def test_formats_match_installed_writers():
+    try:
+        import pyarrow  # noqa: F401
+        expected = ("xlsx", "csv", "parquet")
+    except ImportError:
+        expected = ("xlsx", "csv")
+    assert utils_export.FORMATS == expected
+
+def test_parquet_without_pyarrow_is_rejected(invoices, tmp_path, monkeypatch):
+    monkeypatch.setattr(utils_export, "FORMATS", ("xlsx", "csv"))
+    with pytest.raises(ValueError, match="needs pyarrow"):
+        utils_export.export_register('invoices', str(tmp_path / "r.parquet"))
+    assert not list(tmp_path.glob("r.parquet*"))
+
+def test_csv_and_xlsx_exports(invoices, tmp_path):
+    result = utils_export.export_register('invoices', str(tmp_path / "r.csv"), batch_size=1,
+                                          columns=["Invoice No", "Supplier Name", "Total Amount"])
+    assert result['rows'] == 2
+    with open(result['path'], encoding="utf-8-sig") as f:
+        assert list(csv.reader(f)) == [["Invoice No", "Supplier Name", "Total Amount"],
+                                       ["501", "Alpha Textiles", "1770.0"], ["INV/9", "Beta Mills", "354.0"]]
+
+    result = utils_export.export_register('items', str(tmp_path / "r.xlsx"), include_deleted=True)
+    ws = load_workbook(result['path']).active
+    assert ws.max_row == 1 + result['rows']
+    assert ws['A1'].value == "Invoice No"
@@ -0,0 +1,30 @@
+import database as db
+from conftest import query
+
+def test_saved_items_render_exactly(baseline_db):
+    db.init_db()
+    items = [
+        {'material': "Cotton", 'qty': 20, 'rate': 10, 'base_amount': 200, 'cgst': 5, 'sgst': 5, 'total': 210,
+         'challan_id': 3, 'challan_no': "103", 'challan_date': "2024-04-05"},
+        {'material': "Freight", 'qty': 1, 'rate': 26, 'base_amount': 26, 'cgst': 0, 'sgst': 0, 'total': 26,
+         'challan_id': 3, 'challan_no': "103", 'challan_date': "2024-04-05"},
+    ]
+    assert db.save_invoice("503", "2024-05-01", 10, 226, 5, 5, 236, [3], items=items, order_no="PO-7")
+    inv_id = query("SELECT id FROM invoices WHERE invoice_no = '503'")[0][0]
+
+    data = db.get_invoice_for_render(inv_id)
+    assert [(it['material'], it['qty'], it['rate'], it['total']) for it in data['items']] == [
+        ("Cotton", 20, 10, 210), ("Freight", 1, 26, 26)]
+    assert (data['supplier_name'], data['order_no'], data['challan_no']) == ("Alpha Textiles", "PO-7", "103, 103")
+    assert (data['base_amount'], data['total']) == (226, 236)
+
+def test_legacy_invoice_rebuilt_from_challans(baseline_db):
+    db.init_db()
+    data = db.get_invoice_for_render(1)
+    assert [(it['challan_no'], it['qty'], it['rate'], it['base_amount']) for it in data['items']] == [
+        ("101", 100, 10, 1000), ("102", 50, 10, 500)]
+    assert data['total'] == 1770
+
+def test_missing_invoice(db_file):
+    db.init_db()
+    assert db.get_invoice_for_render(42) is None
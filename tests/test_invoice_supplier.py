@@ -0,0 +1,22 @@
+import database as db
+from conftest import query
+
+def test_supplier_and_challan_count_backfilled(baseline_db):
+    db.init_db()
+    # The deleted invoice's challans were unlinked: supplier comes from its snapshot
+    assert query("SELECT invoice_no, supplier_id, challan_count FROM invoices ORDER BY id") == [
+        ("501", 1, 2),
+        ("502", 1, 1),
+        ("INV/9", 2, 1),
+    ]
+
+def test_saved_invoice_stores_supplier_and_count(baseline_db):
+    db.init_db()
+    assert db.save_invoice("503", "2024-05-01", 10, 200, 18, 18, 236, [3])
+    assert query("SELECT supplier_id, challan_count FROM invoices WHERE invoice_no = '503'") == [(1, 1)]
+
+def test_history_uses_stored_columns(baseline_db):
+    db.init_db()
+    history = db.get_invoice_history()
+    assert dict(zip(history['invoice_no'], history['supplier_name'])) == {"501": "Alpha Textiles", "INV/9": "Beta Mills"}
+    assert dict(zip(history['invoice_no'], history['challan_count'])) == {"501": 2, "INV/9": 1}
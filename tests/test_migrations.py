@@ -0,0 +1,51 @@
+import pytest
+
+import database as db
+from conftest import query
+
+HOT_PATH_INDEXES = {"idx_challans_status", "idx_challans_invoice", "idx_challans_supplier",
+                    "idx_invoices_deleted", "idx_payments_supplier"}
+
+def test_migrates_baseline_database(baseline_db):
+    db.init_db()
+
+    with db.db_session() as conn:
+        assert db.get_schema_version(conn) == db.SCHEMA_VERSION
+    indexes = {name for (name,) in query("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert HOT_PATH_INDEXES <= indexes
+
+    # Existing rows survive every step
+    assert query("SELECT invoice_no, total_amount, is_deleted, challan_ids_snapshot FROM invoices ORDER BY id") == [
+        ("501", 1770, 0, "1,2"),
+        ("502", 236, 1, "3"),
+        ("INV/9", 354, 0, None),
+    ]
+    assert query("SELECT count(*) FROM challans")[0][0] == 4
+    assert query("SELECT count(*) FROM payments")[0][0] == 2
+
+def test_current_schema_is_a_no_op(baseline_db):
+    db.init_db()
+    with db.db_session() as conn:
+        assert db.migrate(conn) is False
+        schema = conn.execute("SELECT sql FROM sqlite_master ORDER BY name").fetchall()
+    db.init_db()
+    assert query("SELECT sql FROM sqlite_master ORDER BY name") == schema
+
+def test_failed_step_rolls_back_every_pending_step(baseline_db, monkeypatch):
+    def broken(c):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(db, "MIGRATIONS", db.MIGRATIONS[:2] + [broken])
+    monkeypatch.setattr(db, "SCHEMA_VERSION", 3)
+    with pytest.raises(RuntimeError):
+        db.init_db()
+
+    with db.db_session() as conn:
+        assert db.get_schema_version(conn) == 0
+    assert query("SELECT count(*) FROM sqlite_master WHERE name = 'idx_challans_status'")[0][0] == 0
+
+def test_new_database_starts_at_current_schema(db_file):
+    db.init_db()
+    with db.db_session() as conn:
+        assert db.get_schema_version(conn) == db.SCHEMA_VERSION
+    assert query("SELECT count(*) FROM invoices")[0][0] == 0
@@ -0,0 +1,53 @@
+import time
+
+import pytest
+
+import utils_native
+
+@pytest.fixture
+def server(monkeypatch):
+    """A fresh OfficeServer whose launches always fail (no soffice needed)."""
+    server = utils_native.OfficeServer()
+    launches = []
+
+    def launch():
+        launches.append(time.monotonic())
+        raise RuntimeError("soffice not found")
+
+    monkeypatch.setattr(server, "_launch", launch)
+    monkeypatch.setattr(utils_native, "_office_server", server)
+    monkeypatch.setattr(utils_native, "LO_SERVER_ENABLED", True)
+    monkeypatch.setattr(utils_native, "_import_uno", lambda: object())
+    server.launches_seen = launches
+    return server
+
+def wait_for_warm_up():
+    deadline = time.monotonic() + 5
+    while utils_native._office_server_starting.is_set() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+def test_reruns_do_not_relaunch_after_a_failed_start(server, tmp_path):
+    assert utils_native.start_office_server() is True
+    wait_for_warm_up()
+    assert len(server.launches_seen) == 1 and server.retry_pending()
+
+    # Every later rerun inside the retry window is a no-op, and so is convert()
+    for _ in range(3):
+        assert utils_native.start_office_server() is False
+    ok, msg = server.convert(str(tmp_path / "a.xlsx"), str(tmp_path / "a.pdf"))
+    assert not ok and "unavailable" in msg
+    assert len(server.launches_seen) == 1
+
+def test_retry_after_window_or_forced(server, monkeypatch):
+    utils_native.start_office_server()
+    wait_for_warm_up()
+
+    assert utils_native.start_office_server(force=True) is True
+    wait_for_warm_up()
+    assert len(server.launches_seen) == 2
+
+    monkeypatch.setattr(utils_native, "LO_RETRY_AFTER", 0)
+    assert not server.retry_pending()
+    assert utils_native.start_office_server() is True
+    wait_for_warm_up()
+    assert len(server.launches_seen) == 3
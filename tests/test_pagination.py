@@ -0,0 +1,36 @@
+import pytest
+
+import database as db
+
+def collect(fetch, column, **kwargs):
+    seen, cursor = [], None
+    while True:
+        page, cursor = fetch(cursor, **kwargs)
+        seen.extend(page[column])
+        if cursor is None:
+            return seen
+
+@pytest.mark.parametrize("sort", db.PAGE_SORT_KEYS)
+def test_invoice_pages_cover_every_row_once(baseline_db, sort):
+    db.init_db()
+    assert collect(db.get_invoices_page, 'invoice_no', page_size=2, sort=sort, deleted=None) == ["INV/9", "502", "501"]
+    assert collect(db.get_invoices_page, 'invoice_no', page_size=1, sort=sort, descending=False) == ["501", "INV/9"]
+
+def test_invoice_page_filters(baseline_db):
+    db.init_db()
+    assert collect(db.get_invoices_page, 'invoice_no', deleted=True) == ["502"]
+    assert collect(db.get_invoices_page, 'invoice_no', supplier_name="Beta Mills") == ["INV/9"]
+    assert collect(db.get_invoices_page, 'invoice_no', date_from="2024-04-11", deleted=None) == ["INV/9", "502"]
+
+def test_challan_pages_with_equal_dates(baseline_db):
+    db.init_db()
+    assert db.add_challans_bulk("104", "2024-04-05", 1, [{'material_id': 1, 'quantity': 5}, {'material_id': 1, 'quantity': 6}])
+    # Three challans share 2024-04-05: the id tie-break keeps them all
+    got = collect(db.get_challans_page, 'challan_no', page_size=2)
+    assert got == ["B-7", "104", "104", "103", "102", "101"]
+    assert collect(db.get_challans_page, 'challan_no', page_size=2, status="Pending") == ["104", "104", "103"]
+
+def test_unknown_sort_key(db_file):
+    db.init_db()
+    with pytest.raises(ValueError):
+        db.get_invoices_page(sort="total_amount")
@@ -0,0 +1,67 @@
+import datetime
+
+import pytest
+from fpdf import FPDF
+from PIL import Image
+
+import utils_pdf
+
+CREATED = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+
+@pytest.fixture
+def background(tmp_path):
+    path = tmp_path / "bg.png"
+    Image.new("RGB", (210, 297), (240, 230, 200)).save(path)
+    utils_pdf.clear_background_cache()
+    yield str(path)
+    utils_pdf.clear_background_cache()
+
+@pytest.fixture
+def decodes(monkeypatch):
+    calls = []
+    get_img_info = utils_pdf.get_img_info
+
+    def counting(*args, **kwargs):
+        calls.append(args[0])
+        return get_img_info(*args, **kwargs)
+
+    monkeypatch.setattr(utils_pdf, "get_img_info", counting)
+    return calls
+
+class StockPDF(FPDF):
+    """The header PDF used before the cache: fpdf's own image loading on every page."""
+    def __init__(self, background_image):
+        super().__init__()
+        self.background_image = background_image
+
+    def header(self):
+        self.image(self.background_image, x=0, y=0, w=210, h=297)
+
+def render(pdf, pages=3):
+    pdf.set_creation_date(CREATED)
+    pdf.set_font("Helvetica", size=12)
+    for n in range(pages):
+        pdf.add_page()
+        pdf.cell(text=f"Page {n + 1}")
+    return bytes(pdf.output())
+
+def test_output_matches_stock_image_handling(background):
+    assert render(utils_pdf.PDF(background_image=background)) == render(StockPDF(background))
+
+def test_decoded_once_and_embedded_once_per_document(background, decodes):
+    first = render(utils_pdf.PDF(background_image=background))
+    second = render(utils_pdf.PDF(background_image=background))
+    assert len(decodes) == 1
+    assert first == second
+    assert first.count(b"/Subtype /Image") == 1
+
+def test_changed_file_is_decoded_again(background, decodes):
+    render(utils_pdf.PDF(background_image=background))
+    Image.new("RGB", (105, 148), (0, 0, 0)).save(background)
+    pdf = render(utils_pdf.PDF(background_image=background))
+    assert len(decodes) == 2
+    assert pdf == render(StockPDF(background))
+
+def test_missing_background_is_skipped(tmp_path):
+    pdf = render(utils_pdf.PDF(background_image=str(tmp_path / "missing.png")))
+    assert b"/Subtype /Image" not in pdf
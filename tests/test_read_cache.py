@@ -0,0 +1,60 @@
+import threading
+
+import database as db
+
+def run_in_thread(fn, *args):
+    thread = threading.Thread(target=fn, args=args)
+    thread.start()
+    thread.join()
+
+def stats():
+    s = db.get_read_cache_stats()
+    return s['hits'], s['misses']
+
+def test_repeated_read_is_a_hit(db_file):
+    db.init_db()
+    db.add_supplier("Alpha", "", "", "")
+    before = stats()
+    db.get_suppliers()
+    db.get_suppliers()
+    hits, misses = stats()
+    assert (hits - before[0], misses - before[1]) == (1, 1)
+
+def test_write_from_another_thread_invalidates(db_file):
+    db.init_db()
+    assert list(db.get_suppliers()['name']) == []
+    generation = db.get_write_generation()
+
+    run_in_thread(db.add_supplier, "Alpha", "", "", "")
+    assert db.get_write_generation() > generation
+    assert list(db.get_suppliers()['name']) == ["Alpha"]
+
+def test_write_during_a_read_is_not_cached(db_file, monkeypatch):
+    db.init_db()
+    read_sql = db.pd.read_sql
+
+    def read_then_race(*args, **kwargs):
+        df = read_sql(*args, **kwargs)
+        run_in_thread(db.add_supplier, "Alpha", "", "", "")
+        return df
+
+    monkeypatch.setattr(db.pd, "read_sql", read_then_race)
+    assert list(db.get_suppliers()['name']) == []
+    monkeypatch.setattr(db.pd, "read_sql", read_sql)
+    # The result read before the write was not stored
+    assert list(db.get_suppliers()['name']) == ["Alpha"]
+
+def test_reads_do_not_invalidate(db_file):
+    db.init_db()
+    db.get_materials()
+    generation = db.get_write_generation()
+    db.get_suppliers()
+    db.get_invoice_history()
+    assert db.get_write_generation() == generation
+
+def test_cached_result_is_a_copy(db_file):
+    db.init_db()
+    db.add_supplier("Alpha", "", "", "")
+    df = db.get_suppliers()
+    df.loc[0, 'name'] = "Changed"
+    assert list(db.get_suppliers()['name']) == ["Alpha"]
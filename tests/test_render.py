@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+import utils_native
+import utils_render
+
+INVOICE = {
+    'invoice_no': "601", 'date': "2025-01-02", 'supplier_name': "Acme Textiles",
+    'supplier_address': "1 Mill Road\nSurat", 'supplier_gst': "24ABCDE1234F1Z5",
+    'challan_no': "11, 12", 'challan_date': "2025-01-01", 'order_no': "O9", 'order_date': "2025-01-01",
+    'items': [{'material': f"Cloth {i}", 'qty': 10.0, 'rate': 12.5, 'base_amount': 125.0,
+               'cgst': 3.125, 'sgst': 3.125, 'total': 131.25} for i in range(3)],
+    'base_amount': 375.0, 'cgst': 9.375, 'sgst': 9.375, 'total': 393.75,
+}
+CHALLAN = {
+    'challan_no': "77", 'date': "2025-01-01", 'supplier': "Acme Textiles", 'supplier_gst': "24ABCDE1234F1Z5",
+    'order_no': "O9", 'items': [{'material': "Cloth", 'quantity': 10}, {'material': "Silk", 'quantity': 5}],
+}
+
+@pytest.fixture
+def no_office(monkeypatch):
+    def convert_many(*args, **kwargs):
+        raise AssertionError("convert_many must not run on the native path")
+
+    monkeypatch.setattr(utils_native, "libreoffice_available", lambda: False)
+    monkeypatch.setattr(utils_native, "convert_many", convert_many)
+
+def jobs():
+    return [utils_render.invoice_job(INVOICE), utils_render.challan_job(CHALLAN),
+            utils_render.invoice_job(dict(INVOICE, invoice_no="602"))]
+
+def test_workers_draw_native_pdfs_without_libreoffice(tmp_path, no_office):
+    done = []
+    results = utils_render.render_jobs(jobs(), out_dir=tmp_path, workers=2,
+                                       progress=lambda ok, failed: done.append((ok, failed)))
+    assert [r['name'] for r in results] == ["601_Acme_Textiles", "77_Acme_Textiles", "602_Acme_Textiles"]
+    for r in results:
+        assert r['ok'] and r['error'] is None
+        assert os.path.exists(r['xlsx'])
+        with open(r['pdf'], "rb") as f:
+            assert f.read(5) == b"%PDF-"
+    assert done[-1] == (3, 0)
+
+def test_excel_only(tmp_path, no_office):
+    results = utils_render.render_jobs(jobs()[:1], out_dir=tmp_path, workers=1, pdf=False)
+    assert results[0]['ok'] and results[0]['pdf'] is None
+    assert os.listdir(tmp_path) == ["601_Acme_Textiles.xlsx"]
+
+def test_failed_job_is_reported(tmp_path, no_office):
+    items = [dict(INVOICE['items'][0])]
+    del items[0]['material']
+    broken = utils_render.invoice_job(dict(INVOICE, invoice_no="603", items=items))
+    results = utils_render.render_jobs([broken] + jobs()[:1], out_dir=tmp_path, workers=2)
+    assert not results[0]['ok'] and "Excel fill failed" in results[0]['error']
+    assert results[1]['ok']
+
+def test_office_path_falls_back_per_file(tmp_path, monkeypatch):
+    def convert_many(paths, out_dir, pool_size=2):
+        return {p: (False, "LibreOffice not found") for p in paths}
+
+    monkeypatch.setattr(utils_native, "convert_many", convert_many)
+    results = utils_render.render_jobs(jobs()[:2], out_dir=tmp_path, workers=2, native_pdf=False)
+    assert all(r['ok'] and os.path.exists(r['pdf']) for r in results)
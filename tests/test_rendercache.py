@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+import utils_excel as xls_gen
+import utils_rendercache as rc
+
+DATA = {'invoice_no': "601", 'total': 393.75, 'items': [{'material': "Cloth", 'qty': 10.0}]}
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(rc, "CACHE_DIR", str(tmp_path / "render"))
+    monkeypatch.setattr(rc, "_index", None)
+    monkeypatch.setattr(rc, "_stats", {'hits': 0, 'misses': 0, 'evictions': 0})
+    return tmp_path / "render"
+
+class Renderer:
+    def __init__(self, content=b"%PDF-1"):
+        self.calls = 0
+        self.content = content
+
+    def __call__(self):
+        self.calls += 1
+        return self.content
+
+def test_miss_then_hit():
+    render = Renderer()
+    assert rc.get_or_render('invoice', DATA, 'pdf', render) == b"%PDF-1"
+    assert rc.get_or_render('invoice', dict(DATA), 'pdf', render) == b"%PDF-1"
+    assert render.calls == 1
+    stats = rc.get_stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 1, 1)
+
+@pytest.mark.parametrize("kind, data, ext, variant", [
+    ('invoice', dict(DATA, total=393.76), 'pdf', None),   # data changed
+    ('challan', DATA, 'pdf', None),                        # other document kind
+    ('invoice', DATA, 'xlsx', None),                       # other format
+    ('invoice', DATA, 'pdf', "native:1"),                  # other engine
+])
+def test_any_input_change_misses(kind, data, ext, variant):
+    render = Renderer()
+    rc.get_or_render('invoice', DATA, 'pdf', render)
+    rc.get_or_render(kind, data, ext, render, variant=variant)
+    assert render.calls == 2
+
+def test_template_change_misses(monkeypatch):
+    render = Renderer()
+    rc.get_or_render('invoice', DATA, 'pdf', render)
+    monkeypatch.setattr(xls_gen, "template_version", lambda path: "edited")
+    rc.get_or_render('invoice', DATA, 'pdf', render)
+    assert render.calls == 2
+
+def test_failed_render_is_not_cached():
+    render = Renderer(content=None)
+    assert rc.get_or_render('invoice', DATA, 'pdf', render) is None
+    assert rc.get_or_render('invoice', DATA, 'pdf', render) is None
+    assert render.calls == 2
+    assert rc.get_stats()['entries'] == 0
+
+def test_deleted_file_is_a_miss():
+    key = rc.render_key('invoice', DATA)
+    rc.put(key, 'pdf', b"%PDF-1")
+    os.remove(rc._path(key, 'pdf'))
+    assert rc.get(key, 'pdf') is None
+    assert rc.get_stats()['entries'] == 0
+
+def test_least_recently_used_evicted(monkeypatch):
+    monkeypatch.setattr(rc, "MAX_BYTES", 25)
+    keys = [rc.render_key('invoice', dict(DATA, invoice_no=str(n))) for n in range(3)]
+    rc.put(keys[0], 'pdf', b"a" * 10)
+    rc.put(keys[1], 'pdf', b"b" * 10)
+    os.utime(rc._path(keys[0], 'pdf'), (1, 1))
+    os.utime(rc._path(keys[1], 'pdf'), (2, 2))
+    rc.put(keys[2], 'pdf', b"c" * 10)
+    assert rc.get(keys[0], 'pdf') is None
+    assert rc.get(keys[1], 'pdf') == b"b" * 10
+    assert rc.get_stats()['evictions'] == 1
@@ -0,0 +1,61 @@
+import threading
+from datetime import date
+
+import database as db
+
+def test_seeded_after_highest_numeric_number(baseline_db):
+    db.init_db()
+    # "INV/9" and "B-7" are not numeric; deleted invoice 502 still counts
+    assert db.peek_next_number(db.INVOICE_SERIES) == "503"
+    assert db.peek_next_number(db.CHALLAN_SERIES) == "104"
+    assert db.get_last_invoice_no() == 502
+
+def test_new_database_starts_at_501(db_file):
+    db.init_db()
+    assert db.peek_next_number(db.INVOICE_SERIES) == str(db.INVOICE_START_NO)
+
+def test_concurrent_reservations_are_unique(db_file):
+    db.init_db()
+    numbers = []
+
+    def reserve():
+        for _ in range(20):
+            numbers.append(db.reserve_next_number(db.INVOICE_SERIES))
+
+    threads = [threading.Thread(target=reserve) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(map(int, numbers)) == list(range(501, 581))
+
+def test_reserve_inside_a_session_joins_its_transaction(db_file):
+    db.init_db()
+    try:
+        with db.db_session():
+            assert db.reserve_next_number(db.INVOICE_SERIES) == "501"
+            raise RuntimeError("save failed")
+    except RuntimeError:
+        pass
+    assert db.peek_next_number(db.INVOICE_SERIES) == "501"
+
+def test_release_rewinds_only_the_latest(baseline_db):
+    db.init_db()
+    first = db.reserve_next_number(db.INVOICE_SERIES)
+    second = db.reserve_next_number(db.INVOICE_SERIES)
+    assert (first, second) == ("503", "504")
+    assert db.release_number(db.INVOICE_SERIES, first) is False
+    assert db.release_number(db.INVOICE_SERIES, second) is True
+    assert db.peek_next_number(db.INVOICE_SERIES) == "504"
+
+def test_manual_number_advances_series(baseline_db):
+    db.init_db()
+    assert db.save_invoice("600", "2024-05-01", 10, 200, 18, 18, 236, [3])
+    assert db.peek_next_number(db.INVOICE_SERIES) == "601"
+
+def test_financial_year_series(db_file):
+    db.init_db()
+    series, prefix = db.financial_year_series("invoice", date(2026, 3, 31))
+    assert (series, prefix) == ("invoice:2025-26", "2025-26/")
+    assert db.reserve_next_number(series, prefix) == "2025-26/1"
+    assert db.reserve_next_number(series, prefix) == "2025-26/2"
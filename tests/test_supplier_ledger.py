@@ -0,0 +1,36 @@
+import database as db
+from conftest import query
+
+def ledger():
+    return query("""SELECT supplier_id, billed, paid, balance, invoice_count, last_activity
+                    FROM supplier_ledger ORDER BY supplier_id""")
+
+def test_backfilled_from_history(baseline_db):
+    db.init_db()
+    # Deleted invoice 502 is not billed
+    assert ledger() == [
+        (1, 1770, 1000, 770, 1, "2024-04-20"),
+        (2, 354, 54, 300, 1, "2024-04-12"),
+    ]
+
+def test_triggers_keep_it_current(baseline_db):
+    db.init_db()
+    assert db.save_invoice("503", "2024-05-01", 10, 200, 18, 18, 236, [3])
+    inv_id = query("SELECT id FROM invoices WHERE invoice_no = '503'")[0][0]
+    assert db.get_supplier_balance("Alpha Textiles") == (2006, 1000, 1006)
+
+    assert db.delete_invoice(inv_id)
+    assert db.get_supplier_balance("Alpha Textiles") == (1770, 1000, 770)
+
+    assert db.restore_invoice(inv_id)[0]
+    assert db.get_supplier_balance("Alpha Textiles") == (2006, 1000, 1006)
+
+    assert db.add_payment("2024-05-02", 1, 6, "Cash", None, None)
+    assert db.get_supplier_balance("Alpha Textiles") == (2006, 1006, 1000)
+    assert ledger()[0][4:] == (2, "2024-05-02")
+
+def test_new_supplier_gets_a_row(db_file):
+    db.init_db()
+    assert db.add_supplier("Gamma", "", "", "")
+    assert db.get_supplier_balance("Gamma") == (0, 0, 0)
+    assert list(db.get_supplier_ledger(sort_by="name")['name']) == ["Gamma"]
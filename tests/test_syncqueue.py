@@ -0,0 +1,162 @@
+import pytest
+from openpyxl import load_workbook
+
+import database as db
+import utils_excel as xls_gen
+import utils_syncqueue as sq
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch, db_file):
+    """An isolated queue (own QUEUE_DB, no worker thread) with a recording upload handler."""
+    monkeypatch.setattr(sq, "QUEUE_DB", str(tmp_path / "sync_queue.db"))
+    monkeypatch.setattr(sq, "SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+    monkeypatch.setattr(sq, "_queued_generation", {})
+    monkeypatch.setattr(sq, "_builders", {})
+    q = sq.SyncQueue()
+    monkeypatch.setattr(sq, "_sync_queue", q)
+    q.uploads = []
+
+    def handler(path, subfolder, dest_filename):
+        with open(path, "rb") as f:
+            q.uploads.append((subfolder, dest_filename, f.read()))
+        return True
+
+    q.handler = handler
+    return q
+
+def drain(q):
+    """Process every due job, like the worker loop."""
+    while True:
+        job, _ = q._next_job()
+        if job is None:
+            return
+        q._process(*job[:6])
+
+def test_master_ledger_built_by_the_worker(queue, tmp_path):
+    db.init_db()
+    master = str(tmp_path / "Master_Sales.xlsx")
+    builds = []
+
+    def build():
+        builds.append(1)
+        return xls_gen.write_master_ledger(db.iter_sales_ledger(), db.SALES_LEDGER_COLUMNS, master)
+
+    sq.register_builder(master, build)
+    db.add_supplier("Alpha", "", "", "")
+    db.add_material("Cotton", "Meters")
+    db.add_challans_bulk("1", "2024-04-01", 1, [{'material_id': 1, 'quantity': 10}])
+    assert db.save_invoice("501", "2024-04-02", 10, 100, 2.5, 2.5, 105, [1])
+    # Queued after each save; nothing is written until the worker gets to it
+    assert sq.enqueue_on_change(master, "Master", db.get_write_generation())
+    assert builds == []
+
+    drain(queue)
+    assert builds == [1]
+    assert [u[0] for u in queue.uploads] == ["Master"]
+    ws = load_workbook(master).active
+    assert [c.value for c in ws[2]][:3] == ["501", "2024-04-02", "Alpha"]
+
+def pending():
+    with sq._queue_session() as conn:
+        return conn.execute("SELECT target, version, attempts, last_error FROM sync_jobs ORDER BY id").fetchall()
+
+def write(path, content):
+    with open(path, "w") as f:
+        f.write(content)
+    return str(path)
+
+def test_requeued_target_coalesces_to_latest_file(queue, tmp_path):
+    src = write(tmp_path / "inv.xlsx", "v1")
+    sq.enqueue(src, "Invoice_Excel")
+    write(src, "v2")
+    sq.enqueue(src, "Invoice_Excel")
+    assert pending() == [("Invoice_Excel/inv.xlsx", 2, 0, None)]
+
+    drain(queue)
+    assert queue.uploads == [("Invoice_Excel", None, b"v2")]
+    assert pending() == []
+
+def test_requeued_during_upload_stays_pending(queue, tmp_path):
+    src = write(tmp_path / "inv.xlsx", "v1")
+    upload = queue.handler
+
+    def handler(path, subfolder, dest_filename):
+        write(src, "v2")
+        sq.enqueue(src, subfolder)  # a newer save lands mid-upload
+        return upload(path, subfolder, dest_filename)
+
+    queue.handler = handler
+    sq.enqueue(src, "Invoice_Excel")
+    job, _ = queue._next_job()
+    queue._process(*job[:6])
+    assert pending() == [("Invoice_Excel/inv.xlsx", 2, 0, None)]
+
+    queue.handler = upload
+    drain(queue)
+    assert len(queue.uploads) == 2 and queue.uploads[-1][2] == b"v2"
+    assert pending() == []
+
+def test_failures_back_off_until_retry(queue, tmp_path, monkeypatch):
+    src = write(tmp_path / "inv.pdf", "pdf")
+    queue.handler = lambda *args: False
+    monkeypatch.setattr(sq.random, "uniform", lambda a, b: 1.0)
+
+    sq.enqueue(src, "Invoice_PDF")
+    started = sq.time.time()
+    drain(queue)  # fails once, then the job is no longer due
+    assert pending() == [("Invoice_PDF/inv.pdf", 1, 1, "Upload failed")]
+    job, wait = queue._next_job()
+    assert job is None and sq.BACKOFF_BASE - 1 < wait <= sq.BACKOFF_BASE
+    assert queue.status()['failing'] == 1
+    assert sq.time.time() - started < 1
+
+    queue.retry_now()
+    drain(queue)
+    assert pending()[0][2] == 2
+
+    queue.handler = lambda *args: True
+    queue.retry_now()
+    drain(queue)
+    assert pending() == []
+    assert queue.status()['uploaded'] == 1
+
+def test_backoff_doubles_up_to_the_cap(monkeypatch):
+    monkeypatch.setattr(sq.random, "uniform", lambda a, b: 1.0)
+    assert [sq.backoff_delay(n) for n in range(1, 5)] == [sq.BACKOFF_BASE * 2 ** i for i in range(4)]
+    assert sq.backoff_delay(30) == sq.BACKOFF_MAX
+    monkeypatch.setattr(sq.random, "uniform", lambda a, b: b)
+    assert sq.backoff_delay(30) == pytest.approx(sq.BACKOFF_MAX * 1.1)
+
+def test_handler_error_is_retried(queue, tmp_path):
+    src = write(tmp_path / "inv.pdf", "pdf")
+
+    def offline(*args):
+        raise OSError("network unreachable")
+
+    queue.handler = offline
+    sq.enqueue(src, "Invoice_PDF")
+    drain(queue)
+    assert pending() == [("Invoice_PDF/inv.pdf", 1, 1, "network unreachable")]
+
+def test_missing_file_is_dropped(queue, tmp_path):
+    sq.enqueue(str(tmp_path / "gone.pdf"), "Invoice_PDF")
+    drain(queue)
+    assert pending() == [] and queue.uploads == []
+    assert queue.status()['dropped'] == 1
+
+def test_database_queued_once_per_write_and_sent_as_snapshot(queue):
+    db.init_db()
+    generation = db.get_write_generation()
+    assert sq.enqueue_on_change(db.DB_FILE, "Database", generation)
+    assert not sq.enqueue_on_change(db.DB_FILE, "Database", generation)
+    # Queue bookkeeping lives in its own file: no data write
+    assert db.get_write_generation() == generation
+
+    db.add_supplier("Alpha", "", "", "")
+    assert sq.enqueue_on_change(db.DB_FILE, "Database", db.get_write_generation())
+    assert len(pending()) == 1
+
+    drain(queue)
+    (subfolder, dest_filename, content), = queue.uploads
+    assert (subfolder, dest_filename) == ("Database", "autobiller.db")
+    assert content.startswith(b"SQLite format 3")
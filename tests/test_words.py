@@ -0,0 +1,79 @@
+import math
+from decimal import Decimal
+
+import pytest
+
+from utils_words import _paise_in_words, amount_in_words, number_to_words, to_paise
+
+
+@pytest.mark.parametrize("n, words", [
+    (0, "Zero"),
+    (15, "Fifteen"),
+    (99, "Ninety-Nine"),
+    (100, "One Hundred"),
+    (105, "One Hundred And Five"),
+    (1005, "One Thousand And Five"),
+    (100100, "One Lakh, One Hundred"),
+    (1234567, "Twelve Lakh, Thirty-Four Thousand, Five Hundred And Sixty-Seven"),
+    (1000000000, "One Hundred Crore"),
+])
+def test_number_to_words(n, words):
+    assert number_to_words(n) == words
+
+
+def test_whole_rupees_keep_the_old_wording():
+    # No "Rupees" prefix: invoices have always printed "<words> Only"
+    assert amount_in_words(1050) == "One Thousand And Fifty Only"
+    assert amount_in_words(1050.0) == "One Thousand And Fifty Only"
+    assert amount_in_words("1050") == "One Thousand And Fifty Only"
+
+
+def test_rupees_and_paise():
+    assert amount_in_words(656.25) == "Six Hundred And Fifty-Six Rupees And Twenty-Five Paise Only"
+    assert amount_in_words(Decimal("1.01")) == "One Rupees And One Paise Only"
+
+
+def test_paise_only():
+    assert amount_in_words(0.5) == "Fifty Paise Only"
+
+
+def test_negative_amount():
+    assert amount_in_words(-12.5) == "Minus Twelve Rupees And Fifty Paise Only"
+
+
+@pytest.mark.parametrize("amount, paise", [
+    (0.005, 1),        # half a paisa rounds up
+    (0.004, 0),
+    (2.675, 268),      # float 2.675 is 2.67499...; str() keeps the typed value
+    (1050.999, 105100),
+    (-0.005, -1),      # half-up is away from zero
+])
+def test_to_paise_rounds_half_up(amount, paise):
+    assert to_paise(amount) == paise
+
+
+def test_rounding_to_whole_rupee_drops_paise():
+    assert amount_in_words(99.995) == "One Hundred Only"
+
+
+@pytest.mark.parametrize("amount", [math.nan, math.inf, "", "abc", None, [1050], {'total': 1}])
+def test_non_numbers_fall_back(amount):
+    assert amount_in_words(amount) == f"{amount} Only"
+
+def test_memo_is_keyed_by_paise():
+    _paise_in_words.cache_clear()
+    for amount in (1050, 1050.0, "1050", Decimal("1050.00"), 1050.004):
+        assert amount_in_words(amount) == "One Thousand And Fifty Only"
+    assert _paise_in_words.cache_info().currsize == 1
+
+def test_fallback_pdf_keeps_rupees_prefix(monkeypatch):
+    import utils_pdf
+
+    lines = []
+    monkeypatch.setattr(utils_pdf.PDF, "multi_cell", lambda self, w, h, text, *a, **k: lines.append(text))
+    invoice = {'invoice_no': "601", 'date': "2025-01-02", 'supplier_name': "Acme", 'supplier_address': "",
+               'supplier_gst': "", 'challan_no': "11", 'challan_date': "", 'order_no': "", 'order_date': "",
+               'items': [{'material': "Cloth", 'qty': 10, 'rate': 100, 'base_amount': 1000}], 'base_amount': 1000.0, 'cgst': 25.0, 'sgst': 25.0, 'total': 1050.0}
+    # The default layout has no "gst_rate" column position; supply one
+    utils_pdf.generate_invoice_pdf(invoice, layout_config={"gst_rate": (150, 155)})
+    assert "Rupees One Thousand And Fifty Only" in lines
@@ -0,0 +1,181 @@
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+# Opt-in: off unless AUTOBILLER_DB_STATS=1 or enable() is called (Settings page).
+# Latency histogram bucket upper bounds, in milliseconds.
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, float("inf"))
+DEFAULT_SLOW_MS = 100
+DEFAULT_LOG_PATH = "logs/slow_queries.log"
+SLOW_LOG_KEEP = 200
+
+_lock = threading.Lock()
+_state = {
+    'enabled': os.environ.get("AUTOBILLER_DB_STATS") == "1",
+    'slow_ms': float(os.environ.get("AUTOBILLER_SLOW_MS", DEFAULT_SLOW_MS)),
+    'log_path': os.environ.get("AUTOBILLER_SLOW_LOG", DEFAULT_LOG_PATH),
+}
+_func_stats = {}
+_slow_queries = deque(maxlen=SLOW_LOG_KEEP)
+
+def enable(slow_ms=None, log_path=None):
+    """Start collecting stats. slow_ms: threshold for the slow-query log."""
+    if slow_ms is not None:
+        _state['slow_ms'] = float(slow_ms)
+    if log_path is not None:
+        _state['log_path'] = log_path
+    _state['enabled'] = True
+
+def disable():
+    _state['enabled'] = False
+
+def is_enabled():
+    return _state['enabled']
+
+def get_slow_ms():
+    return _state['slow_ms']
+
+def reset():
+    with _lock:
+        _func_stats.clear()
+        _slow_queries.clear()
+
+def _bucket_index(ms):
+    for i, bound in enumerate(BUCKETS_MS):
+        if ms <= bound:
+            return i
+    return len(BUCKETS_MS) - 1
+
+def _record(name, ms, rows, failed):
+    with _lock:
+        st = _func_stats.get(name)
+        if st is None:
+            st = _func_stats[name] = {
+                'calls': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                'rows': 0, 'histogram': [0] * len(BUCKETS_MS)
+            }
+        st['calls'] += 1
+        st['errors'] += int(failed)
+        st['total_ms'] += ms
+        st['max_ms'] = max(st['max_ms'], ms)
+        st['rows'] += rows
+        st['histogram'][_bucket_index(ms)] += 1
+
+def _row_count(result):
+    """Rows returned by a data-layer function (DataFrame, tuple of DataFrames, list)."""
+    if hasattr(result, "shape"):
+        return result.shape[0]
+    if isinstance(result, tuple):
+        # (invoices, challans) or (page, next_cursor)
+        return sum(r.shape[0] for r in result if hasattr(r, "shape"))
+    if isinstance(result, list):
+        return len(result)
+    return 0
+
+def timed(func):
+    """Record call count, latency histogram and row count for a data-layer function."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _state['enabled']:
+            return func(*args, **kwargs)
+        start = time.perf_counter()
+        failed = True
+        result = None
+        try:
+            result = func(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            _record(func.__name__, (time.perf_counter() - start) * 1000, _row_count(result), failed)
+    return wrapper
+
+def get_stats():
+    """Per-function stats: {name: {calls, errors, total_ms, avg_ms, max_ms, rows, histogram}}."""
+    with _lock:
+        out = {}
+        for name, st in _func_stats.items():
+            out[name] = dict(st, histogram=list(st['histogram']),
+                             avg_ms=st['total_ms'] / st['calls'] if st['calls'] else 0.0)
+        return out
+
+def get_stats_rows():
+    """Flat rows (one per function, slowest total first) for display."""
+    labels = [f"<={int(b)}ms" if b != float("inf") else f">{int(BUCKETS_MS[-2])}ms" for b in BUCKETS_MS]
+    rows = []
+    for name, st in get_stats().items():
+        row = {
+            'function': name, 'calls': st['calls'], 'errors': st['errors'],
+            'avg_ms': round(st['avg_ms'], 2), 'max_ms': round(st['max_ms'], 2),
+            'total_ms': round(st['total_ms'], 1), 'rows': st['rows']
+        }
+        row.update(zip(labels, st['histogram']))
+        rows.append(row)
+    return sorted(rows, key=lambda r: r['total_ms'], reverse=True)
+
+def get_slow_queries():
+    """Most recent slow queries (newest last)."""
+    with _lock:
+        return list(_slow_queries)
+
+def _log_slow(conn, sql, params, ms):
+    try:
+        plan = [row[-1] for row in sqlite3.Connection.execute(conn, f"EXPLAIN QUERY PLAN {sql}", params or ())]
+    except sqlite3.Error as e:
+        plan = [f"(no plan: {e})"]
+    entry = {
+        'time': datetime.now().isoformat(timespec="seconds"),
+        'ms': round(ms, 2),
+        'sql': " ".join(sql.split()),
+        'params': [repr(p) for p in (params or ())][:20],
+        'plan': plan
+    }
+    with _lock:
+        _slow_queries.append(entry)
+    try:
+        log_path = _state['log_path']
+        os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+        with open(log_path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+    except OSError as e:
+        print(f"Slow Log Error: {e}")
+
+def _check_slow(conn, sql, params, start):
+    ms = (time.perf_counter() - start) * 1000
+    if ms >= _state['slow_ms']:
+        _log_slow(conn, sql, params, ms)
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that feeds the slow-query log when instrumentation is on."""
+    def execute(self, sql, params=()):
+        if not _state['enabled']:
+            return super().execute(sql, params)
+        start = time.perf_counter()
+        result = super().execute(sql, params)
+        _check_slow(self.connection, sql, params, start)
+        return result
+
+    def executemany(self, sql, seq_of_params):
+        if not _state['enabled']:
+            return super().executemany(sql, seq_of_params)
+        start = time.perf_counter()
+        result = super().executemany(sql, seq_of_params)
+        ms = (time.perf_counter() - start) * 1000
+        if ms >= _state['slow_ms']:
+            _log_slow(self.connection, sql, (), ms)
+        return result
+
+class TimedConnection(sqlite3.Connection):
+    """sqlite3 connection factory whose cursors are TimedCursor."""
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
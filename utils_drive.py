@@ -1,11 +1,30 @@
 import streamlit as st
+import json
 import os
+import threading
+import httplib2
+import google_auth_httplib2
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaFileUpload
 
 # Scopes required
 SCOPES = ['https://www.googleapis.com/auth/drive']
+ROOT_FOLDER = "AutoBiller_Data"
+FOLDER_MIME = 'application/vnd.google-apps.folder'
+
+# Small files go up as one multipart request; resumable needs at least two
+RESUMABLE_THRESHOLD = 5 * 1024 * 1024
+
+# --- Cached Client ---
+# Credentials and the discovery client are built once per process. httplib2
+# is not thread-safe, so every thread executes requests on its own
+# authorized Http object.
+_service_lock = threading.Lock()
+_service = None
+_creds = None
+_local = threading.local()
 
 def authenticate():
     """Authenticate using Service Account from Streamlit Secrets."""
@@ -20,92 +39,226 @@ def authenticate():
         return None
 
 def get_drive_service():
-    """Build the Drive Service."""
-    creds = authenticate()
-    if creds:
-        return build('drive', 'v3', credentials=creds)
-    return None
+    """The process-wide Drive Service (None if authentication fails; retried next call)."""
+    global _service, _creds
+    with _service_lock:
+        if _service is None:
+            creds = authenticate()
+            if creds:
+                _service = build('drive', 'v3', credentials=creds, cache_discovery=False)
+                _creds = creds
+        return _service
+
+def reset_drive_service():
+    """Drop the cached client (e.g. after the secrets changed)."""
+    global _service, _creds
+    with _service_lock:
+        _service = None
+        _creds = None
+    _local.http = None
+
+def _execute(request):
+    """Run an API request on this thread's own authorized Http."""
+    http = getattr(_local, "http", None)
+    if http is None or http.credentials is not _creds:
+        http = _local.http = google_auth_httplib2.AuthorizedHttp(_creds, http=httplib2.Http())
+    return request.execute(http=http)
+
+def _is_not_found(error):
+    return isinstance(error, HttpError) and error.resp.status == 404
+
+def _quote(value):
+    """Escape a name for a Drive query string literal."""
+    return str(value).replace("\\", "\\\\").replace("'", "\\'")
+
+# --- Persisted ID Maps ---
+# folder path -> folder ID and "<folder ID>/<file name>" -> file ID, so a
+# steady-state upload is a single update call. Entries are dropped when
+# Drive answers 404 (deleted/moved by hand) or reports the file trashed, and
+# looked up again.
+ID_CACHE_PATH = os.environ.get("AUTOBILLER_DRIVE_ID_CACHE",
+                               os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "drive_ids.json"))
+_ids_lock = threading.Lock()
+_ids = None
+
+def _load_ids():
+    global _ids
+    if _ids is None:
+        try:
+            with open(ID_CACHE_PATH, encoding="utf-8") as f:
+                _ids = json.load(f)
+        except (OSError, ValueError):
+            _ids = {}
+        _ids.setdefault('folders', {})
+        _ids.setdefault('files', {})
+    return _ids
+
+def _save_ids():
+    try:
+        os.makedirs(os.path.dirname(ID_CACHE_PATH), exist_ok=True)
+        tmp = f"{ID_CACHE_PATH}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(_ids, f, indent=1, sort_keys=True)
+        os.replace(tmp, ID_CACHE_PATH)
+    except OSError as e:
+        print(f"Drive ID Cache Error: {e}")
 
+def _get_id(kind, key):
+    with _ids_lock:
+        return _load_ids()[kind].get(key)
+
+def _set_id(kind, key, value):
+    with _ids_lock:
+        ids = _load_ids()
+        if ids[kind].get(key) != value:
+            ids[kind][key] = value
+            _save_ids()
+
+def _forget_id(kind, key):
+    with _ids_lock:
+        ids = _load_ids()
+        value = ids[kind].pop(key, None)
+        if value is not None:
+            if kind == 'folders':
+                # Subfolders and files under a vanished folder are stale too
+                stale = {value} | {ids['folders'].pop(k) for k in list(ids['folders']) if k.startswith(f"{key}/")}
+                for name in [k for k in ids['files'] if k.split("/", 1)[0] in stale]:
+                    del ids['files'][name]
+            _save_ids()
+
+def clear_id_cache():
+    global _ids
+    with _ids_lock:
+        _ids = {'folders': {}, 'files': {}}
+        _save_ids()
+
+def _file_key(parent_folder_id, file_name):
+    return f"{parent_folder_id}/{file_name}"
+
+# --- API ---
 def get_folder_id(service, folder_name, parent_id=None):
     """Find a folder ID by name. Create if not exists."""
     try:
-        query = f"mimeType='application/vnd.google-apps.folder' and name='{folder_name}' and trashed=false"
+        query = f"mimeType='{FOLDER_MIME}' and name='{_quote(folder_name)}' and trashed=false"
         if parent_id:
             query += f" and '{parent_id}' in parents"
-            
-        results = service.files().list(q=query, fields="files(id, name)").execute()
+
+        results = _execute(service.files().list(q=query, fields="files(id, name)"))
         items = results.get('files', [])
-        
+
         if not items:
             # Create Folder
             file_metadata = {
                 'name': folder_name,
-                'mimeType': 'application/vnd.google-apps.folder'
+                'mimeType': FOLDER_MIME
             }
             if parent_id:
                 file_metadata['parents'] = [parent_id]
-                
-            file = service.files().create(body=file_metadata, fields='id').execute()
+
+            file = _execute(service.files().create(body=file_metadata, fields='id'))
             return file.get('id')
         else:
             return items[0]['id']
-            
+
     except Exception as e:
         print(f"Folder Error ({folder_name}): {e}")
         return None
 
-def upload_file(file_path, parent_folder_id):
+def get_folder_path_id(service, folder_path):
+    """Folder ID for a 'A/B/C' path under My Drive, cached per path, created as needed."""
+    folder_id = _get_id('folders', folder_path)
+    if folder_id:
+        return folder_id
+    parent_path, _, name = folder_path.rpartition("/")
+    parent_id = get_folder_path_id(service, parent_path) if parent_path else None
+    if parent_path and not parent_id:
+        return None
+    folder_id = get_folder_id(service, name, parent_id=parent_id)
+    if folder_id:
+        _set_id('folders', folder_path, folder_id)
+    return folder_id
+
+def _find_file_id(service, file_name, parent_folder_id):
+    query = f"name='{_quote(file_name)}' and '{parent_folder_id}' in parents and trashed=false"
+    items = _execute(service.files().list(q=query, fields="files(id)")).get('files', [])
+    return items[0]['id'] if items else None
+
+def _upload(service, file_path, parent_folder_id):
+    """Update or create file_path in the folder. Raises HttpError (404: folder gone)."""
+    file_name = os.path.basename(file_path)
+    key = _file_key(parent_folder_id, file_name)
+
+    def media():
+        return MediaFileUpload(file_path, resumable=os.path.getsize(file_path) > RESUMABLE_THRESHOLD)
+
+    # Known file: one update call
+    file_id = _get_id('files', key)
+    if file_id:
+        try:
+            result = _execute(service.files().update(fileId=file_id, media_body=media(), fields='id, trashed'))
+            if not result.get('trashed'):
+                print(f"Updated: {file_name}")
+                return True
+            # Trashed by hand: a miss, like the trashed=false lookup below
+        except HttpError as e:
+            if not _is_not_found(e):
+                raise
+        _forget_id('files', key)
+
+    # Check if file exists to update it
+    file_id = _find_file_id(service, file_name, parent_folder_id)
+    if file_id:
+        # Update
+        _execute(service.files().update(fileId=file_id, media_body=media()))
+        print(f"Updated: {file_name}")
+    else:
+        # Create
+        file_metadata = {'name': file_name, 'parents': [parent_folder_id]}
+        file_id = _execute(service.files().create(body=file_metadata, media_body=media(), fields='id')).get('id')
+        print(f"Uploaded: {file_name}")
+    _set_id('files', key, file_id)
+    return True
+
+def upload_file(file_path, parent_folder_id, service=None):
     """Upload or Update a file in the given folder."""
     if not os.path.exists(file_path):
         return False
-        
-    service = get_drive_service()
+
+    service = service or get_drive_service()
     if not service:
         return False
-        
-    file_name = os.path.basename(file_path)
-    
+
     try:
-        # Check if file exists to update it
-        query = f"name='{file_name}' and '{parent_folder_id}' in parents and trashed=false"
-        results = service.files().list(q=query, fields="files(id)").execute()
-        items = results.get('files', [])
-        
-        media = MediaFileUpload(file_path, resumable=True)
-        
-        if items:
-            # Update
-            file_id = items[0]['id']
-            service.files().update(fileId=file_id, media_body=media).execute()
-            print(f"Updated: {file_name}")
-        else:
-            # Create
-            file_metadata = {'name': file_name, 'parents': [parent_folder_id]}
-            service.files().create(body=file_metadata, media_body=media, fields='id').execute()
-            print(f"Uploaded: {file_name}")
-            
-        return True
+        return _upload(service, file_path, parent_folder_id)
     except Exception as e:
-        print(f"Upload Error ({file_name}): {e}")
+        print(f"Upload Error ({os.path.basename(file_path)}): {e}")
         return False
 
 def sync_cloud(file_path, subfolder_name):
     """High Level Sync Function for Cloud."""
+    if not os.path.exists(file_path):
+        return False
     service = get_drive_service()
     if not service:
         return False
-        
-    # 1. Ensure Root "Auto Biller Data" exists
-    root_id = get_folder_id(service, "AutoBiller_Data")
-    
-    if not root_id:
-        return False
-        
-    # 2. Ensure Subfolder exists
-    target_id = get_folder_id(service, subfolder_name, parent_id=root_id)
-    
-    if not target_id:
-        return False
-        
-    # 3. Upload
-    return upload_file(file_path, target_id)
+
+    folder_path = f"{ROOT_FOLDER}/{subfolder_name}"
+    for attempt in range(2):
+        # Ensure "AutoBiller_Data/<subfolder>" exists (cached after the first sync)
+        target_id = get_folder_path_id(service, folder_path)
+        if not target_id:
+            if attempt == 0 and _get_id('folders', ROOT_FOLDER):
+                # Creating the subfolder failed under a cached root that may be gone
+                _forget_id('folders', ROOT_FOLDER)
+                continue
+            return False
+        try:
+            return _upload(service, file_path, target_id)
+        except Exception as e:
+            if attempt == 0 and _is_not_found(e):
+                # A cached folder was deleted on Drive: resolve the path again
+                _forget_id('folders', ROOT_FOLDER)
+                continue
+            print(f"Upload Error ({os.path.basename(file_path)}): {e}")
+            return False
+    return False
@@ -1,14 +1,250 @@
 from openpyxl import load_workbook
-from openpyxl.styles import Font
-import shutil
+from openpyxl.styles import Alignment, Font
+from openpyxl.utils import get_column_letter
+from openpyxl.utils.indexed_list import IndexedList
+import copyreg
+import hashlib
+import io
 import os
-from num2words import num2words
+import pickle
+import threading
+import weakref
+from utils_words import amount_in_words
 
 def apply_style(cell, size=12):
     """Applies Times New Roman with specific size (default 12) to a cell."""
     cell.font = Font(name='Times New Roman', size=size)
 
-def generate_invoice_excel(data, template_path="templates/INVOICE FORMAT2.xlsx", output_path="generated/temp_invoice.xlsx"):
+# --- Template Cache ---
+# Parsing a template with openpyxl is the biggest fixed cost of a render.
+# Each template is parsed once per process and kept as a pickled snapshot;
+# every render unpickles its own private copy (~10x faster than load_workbook).
+# The file's mtime/size is checked on each use so edited templates hot-reload.
+
+def _restore_indexed_list(items, index, clean):
+    lst = IndexedList()
+    list.extend(lst, items)
+    lst._dict = index
+    lst.clean = clean
+    return lst
+
+def _reduce_indexed_list(lst):
+    # Default list pickling re-appends items through IndexedList.append, which
+    # dedups against the shared class-level _dict and drops style entries.
+    return _restore_indexed_list, (list(lst), lst._dict, lst.clean)
+
+class _TemplatePickler(pickle.Pickler):
+    dispatch_table = copyreg.dispatch_table.copy()
+    dispatch_table[IndexedList] = _reduce_indexed_list
+
+# --- Merged Cell Index ---
+# Writing into a merged range must target its top-left cell. Instead of
+# scanning ws.merged_cells.ranges on every write, each sheet gets a
+# {coordinate: anchor} map, built once per template load.
+
+_merge_indexes = weakref.WeakKeyDictionary()
+
+def build_merge_index(ws):
+    """{coordinate: top-left coordinate} for every cell inside a merged range."""
+    index = {}
+    for rng in ws.merged_cells.ranges:
+        anchor = f"{get_column_letter(rng.min_col)}{rng.min_row}"
+        for col in range(rng.min_col, rng.max_col + 1):
+            letter = get_column_letter(col)
+            for row in range(rng.min_row, rng.max_row + 1):
+                index[f"{letter}{row}"] = anchor
+    return index
+
+def get_merge_index(ws):
+    """Merge index for ws (primed by load_template, else built on first use)."""
+    index = _merge_indexes.get(ws)
+    if index is None:
+        index = _merge_indexes[ws] = build_merge_index(ws)
+    return index
+
+def resolve_cell(ws, cell_ref):
+    """Where a write to cell_ref really lands (the merge anchor, or cell_ref itself)."""
+    return get_merge_index(ws).get(cell_ref, cell_ref)
+
+# --- Template Patches ---
+# Fixed adjustments to a template's own content (e.g. shrink the letterhead),
+# applied once when the template is loaded instead of on every render.
+# Keyed by template file name. Each rule scans the given region and applies to
+# cells whose text contains any of 'match'; the first matching rule wins.
+#   size_delta / min_size / default_size: new font size = max(min, size + delta)
+#   wrap: also set wrap_text (vertical top, keep horizontal alignment)
+TEMPLATE_PATCHES = {
+    "INVOICE FORMAT2.xlsx": {
+        'rows': (1, 14),
+        'cols': (1, 12),
+        'rules': [
+            # Company name
+            {'match': ["DIPU ARTS"], 'ignore_case': True, 'size_delta': -2, 'min_size': 8, 'default_size': 20},
+            # Address lines
+            {'match': ["Gala No", "Patil Nagar", "Choudhary"], 'size_delta': -4, 'min_size': 6, 'default_size': 12, 'wrap': True},
+        ],
+    },
+}
+
+def _rule_matches(rule, text):
+    if rule.get('ignore_case'):
+        text = text.upper()
+        return any(m.upper() in text for m in rule['match'])
+    return any(m in text for m in rule['match'])
+
+def apply_template_patch(ws, patch):
+    """Apply one TEMPLATE_PATCHES entry to a worksheet."""
+    for r_idx in range(patch['rows'][0], patch['rows'][1] + 1):
+        for col in range(patch['cols'][0], patch['cols'][1] + 1):
+            cell = ws.cell(row=r_idx, column=col)
+            if not cell.value:
+                continue
+            val_str = str(cell.value)
+            rule = next((rl for rl in patch['rules'] if _rule_matches(rl, val_str)), None)
+            if rule is None:
+                continue
+            
+            # Styles are immutable: rebuild the font keeping name/color/bold
+            current_size = cell.font.size if cell.font and cell.font.size else rule['default_size']
+            new_size = max(rule['min_size'], current_size + rule['size_delta'])
+            current_name = cell.font.name if cell.font else 'Times New Roman'
+            cell.font = Font(name=current_name, size=new_size, color=cell.font.color, bold=cell.font.bold)
+            if rule.get('wrap'):
+                cell.alignment = Alignment(wrap_text=True, vertical='top', horizontal=cell.alignment.horizontal)
+
+class CachedTemplate:
+    """A parsed template: file signature, pickled Workbook snapshot, merge indexes."""
+    def __init__(self, path, signature, wb, patch=None):
+        self.path = path
+        self.signature = signature
+        self.patch = patch
+        if patch:
+            apply_template_patch(wb.active, patch)
+        self.merge_indexes = {ws.title: build_merge_index(ws) for ws in wb.worksheets}
+        self.snapshot = None
+        try:
+            buf = io.BytesIO()
+            _TemplatePickler(buf, pickle.HIGHEST_PROTOCOL).dump(wb)
+            self._check_snapshot(wb, pickle.loads(buf.getvalue()))
+            self.snapshot = buf.getvalue()
+        except Exception as e:
+            # The snapshot leans on openpyxl internals (IndexedList._dict);
+            # if an upgrade breaks it, every render parses the file instead.
+            print(f"Template Snapshot Error ({path}): {e}. Falling back to load_workbook.")
+
+    @staticmethod
+    def _check_snapshot(wb, copy):
+        """A bad IndexedList restore silently drops styles: compare the two."""
+        if (len(copy._cell_styles) != len(wb._cell_styles) or len(copy._fonts) != len(wb._fonts)
+                or [ws.dimensions for ws in copy.worksheets] != [ws.dimensions for ws in wb.worksheets]):
+            raise ValueError("snapshot does not match the parsed workbook")
+
+    def _load(self):
+        wb = load_workbook(self.path)
+        if self.patch:
+            apply_template_patch(wb.active, self.patch)
+        return wb
+
+    def clone(self):
+        """A fresh, independent Workbook to fill (merge indexes pre-registered)."""
+        wb = None
+        if self.snapshot is not None:
+            try:
+                wb = pickle.loads(self.snapshot)
+            except Exception as e:
+                print(f"Template Snapshot Error ({self.path}): {e}. Falling back to load_workbook.")
+                self.snapshot = None
+        if wb is None:
+            wb = self._load()
+        for ws in wb.worksheets:
+            _merge_indexes[ws] = self.merge_indexes[ws.title]
+        return wb
+
+    def resolve_cell(self, cell_ref, sheet=None):
+        """Template calibration: anchor cell that a write to cell_ref ends up in."""
+        title = sheet or next(iter(self.merge_indexes))
+        return self.merge_indexes[title].get(cell_ref, cell_ref)
+
+_template_cache = {}
+_template_lock = threading.Lock()
+
+def _file_signature(path):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+def get_template(template_path):
+    """
+    Return the CachedTemplate for template_path (patched per TEMPLATE_PATCHES),
+    re-parsing it if the file or its patch rules changed.
+    """
+    patch = TEMPLATE_PATCHES.get(os.path.basename(template_path))
+    signature = _file_signature(template_path) + (repr(patch),)
+    entry = _template_cache.get(template_path)
+    if entry is not None and entry.signature == signature:
+        return entry
+    with _template_lock:
+        entry = _template_cache.get(template_path)
+        if entry is None or entry.signature != signature:
+            entry = CachedTemplate(template_path, signature, load_workbook(template_path), patch)
+            _template_cache[template_path] = entry
+    return entry
+
+def load_template(template_path):
+    """Workbook for one render, cloned from the cached parse of template_path."""
+    return get_template(template_path).clone()
+
+def clear_template_cache():
+    with _template_lock:
+        _template_cache.clear()
+        _template_versions.clear()
+
+# Bump when generator code changes output for the same data (invalidates render caches)
+RENDER_VERSION = 1
+INVOICE_TEMPLATE = "templates/INVOICE FORMAT2.xlsx"
+CHALLAN_TEMPLATE = "templates/CHALLAN FORMAT.xlsx"
+_template_versions = {}
+
+def template_version(template_path):
+    """
+    Content hash of a template file plus its patch rules and RENDER_VERSION.
+    Relative paths resolve like the generators'. Re-hashed only when the file changes.
+    """
+    if not os.path.isabs(template_path):
+        template_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), template_path)
+    signature = _file_signature(template_path)
+    cached = _template_versions.get(template_path)
+    if cached is None or cached[0] != signature:
+        with open(template_path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        cached = _template_versions[template_path] = (signature, digest)
+    patch = TEMPLATE_PATCHES.get(os.path.basename(template_path))
+    return f"{cached[1]}:{RENDER_VERSION}:{repr(patch)}"
+
+def save_document(content, output_path):
+    """Persist rendered document bytes (relative paths resolve against the app dir)."""
+    if not os.path.isabs(output_path):
+        output_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), output_path)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, "wb") as f:
+        f.write(content)
+    return output_path
+
+def _finish_workbook(wb, output_path):
+    """output_path=None renders in memory and returns the .xlsx bytes; otherwise saves and returns the path."""
+    buf = io.BytesIO()
+    wb.save(buf)
+    if output_path is None:
+        return buf.getvalue()
+    return save_document(buf.getvalue(), output_path)
+
+def generate_invoice_excel(data, template_path=INVOICE_TEMPLATE, output_path="generated/temp_invoice.xlsx"):
+    return _finish_workbook(fill_invoice_workbook(data, template_path), output_path)
+
+def generate_challan_excel(data, template_path=CHALLAN_TEMPLATE, output_path="generated/temp_challan.xlsx"):
+    return _finish_workbook(fill_challan_workbook(data, template_path), output_path)
+
+def fill_invoice_workbook(data, template_path=INVOICE_TEMPLATE):
+    """The filled invoice Workbook (not saved). Shared by the Excel and native PDF renderers."""
     # Resolve absolute paths to ensure reliability on Cloud
     base_dir = os.path.dirname(os.path.abspath(__file__))
     
@@ -16,17 +252,11 @@ def generate_invoice_excel(data, template_path="templates/INVOICE FORMAT2.xlsx",
     if not os.path.isabs(template_path):
         template_path = os.path.join(base_dir, template_path)
     
-    if not os.path.isabs(output_path):
-        output_path = os.path.join(base_dir, output_path)
-
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    
     if not os.path.exists(template_path):
         # Fallback debug or error
         raise FileNotFoundError(f"Template not found at: {template_path}")
 
-    shutil.copy(template_path, output_path)
-    wb = load_workbook(output_path)
+    wb = load_template(template_path)
     ws = wb.active 
     
     # 1. Header
@@ -46,8 +276,7 @@ def generate_invoice_excel(data, template_path="templates/INVOICE FORMAT2.xlsx",
     # 2. Buyer Details [D17, D18, D20]
     ws['D17'] = data['supplier_name']; apply_style(ws['D17'])
     ws['D18'] = data.get('supplier_address', ''); apply_style(ws['D18'])
-    import openpyxl
-    ws['D18'].alignment = openpyxl.styles.Alignment(wrap_text=True, vertical='top')
+    ws['D18'].alignment = Alignment(wrap_text=True, vertical='top')
     
     ws['D20'] = data.get('supplier_gst', ''); apply_style(ws['D20'])
     
@@ -102,82 +331,31 @@ def generate_invoice_excel(data, template_path="templates/INVOICE FORMAT2.xlsx",
     ws['L42'] = data['total']; apply_style(ws['L42'], 10)
     
     # Amount In Words [B39] (Merged B39:H40 approx)
-    total_val = data['total']
-    try:
-        words = num2words(total_val, lang='en_IN').title() + " Only"
-    except:
-        words = f"{total_val} Only"
-        
-    ws['B39'] = f"Total Invoice amount in words: {words}"
-    apply_style(ws['B39'], 12)
-
-    ws['B39'] = f"Total Invoice amount in words: {words}"
+    ws['B39'] = f"Total Invoice amount in words: {amount_in_words(data['total'])}"
     apply_style(ws['B39'], 12)
 
-    # FIX: Dynamic Font Size Adjustment for Header (User Request)
-    # Search top rows to find "DIPU ARTS" and Address, then reduce size.
-    for r_idx in range(1, 15): # Scan Header Rows
-        for col in range(1, 13):
-            cell = ws.cell(row=r_idx, column=col)
-            if not cell.value:
-                continue
-                
-            val_str = str(cell.value)
-            
-            # Check for Company Name
-            if "DIPU ARTS" in val_str.upper():
-                current_size = cell.font.size if cell.font and cell.font.size else 20 # Default large
-                new_size = max(8, current_size - 2) # Reduce by 2
-                current_name = cell.font.name if cell.font else 'Times New Roman'
-                # Preserve color/bold if possible, but Font alignment is separate
-                # Complex: styles are immutable. We copy critical attrs.
-                # Assuming standard black/bold red headers. 
-                # Ideally just change size.
-                current_color = cell.font.color
-                current_bold = cell.font.bold
-                cell.font = Font(name=current_name, size=new_size, color=current_color, bold=current_bold)
-                
-            # Check for Address components
-            # "Gala No", "Patil Nagar", "Choudhary Compound"
-            elif any(x in val_str for x in ["Gala No", "Patil Nagar", "Choudhary"]):
-                current_size = cell.font.size if cell.font and cell.font.size else 12
-                # User asked to reduce by 4 points
-                new_size = max(6, current_size - 4) 
-                current_name = cell.font.name if cell.font else 'Times New Roman'
-                current_color = cell.font.color
-                current_bold = cell.font.bold
-                cell.font = Font(name=current_name, size=new_size, color=current_color, bold=current_bold)
-                # Also ensure wrap text
-                cell.alignment = openpyxl.styles.Alignment(wrap_text=True, vertical='top', horizontal=cell.alignment.horizontal)
+    # Header font adjustments (DIPU ARTS / address) are applied once at
+    # template load, see TEMPLATE_PATCHES.
 
-    # 3. Line Items (Dynamic Rows starting at 24)
-    r = 24
-    
     # Reverted Column Width Adjustments
     
     # Force Page Layout to A4 & Fit Width to avoid cut-off in PDF
     setup_page_layout(ws)
     
-    wb.save(output_path)
-    return output_path
+    return wb
 
-def generate_challan_excel(data, template_path="templates/CHALLAN FORMAT.xlsx", output_path="generated/temp_challan.xlsx"):
+def fill_challan_workbook(data, template_path=CHALLAN_TEMPLATE):
+    """The filled challan Workbook (not saved)."""
     # Resolve absolute paths
     base_dir = os.path.dirname(os.path.abspath(__file__))
     
     if not os.path.isabs(template_path):
         template_path = os.path.join(base_dir, template_path)
     
-    if not os.path.isabs(output_path):
-        output_path = os.path.join(base_dir, output_path)
-
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    
     if not os.path.exists(template_path):
         raise FileNotFoundError(f"Template not found at: {template_path}")
 
-    shutil.copy(template_path, output_path)
-    wb = load_workbook(output_path)
+    wb = load_template(template_path)
     ws = wb.active
     
     # Challan Mappings - All Size 14 (User requested 14 for Challan separately, I should check if they want 10 here too? "in invoice bill this ####" - context implies Invoice. I'll touch Invoice mostly.
@@ -207,17 +385,16 @@ def generate_challan_excel(data, template_path="templates/CHALLAN FORMAT.xlsx",
     
     for i, item in enumerate(items):
         current_row = r + i
-        ws[f'B{current_row}'] = i + 1; apply_style(ws[f'B{current_row}'], 12)
-        ws[f'D{current_row}'] = item['quantity']; apply_style(ws[f'D{current_row}'], 12)
-        ws[f'H{current_row}'] = item['material']; apply_style(ws[f'H{current_row}'], 12)
+        safe_write(ws, f'B{current_row}', i + 1, 12)
+        safe_write(ws, f'D{current_row}', item['quantity'], 12)
+        safe_write(ws, f'H{current_row}', item['material'], 12)
         
     # Reverted Column Width Adjustments
     
     # Force Page Layout to A4 & Fit Width
     setup_page_layout(ws)
     
-    wb.save(output_path)
-    return output_path
+    return wb
 
 def setup_page_layout(ws):
     """
@@ -263,72 +440,32 @@ def safe_write(ws, cell_ref, value, font_size=None):
     Safely write to a cell, finding the top-left cell if merged.
     Also applies style if font_size is provided.
     """
-    import openpyxl
-    
-    # Check if cell is within a merged range
-    for range_ in ws.merged_cells.ranges:
-        if cell_ref in range_:
-            # Write to the top-left cell of the merged range
-            top_left = range_.coord.split(':')[0]
-            ws[top_left] = value
-            if font_size:
-                apply_style(ws[top_left], font_size)
-            return
-
-    # Not merged (or we are the top-left/target)
-    # Note: If cell is part of merge but not top-left, accessing ws[cell_ref] returns MergedCell
-    # But cell_ref in range_ should catch that.
-    
-    # Attempt direct write
-    try:
-        ws[cell_ref] = value
-        if font_size:
-            apply_style(ws[cell_ref], font_size)
-    except AttributeError:
-        # Fallback if somehow missed (MergedCell has no value setter)
-        pass 
-
-def update_master_ledger(invoice_data, master_path="generated/Master_Sales.xlsx"):
+    target = resolve_cell(ws, cell_ref)
+    ws[target] = value
+    if font_size:
+        apply_style(ws[target], font_size)
+
+MASTER_LEDGER_PATH = "generated/Master_Sales.xlsx"
+
+def write_master_ledger(rows, columns, master_path=MASTER_LEDGER_PATH):
     """
-    Updates the Master Sales Excel file with new invoice data.
-    Columns: Invoice No, Supplier Name, Taxable, CGST, SGST, Total.
-    Sorted by Invoice No.
+    Materialize the master sales ledger (database.iter_sales_ledger) as .xlsx.
+    Streams rows through a write-only workbook, so memory stays flat however
+    long the ledger is; the file is swapped in atomically.
     """
-    import pandas as pd
-    
-    # Define Columns
-    cols = ["Invoice No", "Date", "Supplier Name", "Taxable Amount", "CGST", "SGST", "Total Amount"]
-    
-    # Prepare New Row
-    new_row = {
-        "Invoice No": invoice_data['invoice_no'],
-        "Date": invoice_data['date'],
-        "Supplier Name": invoice_data['supplier_name'],
-        "Taxable Amount": float(invoice_data['base_amount']),
-        "CGST": float(invoice_data['cgst']),
-        "SGST": float(invoice_data['sgst']),
-        "Total Amount": float(invoice_data['total'])
-    }
-    
-    if os.path.exists(master_path):
-        df = pd.read_excel(master_path)
-    else:
-        df = pd.DataFrame(columns=cols)
-        
-    # Append
-    # Concat is safer than append (deprecated)
-    new_df = pd.DataFrame([new_row])
-    df = pd.concat([df, new_df], ignore_index=True)
-    
-    # Sort by Invoice No
-    # Try to convert to numeric for sorting if possible, else string sort
-    try:
-        df['sort_key'] = pd.to_numeric(df['Invoice No'])
-        df = df.sort_values(by='sort_key')
-        df = df.drop(columns=['sort_key'])
-    except:
-        df = df.sort_values(by='Invoice No')
-        
-    # Save
-    df.to_excel(master_path, index=False)
-    return master_path 
+    from openpyxl import Workbook
+
+    if not os.path.isabs(master_path):
+        master_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), master_path)
+    os.makedirs(os.path.dirname(master_path), exist_ok=True)
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(columns)
+    for row in rows:
+        ws.append(row)
+    # Per-thread temp name: the sync worker and the UI may build it at once
+    tmp = f"{master_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    wb.save(tmp)
+    os.replace(tmp, master_path)
+    return master_path
@@ -0,0 +1,228 @@
+import csv
+import importlib.util
+import os
+import sys
+import time
+
+import database as db
+
+# Register exports streamed straight from SQLite cursors (fetchmany batches)
+# into write-only XLSX, CSV or Parquet, so memory stays flat for any period.
+# Each register: FROM clause, date column, and its columns as
+# (header, SQL expression) in default order.
+REGISTERS = {
+    'invoices': {
+        'label': "Sales Register (invoice-wise)",
+        'from': """FROM invoices i
+                   LEFT JOIN suppliers s ON s.id = i.supplier_id""",
+        'date': "i.date",
+        'order': "i.date, i.id",
+        'columns': [
+            ("Invoice No", "i.invoice_no"),
+            ("Date", "i.date"),
+            ("Supplier Name", "s.name"),
+            ("GSTIN", "s.gst_no"),
+            ("Order No", "i.order_no"),
+            ("Challans", "i.challan_count"),
+            ("Taxable Amount", "i.base_amount"),
+            ("CGST", "i.cgst_amount"),
+            ("SGST", "i.sgst_amount"),
+            ("Total Amount", "i.total_amount"),
+        ],
+    },
+    'items': {
+        'label': "Sales Register (line-wise)",
+        'from': """FROM invoice_items it
+                   JOIN invoices i ON i.id = it.invoice_id
+                   LEFT JOIN suppliers s ON s.id = i.supplier_id""",
+        'date': "i.date",
+        'order': "i.date, i.id, it.line_no",
+        'columns': [
+            ("Invoice No", "i.invoice_no"),
+            ("Date", "i.date"),
+            ("Supplier Name", "s.name"),
+            ("GSTIN", "s.gst_no"),
+            ("Line", "it.line_no"),
+            ("Challan No", "it.challan_no"),
+            ("Challan Date", "it.challan_date"),
+            ("Material", "it.material"),
+            ("Qty", "it.qty"),
+            ("Rate", "it.rate"),
+            ("Taxable Amount", "it.base_amount"),
+            ("CGST", "it.cgst"),
+            ("SGST", "it.sgst"),
+            ("Total Amount", "it.total"),
+        ],
+    },
+    'ledger': {
+        'label': "Master Sales Ledger (append-only)",
+        'from': "FROM sales_ledger l",
+        'date': "l.date",
+        'order': "(l.invoice_no = '' OR l.invoice_no GLOB '*[^0-9]*'), CAST(l.invoice_no AS INTEGER), l.invoice_no, l.id",
+        'columns': list(zip(db.SALES_LEDGER_COLUMNS,
+                            ["l.invoice_no", "l.date", "l.supplier_name", "l.taxable", "l.cgst", "l.sgst", "l.total"])),
+    },
+}
+# Parquet needs pyarrow (optional, not in requirements.txt): offered only when installed
+FORMATS = ("xlsx", "csv") + (("parquet",) if importlib.util.find_spec("pyarrow") else ())
+BATCH_SIZE = 1000
+
+def register_columns(register):
+    """Header names available for a register, in default order."""
+    return [name for name, _ in REGISTERS[register]['columns']]
+
+def _build_query(register, columns=None, date_from=None, date_to=None, supplier_name=None, include_deleted=False):
+    spec = REGISTERS[register]
+    available = dict(spec['columns'])
+    columns = list(columns or available)
+    unknown = [c for c in columns if c not in available]
+    if unknown:
+        raise ValueError(f"Unknown columns for {register}: {', '.join(unknown)}")
+
+    where, params = [], []
+    if register != 'ledger' and not include_deleted:
+        where.append("(i.is_deleted IS NULL OR i.is_deleted = 0)")
+    if supplier_name:
+        where.append("s.name = ?" if register != 'ledger' else "l.supplier_name = ?")
+        params.append(supplier_name)
+    if date_from:
+        where.append(f"{spec['date']} >= ?")
+        params.append(str(date_from))
+    if date_to:
+        where.append(f"{spec['date']} <= ?")
+        params.append(str(date_to))
+
+    query = f"SELECT {', '.join(available[c] for c in columns)} {spec['from']}"
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    query += f" ORDER BY {spec['order']}"
+    return query, params, columns
+
+def iter_register(register, columns=None, date_from=None, date_to=None, supplier_name=None,
+                  include_deleted=False, batch_size=BATCH_SIZE):
+    """
+    Yield the header (list of column names) first, then row batches
+    (lists of tuples) read batch_size at a time from one SQLite cursor
+    (database.iter_query).
+    """
+    query, params, columns = _build_query(register, columns, date_from, date_to, supplier_name, include_deleted)
+    yield columns
+    # Private connection: an abandoned export never holds a db_session open
+    yield from db.iter_query(query, params, batch_size)
+
+def _write_xlsx(path, columns, batches):
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Register")
+    ws.append(columns)
+    count = 0
+    for rows in batches:
+        for row in rows:
+            ws.append(row)
+        count += len(rows)
+    wb.save(path)
+    return count
+
+def _write_csv(path, columns, batches):
+    count = 0
+    # utf-8-sig so Excel opens supplier names with non-ASCII text correctly
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for rows in batches:
+            writer.writerows(rows)
+            count += len(rows)
+    return count
+
+def _write_parquet(path, columns, batches):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+
+    def column_type(values):
+        # Nullable register columns are all text; a batch of NULLs stays string
+        present = [v for v in values if v is not None]
+        return pa.infer_type(present) if present else pa.string()
+
+    writer = None
+    count = 0
+    try:
+        for rows in batches:
+            values = list(zip(*rows))
+            if writer is None:
+                schema = pa.schema([(c, column_type(v)) for c, v in zip(columns, values)])
+                writer = pq.ParquetWriter(path, schema)
+            arrays = [pa.array(v, type=f.type, from_pandas=False) for v, f in zip(values, writer.schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=writer.schema))
+            count += len(rows)
+        if writer is None:
+            # No rows: still write the header as an all-string schema
+            pq.write_table(pa.table({c: pa.array([], pa.string()) for c in columns}), path)
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
+
+WRITERS = {"xlsx": _write_xlsx, "csv": _write_csv, "parquet": _write_parquet}
+
+def export_register(register, output_path, fmt=None, columns=None, date_from=None, date_to=None,
+                    supplier_name=None, include_deleted=False, batch_size=BATCH_SIZE):
+    """
+    Export a register to output_path (format from fmt or the file extension).
+    The file is written under a temporary name and swapped in when complete.
+    Returns {'path', 'rows', 'seconds'}.
+    """
+    fmt = (fmt or os.path.splitext(output_path)[1].lstrip(".")).lower()
+    if fmt not in FORMATS:
+        hint = " (needs pyarrow: pip install pyarrow)" if fmt == "parquet" else ""
+        raise ValueError(f"Unsupported format '{fmt}'{hint} (use {', '.join(FORMATS)})")
+    if os.path.dirname(output_path):
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    started = time.perf_counter()
+    batches = iter_register(register, columns, date_from, date_to, supplier_name, include_deleted, batch_size)
+    header = next(batches)
+    tmp = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        count = WRITERS[fmt](tmp, header, batches)
+        os.replace(tmp, output_path)
+    finally:
+        batches.close()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return {'path': output_path, 'rows': count, 'seconds': time.perf_counter() - started}
+
+def default_filename(register, fmt, date_from=None, date_to=None):
+    period = f"_{date_from or 'start'}_to_{date_to or 'today'}" if (date_from or date_to) else ""
+    return f"{register}_register{period}.{fmt}"
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export sales registers from the database.")
+    parser.add_argument("register", choices=sorted(REGISTERS))
+    parser.add_argument("--from", dest="date_from", help="From date (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="date_to", help="To date (YYYY-MM-DD)")
+    parser.add_argument("--supplier", help="Only this supplier")
+    parser.add_argument("--columns", help="Comma-separated column names (default: all)")
+    parser.add_argument("--format", dest="fmt", choices=FORMATS, default="xlsx")
+    parser.add_argument("--include-deleted", action="store_true", help="Include deleted invoices")
+    parser.add_argument("--out", help="Output file (default: generated/exports/<register>_register...)")
+    parser.add_argument("--list-columns", action="store_true", help="Show available columns and exit")
+    args = parser.parse_args()
+
+    if args.list_columns:
+        print("\n".join(register_columns(args.register)))
+        sys.exit(0)
+
+    db.init_db()
+    out = args.out or os.path.join("generated", "exports",
+                                   default_filename(args.register, args.fmt, args.date_from, args.date_to))
+    columns = [c.strip() for c in args.columns.split(",")] if args.columns else None
+    result = export_register(args.register, out, fmt=args.fmt, columns=columns,
+                             date_from=args.date_from, date_to=args.date_to, supplier_name=args.supplier,
+                             include_deleted=args.include_deleted)
+    print(f"Exported {result['rows']} rows to {result['path']} in {result['seconds']:.2f}s")
@@ -0,0 +1,187 @@
+import csv
+import io
+import os
+import sys
+import time
+from datetime import date, datetime
+
+import database as db
+
+# Accepted header spellings -> canonical column
+COLUMN_ALIASES = {
+    "challan_no": ["challan_no", "challan no", "challan", "challan number"],
+    "date": ["date", "challan_date", "challan date"],
+    "supplier": ["supplier", "supplier_name", "supplier name", "party"],
+    "material": ["material", "material_name", "raw material", "item", "description"],
+    "quantity": ["quantity", "qty", "mtr", "meters"],
+}
+
+def _normalize_header(header):
+    """Map a file's header row to canonical column names -> column index."""
+    lookup = {alias: col for col, aliases in COLUMN_ALIASES.items() for alias in aliases}
+    mapping = {}
+    for i, name in enumerate(header):
+        key = lookup.get(str(name or "").strip().lower())
+        if key and key not in mapping:
+            mapping[key] = i
+    missing = [c for c in COLUMN_ALIASES if c not in mapping]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+    return mapping
+
+def _iter_rows(source, fmt):
+    """
+    Yield (header_row, total_rows_or_None) first, then raw data rows.
+    Streams the file: CSV via csv.reader, XLSX via openpyxl read-only mode.
+    """
+    if fmt == "csv":
+        if isinstance(source, (str, os.PathLike)):
+            f = open(source, newline="", encoding="utf-8-sig")
+        else:
+            raw = source.read()
+            f = io.StringIO(raw.decode("utf-8-sig") if isinstance(raw, bytes) else raw)
+        with f:
+            reader = csv.reader(f)
+            yield next(reader, []), None
+            yield from reader
+    elif fmt == "xlsx":
+        from openpyxl import load_workbook
+        wb = load_workbook(source, read_only=True, data_only=True)
+        try:
+            ws = wb.active
+            rows = ws.iter_rows(values_only=True)
+            total = ws.max_row - 1 if ws.max_row else None
+            yield next(rows, ()), total
+            yield from rows
+        finally:
+            wb.close()
+    else:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+# Text dates are day-first, as written on our challans
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%d/%m/%y", "%d-%m-%y", "%Y-%m-%d %H:%M:%S")
+
+def _is_blank(value):
+    # None from empty XLSX cells, "" from CSV, NaN from pandas-written files
+    return value is None or (isinstance(value, float) and value != value) or not str(value).strip()
+
+def _required(value, column):
+    if _is_blank(value):
+        raise ValueError(f"Missing {column}")
+    return value
+
+def _as_date_str(value):
+    """ISO date string (as the app stores str(date)); ValueError if unparseable."""
+    value = _required(value, "date")
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    text = str(value).strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            pass
+    raise ValueError(f"Unrecognised date '{text}'")
+
+def _as_challan_no(value):
+    value = _required(value, "challan_no")
+    # Excel stores numeric challan numbers as floats (101 -> 101.0)
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+def import_challans(source, fmt=None, create_missing=False, batch_size=2000, progress=None):
+    """
+    Backfill historic challans from a CSV/XLSX file.
+    Columns: challan_no, date, supplier, material, quantity (see COLUMN_ALIASES).
+    Dates are stored as ISO YYYY-MM-DD; text dates are read day-first
+    (DATE_FORMATS). Rows with a blank or unparseable field are reported.
+
+    Rows are inserted in batches of batch_size, one transaction each.
+    progress(done, total) is called after every batch (total may be None).
+    Unknown suppliers/materials are created when create_missing is set,
+    otherwise the row is reported in 'errors'.
+
+    Returns {'inserted': int, 'errors': [(line_no, reason), ...], 'seconds': float}.
+    """
+    if fmt is None:
+        name = source if isinstance(source, (str, os.PathLike)) else getattr(source, "name", "")
+        fmt = os.path.splitext(str(name))[1].lstrip(".").lower()
+
+    started = time.perf_counter()
+    suppliers = {r['name']: int(r['id']) for _, r in db.get_suppliers().iterrows()}
+    materials = {r['name']: int(r['id']) for _, r in db.get_materials().iterrows()}
+
+    def resolve(names, name, add):
+        if name not in names and create_missing:
+            add(name)
+            # Re-read so we get the new row's id
+            fresh = db.get_suppliers() if names is suppliers else db.get_materials()
+            names.update({r['name']: int(r['id']) for _, r in fresh.iterrows()})
+        return names.get(name)
+
+    rows = _iter_rows(source, fmt)
+    header, total = next(rows)
+    cols = _normalize_header(header)
+
+    inserted = 0
+    errors = []
+    batch = []
+    for line_no, raw in enumerate(rows, start=2):
+        if not raw or all(v in (None, "") for v in raw):
+            continue
+        try:
+            # Validate the whole row before any supplier/material is created
+            challan_no = _as_challan_no(raw[cols['challan_no']])
+            challan_date = _as_date_str(raw[cols['date']])
+            supplier = str(_required(raw[cols['supplier']], "supplier")).strip()
+            material = str(_required(raw[cols['material']], "material")).strip()
+            quantity = float(_required(raw[cols['quantity']], "quantity"))
+            supplier_id = resolve(suppliers, supplier, lambda n: db.add_supplier(n, "", "", ""))
+            material_id = resolve(materials, material, lambda n: db.add_material(n, "Meters"))
+            if supplier_id is None:
+                raise ValueError(f"Unknown supplier '{supplier}'")
+            if material_id is None:
+                raise ValueError(f"Unknown material '{material}'")
+            batch.append((challan_no, challan_date, supplier_id, material_id, quantity))
+        except (ValueError, TypeError, IndexError) as e:
+            errors.append((line_no, str(e)))
+            continue
+
+        if len(batch) >= batch_size:
+            inserted += db.insert_challan_rows(batch)
+            batch = []
+            if progress:
+                progress(inserted, total)
+
+    if batch:
+        inserted += db.insert_challan_rows(batch)
+    if progress:
+        progress(inserted, total)
+
+    return {'inserted': inserted, 'errors': errors, 'seconds': time.perf_counter() - started}
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Import historic challans from CSV/XLSX.")
+    parser.add_argument("path")
+    parser.add_argument("--create-missing", action="store_true", help="Create unknown suppliers/materials")
+    parser.add_argument("--batch-size", type=int, default=2000)
+    args = parser.parse_args()
+
+    db.init_db()
+
+    def report(done, total):
+        suffix = f"/{total}" if total else ""
+        print(f"\rImported {done}{suffix} rows", end="", file=sys.stderr)
+
+    result = import_challans(args.path, create_missing=args.create_missing,
+                             batch_size=args.batch_size, progress=report)
+    print(file=sys.stderr)
+    rate = result['inserted'] / result['seconds'] if result['seconds'] else 0
+    print(f"Inserted {result['inserted']} rows in {result['seconds']:.2f}s ({rate:,.0f} rows/s)")
+    for line_no, reason in result['errors']:
+        print(f"  line {line_no}: {reason}")
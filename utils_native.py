@@ -1,6 +1,45 @@
+import atexit
+import shutil
 import os
+import signal
 import subprocess
+import sys
+import tempfile
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# --- Warm LibreOffice Conversion Server ---
+# A long-lived headless soffice listening on a local socket, driven through the
+# Python UNO bridge. Conversions then skip the multi-second cold start.
+# Opt out with AUTOBILLER_LO_SERVER=0; the spawn-per-file path stays as fallback.
+LO_SERVER_ENABLED = os.environ.get("AUTOBILLER_LO_SERVER", "1") != "0"
+LO_SERVER_PORT = int(os.environ.get("AUTOBILLER_LO_PORT", 2002))
+LO_PROFILE_DIR = os.path.join(tempfile.gettempdir(), "autobiller_lo_profile")
+LO_START_TIMEOUT = 45
+LO_CONVERT_TIMEOUT = 30
+LO_HEALTH_INTERVAL = 30  # seconds idle before re-checking the listener
+LO_RETRY_AFTER = 300  # after a failed start, use the cold path for this long
+
+# Where the uno module lives when it isn't on sys.path (distro / macOS bundle)
+UNO_SEARCH_PATHS = [
+    "/usr/lib/python3/dist-packages",
+    "/usr/lib/libreoffice/program",
+    "/opt/libreoffice/program",
+    "/Applications/LibreOffice.app/Contents/Resources",
+]
+
+def _soffice_cmd():
+    # On macOS, check if soffice is in path, else use full path
+    if os.path.exists("/Applications/LibreOffice.app/Contents/MacOS/soffice"):
+        return "/Applications/LibreOffice.app/Contents/MacOS/soffice"
+    return 'soffice'
+
+def libreoffice_available():
+    """True if an soffice binary is installed (the warm server or one-off runs can be used)."""
+    cmd = _soffice_cmd()
+    return os.path.exists(cmd) or shutil.which(cmd) is not None
 
 def convert_excel_to_pdf(input_xlsx, output_pdf):
     """
@@ -62,10 +101,12 @@ def convert_excel_to_pdf(input_xlsx, output_pdf):
     except Exception as e:
         return False, str(e)
 
-def convert_with_libreoffice(input_xlsx, output_pdf):
+def convert_with_libreoffice(input_xlsx, output_pdf, use_server=True):
     """
     Converts Excel to PDF using LibreOffice (Linux/Cloud).
     Requires 'libreoffice' to be installed (via packages.txt).
+    Goes through the warm conversion server (started on first use) and
+    falls back to a one-off soffice process.
     """
     input_abs = os.path.abspath(input_xlsx)
     out_dir = os.path.dirname(os.path.abspath(output_pdf))
@@ -74,15 +115,14 @@ def convert_with_libreoffice(input_xlsx, output_pdf):
     # Note: LibreOffice uses the same basename. If output_pdf name differs, we might need rename.
     # But usually we generate [name].xlsx -> [name].pdf so it matches automatically.
     
-    # Determine Command
-    soffice_cmd = 'soffice'
-    
-    # On macOS, check if soffice is in path, else use full path
-    if os.path.exists("/Applications/LibreOffice.app/Contents/MacOS/soffice"):
-        soffice_cmd = "/Applications/LibreOffice.app/Contents/MacOS/soffice"
-        
+    # Warm server first; fall through to a one-off soffice process on any failure
+    if use_server and LO_SERVER_ENABLED:
+        success, msg = convert_with_office_server(input_xlsx, output_pdf)
+        if success:
+            return success, msg
+
     cmd = [
-        soffice_cmd, 
+        _soffice_cmd(), 
         '--headless', 
         '--convert-to', 
         'pdf', 
@@ -114,3 +154,349 @@ def convert_with_libreoffice(input_xlsx, output_pdf):
         return False, "LibreOffice not found. Ensure 'libreoffice' is in packages.txt"
     except Exception as e:
         return False, str(e)
+
+def _import_uno():
+    """The uno module ships with LibreOffice, not pip. Returns it or None."""
+    try:
+        import uno
+        return uno
+    except ImportError:
+        pass
+    for path in UNO_SEARCH_PATHS:
+        if os.path.exists(os.path.join(path, "uno.py")) and path not in sys.path:
+            sys.path.append(path)
+            try:
+                import uno
+                return uno
+            except ImportError:
+                # pyuno built for another Python version
+                sys.path.remove(path)
+    return None
+
+def _call_with_timeout(func, timeout):
+    """Run func in a daemon thread; raise TimeoutError if it doesn't return in time."""
+    result = {}
+
+    def run():
+        try:
+            result['value'] = func()
+        except Exception as e:
+            result['error'] = e
+
+    worker = threading.Thread(target=run, daemon=True)
+    worker.start()
+    worker.join(timeout)
+    if worker.is_alive():
+        raise TimeoutError(f"No response within {timeout}s")
+    if 'error' in result:
+        raise result['error']
+    return result.get('value')
+
+class OfficeServer:
+    """
+    One headless soffice process with a UNO socket listener.
+    Conversions are serialized (a single office instance is not re-entrant).
+    A hung or dead instance is killed and restarted on the next request.
+    """
+    def __init__(self, port=LO_SERVER_PORT, profile_dir=LO_PROFILE_DIR):
+        self.port = port
+        self.profile_dir = profile_dir
+        self.proc = None
+        self.desktop = None
+        self.last_error = None
+        self.last_ok = 0.0
+        self.conversions = 0
+        self.launches = 0
+        self._start_failed_at = None
+        self._uno = None
+        self._lock = threading.Lock()
+
+    def is_running(self):
+        return self.proc is not None and self.proc.poll() is None and self.desktop is not None
+
+    def retry_pending(self):
+        """True while a failed start is younger than LO_RETRY_AFTER (use the cold path meanwhile)."""
+        failed_at = self._start_failed_at
+        return failed_at is not None and time.monotonic() - failed_at < LO_RETRY_AFTER
+
+    def start(self):
+        with self._lock:
+            self._start()
+
+    def stop(self):
+        with self._lock:
+            self._kill()
+
+    def _start(self):
+        try:
+            self._launch()
+            self._start_failed_at = None
+        except Exception as e:
+            self._start_failed_at = time.monotonic()
+            self.last_error = f"Start failed: {e}"
+            raise
+
+    def _launch(self):
+        self._kill()
+        self._uno = self._uno or _import_uno()
+        if self._uno is None:
+            raise RuntimeError("Python UNO bridge not available")
+
+        os.makedirs(self.profile_dir, exist_ok=True)
+        cmd = [
+            _soffice_cmd(),
+            '--headless', '--invisible', '--norestore', '--nologo',
+            '--nodefault', '--nolockcheck',
+            # Private profile so a desktop LibreOffice session isn't disturbed
+            f"-env:UserInstallation={Path(self.profile_dir).as_uri()}",
+            f"--accept=socket,host=127.0.0.1,port={self.port};urp;StarOffice.ComponentContext",
+        ]
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                     start_new_session=True)
+        self.launches += 1
+
+        local_ctx = self._uno.getComponentContext()
+        resolver = local_ctx.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", local_ctx)
+        url = f"uno:socket,host=127.0.0.1,port={self.port};urp;StarOffice.ComponentContext"
+
+        deadline = time.monotonic() + LO_START_TIMEOUT
+        while True:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"soffice exited during startup (code {self.proc.returncode})")
+            try:
+                ctx = resolver.resolve(url)
+                break
+            except Exception:
+                # NoConnectException until the listener is up
+                if time.monotonic() > deadline:
+                    self._kill()
+                    raise TimeoutError(f"soffice did not start listening within {LO_START_TIMEOUT}s")
+                time.sleep(0.25)
+
+        self.desktop = ctx.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", ctx)
+        self.last_ok = time.monotonic()
+        self.last_error = None
+
+    def _kill(self):
+        self.desktop = None
+        if self.proc is None:
+            return
+        if self.proc.poll() is None:
+            try:
+                # soffice forks soffice.bin; take down the whole session
+                if hasattr(os, "killpg"):
+                    os.killpg(self.proc.pid, signal.SIGKILL)
+                else:
+                    self.proc.kill()
+                self.proc.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+        self.proc = None
+
+    def health_check(self, timeout=5):
+        """True if the process is alive and answers a trivial UNO call."""
+        if not self.is_running():
+            return False
+        try:
+            _call_with_timeout(lambda: self.desktop.getComponents(), timeout)
+            self.last_ok = time.monotonic()
+            return True
+        except Exception as e:
+            self.last_error = f"Health check failed: {e}"
+            return False
+
+    def _prop(self, name, value):
+        prop = self._uno.createUnoStruct("com.sun.star.beans.PropertyValue")
+        prop.Name, prop.Value = name, value
+        return prop
+
+    def _convert(self, input_abs, output_abs):
+        to_url = self._uno.systemPathToFileUrl
+        doc = self.desktop.loadComponentFromURL(
+            to_url(input_abs), "_blank", 0,
+            (self._prop("Hidden", True), self._prop("ReadOnly", True)))
+        if doc is None:
+            raise RuntimeError("LibreOffice could not open the workbook")
+        try:
+            doc.storeToURL(to_url(output_abs), (self._prop("FilterName", "calc_pdf_Export"),))
+        finally:
+            doc.close(True)
+
+    def convert(self, input_xlsx, output_pdf, timeout=LO_CONVERT_TIMEOUT):
+        """Returns (success, output_pdf or error message)."""
+        input_abs = os.path.abspath(input_xlsx)
+        output_abs = os.path.abspath(output_pdf)
+        with self._lock:
+            try:
+                stale = time.monotonic() - self.last_ok > LO_HEALTH_INTERVAL
+                if not self.is_running() or (stale and not self.health_check()):
+                    if self.retry_pending():
+                        return False, f"Conversion server unavailable ({self.last_error})"
+                    self._start()
+                _call_with_timeout(lambda: self._convert(input_abs, output_abs), timeout)
+            except TimeoutError as e:
+                # Hung instance: drop it, the next request starts a fresh one
+                self._kill()
+                self.last_error = f"Conversion hung: {e}"
+                return False, self.last_error
+            except Exception as e:
+                self.last_error = str(e)
+                if not self.health_check():
+                    self._kill()
+                return False, f"Conversion server failed: {e}"
+
+            self.last_ok = time.monotonic()
+            if os.path.exists(output_abs):
+                self.conversions += 1
+                return True, output_pdf
+            return False, "PDF file not created."
+
+    def status(self):
+        return {
+            'running': self.is_running(),
+            'pid': self.proc.pid if self.proc is not None else None,
+            'port': self.port,
+            'conversions': self.conversions,
+            'restarts': max(self.launches - 1, 0),
+            'last_error': self.last_error,
+        }
+
+_office_server = None
+_office_server_lock = threading.Lock()
+_office_server_starting = threading.Event()
+
+def get_office_server():
+    global _office_server
+    with _office_server_lock:
+        if _office_server is None:
+            _office_server = OfficeServer()
+            atexit.register(_office_server.stop)
+        return _office_server
+
+def start_office_server(force=False):
+    """
+    Warm up the conversion server in a background thread (idempotent).
+    Returns False when LibreOffice/UNO isn't usable here, or a start failed
+    less than LO_RETRY_AFTER ago (force=True retries anyway), so nothing is started.
+    """
+    if not LO_SERVER_ENABLED or _import_uno() is None:
+        return False
+    server = get_office_server()
+    if server.retry_pending() and not force:
+        return False
+    with _office_server_lock:
+        if server.is_running() or _office_server_starting.is_set():
+            return True
+        _office_server_starting.set()
+
+    def warm_up():
+        try:
+            server.start()
+        except Exception as e:
+            server.last_error = str(e)
+            print(f"Office Server Error: {e}")
+        finally:
+            _office_server_starting.clear()
+
+    threading.Thread(target=warm_up, name="office-server-start", daemon=True).start()
+    return True
+
+def convert_with_office_server(input_xlsx, output_pdf):
+    """Convert through the warm server, starting it on first use. Returns (success, msg)."""
+    if _import_uno() is None:
+        return False, "Python UNO bridge not available"
+    return get_office_server().convert(input_xlsx, output_pdf)
+
+def _batch_jobs(paths, out_dir):
+    """Normalize convert_many() input to [(input_abs, output_abs)]."""
+    jobs = []
+    for item in paths:
+        if isinstance(item, (tuple, list)):
+            src, pdf_name = item
+        else:
+            src, pdf_name = item, os.path.splitext(os.path.basename(item))[0] + ".pdf"
+        jobs.append((os.path.abspath(src), os.path.abspath(os.path.join(out_dir, pdf_name))))
+    return jobs
+
+def _convert_run(jobs, timeout_per_file=10):
+    """
+    One soffice process for a whole list of workbooks.
+    Inputs must have distinct basenames (LibreOffice names outputs <basename>.pdf).
+    Each run gets its own profile so several can work side by side.
+    Returns {input_abs: (success, output or error)}.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="autobiller_batch_") as tmp:
+        profile = Path(tmp, "profile").as_uri()
+        outdir = os.path.join(tmp, "out")
+        cmd = [_soffice_cmd(), f"-env:UserInstallation={profile}", '--headless',
+               '--convert-to', 'pdf', '--outdir', outdir] + [src for src, _ in jobs]
+        error = None
+        try:
+            run = subprocess.run(cmd, capture_output=True, text=True, timeout=60 + timeout_per_file * len(jobs))
+            error = run.stderr or run.stdout
+        except subprocess.TimeoutExpired:
+            error = "Timeout: LibreOffice took too long."
+        except FileNotFoundError:
+            error = "LibreOffice not found. Ensure 'libreoffice' is in packages.txt"
+
+        # Whatever was produced before a timeout still counts
+        for src, dst in jobs:
+            produced = os.path.join(outdir, os.path.splitext(os.path.basename(src))[0] + ".pdf")
+            if os.path.exists(produced):
+                shutil.move(produced, dst)
+                results[src] = (True, dst)
+            else:
+                results[src] = (False, f"LibreOffice failed: {error or 'no output'}")
+    return results
+
+def convert_many(paths, out_dir, pool_size=2):
+    """
+    Convert many workbooks to PDF with a handful of LibreOffice launches.
+
+    paths: input .xlsx paths, or (input_path, pdf_name) pairs to pick the output name
+           (default: <input basename>.pdf).
+    Uses the warm conversion server when it is up; otherwise splits the list
+    across at most pool_size concurrent soffice runs.
+
+    Returns {input_path: (success, pdf_path or error message)} keyed by the paths given.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = _batch_jobs(paths, out_dir)
+    keys = {src: (item[0] if isinstance(item, (tuple, list)) else item) for (src, _), item in zip(jobs, paths)}
+    results = {}
+
+    for src, _ in jobs:
+        if not os.path.exists(src):
+            results[src] = (False, f"Excel file not found: {src}")
+    jobs = [j for j in jobs if j[0] not in results]
+
+    server = get_office_server() if LO_SERVER_ENABLED and _import_uno() is not None else None
+    if server is not None and server.is_running():
+        for src, dst in jobs:
+            results[src] = server.convert(src, dst)
+        # Anything the server choked on goes through the batch path below
+        jobs = [j for j in jobs if not results[j[0]][0]]
+
+    if jobs:
+        # Same basename from different folders would collide in one outdir: give each its own run
+        runs = []
+        for job in jobs:
+            base = os.path.basename(job[0])
+            run = next((r for r in runs if base not in {os.path.basename(s) for s, _ in r}), None)
+            if run is None:
+                run = []
+                runs.append(run)
+            run.append(job)
+
+        # Spread the distinct-name runs over the pool
+        chunks = []
+        for run in runs:
+            n = max(1, min(pool_size, len(run)))
+            chunks.extend(run[i::n] for i in range(n))
+        with ThreadPoolExecutor(max_workers=max(1, pool_size)) as pool:
+            for partial in pool.map(_convert_run, chunks):
+                results.update(partial)
+
+    return {keys[src]: results[src] for src in keys}
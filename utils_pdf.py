@@ -1,14 +1,72 @@
 from fpdf import FPDF
+from fpdf.image_parsing import get_img_info
 import os
+import threading
+from utils_words import amount_in_words
+
+# Decoded background images shared by every PDF in the process:
+# {(abs path, image filter): ((mtime_ns, size), image info)}
+# Seeding a document's image_cache mirrors fpdf2's preload_image(); fpdf2 is
+# pinned in requirements.txt and tests/test_pdf_background.py checks the
+# output stays identical to stock image handling.
+_background_cache = {}
+_background_lock = threading.Lock()
+
+def _background_info(path, image_filter):
+    """Parsed image info for path, decoded once per process and re-read only if the file changes."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    signature = (st.st_mtime_ns, st.st_size)
+    key = (os.path.abspath(path), image_filter)
+    cached = _background_cache.get(key)
+    if cached is None or cached[0] != signature:
+        with _background_lock:
+            cached = _background_cache.get(key)
+            if cached is None or cached[0] != signature:
+                cached = _background_cache[key] = (signature, get_img_info(path, None, image_filter))
+    return cached[1]
+
+def clear_background_cache():
+    with _background_lock:
+        _background_cache.clear()
 
 class PDF(FPDF):
     def __init__(self, background_image=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.background_image = background_image
+        self._background_checked = False
+
+    def _prepare_background(self):
+        """
+        Once per document: drop a missing/changed-away background, and seed this
+        document's image cache with the shared decoded image so fpdf neither
+        re-reads nor re-decodes it. fpdf then embeds it once and references it per page.
+        """
+        self._background_checked = True
+        info = _background_info(self.background_image, self.image_cache.image_filter)
+        if info is None:
+            self.background_image = None
+            return
+        images = self.image_cache.images
+        if self.background_image not in images:
+            entry = type(info)(info)
+            entry["i"] = len(images) + 1
+            entry["usages"] = 0
+            entry["iccp_i"] = None
+            iccp = entry.get("iccp")
+            if iccp is not None:
+                profiles = self.image_cache.icc_profiles
+                entry["iccp_i"] = profiles.setdefault(iccp, len(profiles))
+                entry["iccp"] = None
+            images[self.background_image] = entry
 
     def header(self):
         # If a background image is provided, place it covering the whole page
-        if self.background_image and os.path.exists(self.background_image):
+        if self.background_image and not self._background_checked:
+            self._prepare_background()
+        if self.background_image:
             self.image(self.background_image, x=0, y=0, w=210, h=297)
 
     def draw_grid(self):
@@ -101,8 +159,6 @@ class PDF(FPDF):
         self.set_font("Helvetica", "B", 10)
         self.text(12, 230, "Amount In Words:")
 
-from num2words import num2words
-
 def generate_invoice_pdf(invoice_data, layout_config=None, show_grid=False):
     """
     Generates an invoice PDF using 'BILL FORMAT.png' (or fallback).
@@ -279,19 +335,14 @@ def generate_invoice_pdf(invoice_data, layout_config=None, show_grid=False):
     
     # 19. Amount in Words
     width_for_words = 110 - 10 # approximate based on user request x-10 to x-110
-    total_val = invoice_data['total']
-    try:
-        words = num2words(total_val, lang='en_IN').title() + " Only"
-    except:
-        words = f"{total_val} Only" # Fallback
-        
+    
     x, y = config["amount_words"]
     pdf.set_xy(x, y)
     if show_grid:
         pdf.set_text_color(0, 0, 255)
         pdf.cell(100, 10, "[Amount In Words]", border=0)
     else:
-        pdf.multi_cell(100, 5, f"Rupees {words}")
+        pdf.multi_cell(100, 5, f"Rupees {amount_in_words(invoice_data['total'])}")
 
     return pdf.output()
 
@@ -0,0 +1,210 @@
+import io
+import multiprocessing
+import os
+import sys
+import time
+
+import utils_excel as xls_gen
+import utils_native
+import utils_vectorpdf
+
+# Bulk document rendering: openpyxl fills run in a process pool. Without
+# LibreOffice each worker also draws the native PDF from the workbook it just
+# filled; with it, PDFs are converted in batches afterwards
+# (utils_native.convert_many). Jobs are plain dicts:
+#   {'kind': 'invoice' | 'challan', 'data': <generator payload>, 'name': <file base name>}
+DEFAULT_JOB_TIMEOUT = 120
+FILLERS = {
+    'invoice': xls_gen.fill_invoice_workbook,
+    'challan': xls_gen.fill_challan_workbook,
+}
+TEMPLATES = {
+    'invoice': xls_gen.INVOICE_TEMPLATE,
+    'challan': xls_gen.CHALLAN_TEMPLATE,
+}
+
+def document_name(doc_no, supplier):
+    """File base name used across the app: <doc no>_<supplier>."""
+    return f"{str(doc_no).replace('/', '_')}_{str(supplier).replace(' ', '_')}"
+
+def invoice_job(inv_data):
+    return {'kind': 'invoice', 'data': inv_data,
+            'name': document_name(inv_data['invoice_no'], inv_data['supplier_name'])}
+
+def challan_job(challan_data):
+    return {'kind': 'challan', 'data': challan_data,
+            'name': document_name(challan_data['challan_no'], challan_data['supplier'])}
+
+def _fill_workbook(job, out_dir, native_pdf=False):
+    """
+    Worker: render one job's .xlsx into out_dir, and with native_pdf its PDF
+    from the same filled Workbook. Runs in a pool process.
+    Returns (xlsx_path, pdf_path, pdf_error, seconds).
+    """
+    started = time.perf_counter()
+    wb = FILLERS[job['kind']](job['data'])
+    buf = io.BytesIO()
+    wb.save(buf)
+    xlsx_path = xls_gen.save_document(buf.getvalue(), os.path.join(out_dir, f"{job['name']}.xlsx"))
+    pdf_path = pdf_error = None
+    if native_pdf:
+        try:
+            content = utils_vectorpdf.render_workbook_pdf(wb, TEMPLATES[job['kind']])
+            pdf_path = xls_gen.save_document(content, os.path.join(out_dir, f"{job['name']}.pdf"))
+        except Exception as e:
+            pdf_error = f"Native PDF failed: {e}"
+    return xlsx_path, pdf_path, pdf_error, time.perf_counter() - started
+
+def _native_pdf(entry, out_dir):
+    """Render an already saved .xlsx with utils_vectorpdf (after a failed office conversion)."""
+    from openpyxl import load_workbook
+
+    content = utils_vectorpdf.render_workbook_pdf(load_workbook(entry['xlsx']), TEMPLATES[entry['kind']])
+    return xls_gen.save_document(content, os.path.join(out_dir, f"{entry['name']}.pdf"))
+
+def render_jobs(jobs, out_dir="generated", workers=None, pdf=True, native_pdf=None,
+                job_timeout=DEFAULT_JOB_TIMEOUT, progress=None):
+    """
+    Render a batch of jobs (any iterable, consumed lazily).
+
+    workers: pool processes (default: every core). At most `workers` jobs are
+             in flight, so every submitted job starts at once and a large
+             generator of payloads is never fully materialized.
+    job_timeout: seconds one job (Excel fill plus any native PDF) may run,
+                 counted from its submission (= its start). An overrunning
+                 job is reported as failed and the pool is recycled, killing
+                 the hung worker; the other in-flight jobs are resubmitted
+                 with fresh deadlines.
+    native_pdf: draw PDFs with utils_vectorpdf inside the workers (default:
+                when LibreOffice isn't installed). Otherwise PDFs go through
+                utils_native.convert_many, and any it fails on are drawn by
+                the native renderer afterwards.
+    progress(done, failed) is called as results come in.
+
+    Returns one dict per job, in job order:
+    {'name', 'kind', 'ok', 'xlsx', 'pdf', 'error', 'seconds'}.
+    """
+    workers = workers or os.cpu_count() or 1
+    if native_pdf is None:
+        native_pdf = not utils_native.libreoffice_available()
+    native_pdf = pdf and native_pdf
+    out_dir = os.path.abspath(out_dir)
+    os.makedirs(out_dir, exist_ok=True)
+
+    # spawn: workers don't inherit the app's threads or SQLite connections
+    context = multiprocessing.get_context("spawn")
+    results = []
+    pending = []  # FIFO of [entry, job, AsyncResult, deadline]
+    state = {'pool': context.Pool(processes=workers)}
+
+    def submit(item):
+        item[2] = state['pool'].apply_async(_fill_workbook, (item[1], out_dir, native_pdf))
+        item[3] = time.monotonic() + job_timeout
+
+    def report():
+        if progress:
+            progress(sum(1 for r in results if r['ok']), sum(1 for r in results if r['error']))
+
+    def collect_oldest():
+        entry, job, async_result, deadline = pending.pop(0)
+        try:
+            entry['xlsx'], entry['pdf'], entry['error'], entry['seconds'] = async_result.get(
+                timeout=max(0.0, deadline - time.monotonic()))
+            entry['ok'] = entry['error'] is None
+        except multiprocessing.TimeoutError:
+            entry['error'] = f"Timeout: rendering took longer than {job_timeout}s"
+            # Only way to stop a hung worker: replace the pool, rerun the rest
+            state['pool'].terminate()
+            state['pool'].join()
+            state['pool'] = context.Pool(processes=workers)
+            for item in pending:
+                submit(item)
+        except Exception as e:
+            entry['error'] = f"Excel fill failed: {e}"
+        report()
+
+    try:
+        for job in jobs:
+            entry = {'name': job['name'], 'kind': job['kind'], 'ok': False,
+                     'xlsx': None, 'pdf': None, 'error': None, 'seconds': 0.0}
+            results.append(entry)
+            item = [entry, job, None, None]
+            submit(item)
+            pending.append(item)
+            if len(pending) >= workers:
+                collect_oldest()
+        while pending:
+            collect_oldest()
+    finally:
+        state['pool'].terminate()
+        state['pool'].join()
+
+    if pdf and not native_pdf:
+        filled = [r for r in results if r['ok']]
+        started = time.perf_counter()
+        converted = utils_native.convert_many([r['xlsx'] for r in filled], out_dir, pool_size=workers)
+        per_file = (time.perf_counter() - started) / len(filled) if filled else 0.0
+        for r in filled:
+            success, msg = converted[r['xlsx']]
+            r['seconds'] += per_file
+            if success:
+                r['pdf'] = msg
+                continue
+            native_started = time.perf_counter()
+            try:
+                r['pdf'] = _native_pdf(r, out_dir)
+            except Exception as e:
+                r['ok'] = False
+                r['error'] = f"{msg}; native PDF failed: {e}"
+            r['seconds'] += time.perf_counter() - native_started
+
+    return results
+
+def iter_invoice_jobs(supplier_name=None, date_from=None, date_to=None, page_size=200):
+    """Invoice jobs straight from the DB, oldest first, one page at a time."""
+    import database as db
+
+    cursor = None
+    while True:
+        page, cursor = db.get_invoices_page(cursor, page_size, sort="date", descending=False,
+                                            supplier_name=supplier_name,
+                                            date_from=date_from, date_to=date_to)
+        for invoice_id in page['id']:
+            inv_data = db.get_invoice_for_render(int(invoice_id))
+            if inv_data:
+                yield invoice_job(inv_data)
+        if cursor is None:
+            return
+
+if __name__ == "__main__":
+    import argparse
+
+    import database as db
+
+    parser = argparse.ArgumentParser(description="Bulk-render invoices to Excel/PDF.")
+    parser.add_argument("--supplier", help="Only invoices for this supplier")
+    parser.add_argument("--from", dest="date_from", help="From date (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="date_to", help="To date (YYYY-MM-DD)")
+    parser.add_argument("--out", default="generated/bulk", help="Output folder")
+    parser.add_argument("--workers", type=int, default=None, help="Pool size (default: all cores)")
+    parser.add_argument("--timeout", type=int, default=DEFAULT_JOB_TIMEOUT, help="Per-job timeout (s)")
+    parser.add_argument("--no-pdf", action="store_true", help="Excel only")
+    parser.add_argument("--native-pdf", action="store_true", default=None,
+                        help="Draw PDFs with the native renderer (default: only without LibreOffice)")
+    args = parser.parse_args()
+
+    db.init_db()
+
+    def report(done, failed):
+        print(f"\rRendered {done} ({failed} failed)", end="", file=sys.stderr)
+
+    started = time.perf_counter()
+    results = render_jobs(iter_invoice_jobs(args.supplier, args.date_from, args.date_to),
+                          out_dir=args.out, workers=args.workers, pdf=not args.no_pdf, native_pdf=args.native_pdf,
+                          job_timeout=args.timeout, progress=report)
+    print(file=sys.stderr)
+    ok = sum(1 for r in results if r['ok'])
+    print(f"{ok}/{len(results)} invoices rendered to {args.out} in {time.perf_counter() - started:.1f}s")
+    for r in results:
+        if not r['ok']:
+            print(f"  {r['name']}: {r['error']}")
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import threading
+
+import utils_excel as xls_gen
+
+# Content-addressed cache of rendered documents (XLSX / PDF bytes) on disk.
+# Key = sha256(kind + render payload + template version + variant), so
+# unchanged data re-downloads instantly and any data or template change misses
+# naturally. variant names what produced the bytes (e.g. the PDF engine).
+CACHE_DIR = os.environ.get("AUTOBILLER_RENDER_CACHE",
+                           os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "render"))
+MAX_BYTES = int(os.environ.get("AUTOBILLER_RENDER_CACHE_MB", 200)) * 1024 * 1024
+
+TEMPLATES = {
+    'invoice': xls_gen.INVOICE_TEMPLATE,
+    'challan': xls_gen.CHALLAN_TEMPLATE,
+}
+
+_lock = threading.Lock()
+_index = None  # {path: size}, loaded from disk on first use
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+def render_key(kind, data, variant=None):
+    """Stable hash of a render payload (dates / numpy values serialized via str)."""
+    blob = json.dumps({'kind': kind, 'data': data, 'template': xls_gen.template_version(TEMPLATES[kind]),
+                       'variant': variant}, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+def _path(key, ext):
+    return os.path.join(CACHE_DIR, key[:2], f"{key}.{ext}")
+
+def _load_index():
+    global _index
+    if _index is None:
+        _index = {}
+        for root, _, files in os.walk(CACHE_DIR):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                p = os.path.join(root, name)
+                try:
+                    _index[p] = os.path.getsize(p)
+                except OSError:
+                    pass
+    return _index
+
+def _evict(index):
+    """Drop least recently used files (by mtime, bumped on every hit) until under MAX_BYTES."""
+    total = sum(index.values())
+    if total <= MAX_BYTES:
+        return
+    def age(p):
+        try:
+            return os.path.getmtime(p)
+        except OSError:
+            return 0
+    for p in sorted(index, key=age):
+        if total <= MAX_BYTES:
+            break
+        total -= index.pop(p)
+        try:
+            os.remove(p)
+            _stats['evictions'] += 1
+        except OSError:
+            pass
+
+def get(key, ext):
+    """Cached bytes or None."""
+    path = _path(key, ext)
+    with _lock:
+        try:
+            with open(path, "rb") as f:
+                content = f.read()
+            os.utime(path)  # LRU touch
+            _stats['hits'] += 1
+            return content
+        except OSError:
+            _load_index().pop(path, None)
+            _stats['misses'] += 1
+            return None
+
+def put(key, ext, content):
+    path = _path(key, ext)
+    with _lock:
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(content)
+            os.replace(tmp, path)  # readers never see a partial file
+            index = _load_index()
+            index[path] = len(content)
+            _evict(index)
+        except OSError as e:
+            print(f"Render Cache Error: {e}")
+
+def get_or_render(kind, data, ext, render, variant=None):
+    """
+    Bytes for (kind, data) as ext ('xlsx' / 'pdf'), calling render() on a miss.
+    A render() that returns None (e.g. PDF conversion failed) is not cached.
+    """
+    key = render_key(kind, data, variant)
+    content = get(key, ext)
+    if content is None:
+        content = render()
+        if content is not None:
+            put(key, ext, content)
+    return content
+
+def get_stats():
+    with _lock:
+        index = _load_index()
+        lookups = _stats['hits'] + _stats['misses']
+        return dict(_stats, entries=len(index), bytes=sum(index.values()), max_bytes=MAX_BYTES,
+                    hit_rate=_stats['hits'] / lookups if lookups else 0.0)
+
+def clear():
+    global _index
+    with _lock:
+        for p in _load_index():
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+        _index = None
+        _stats.update(hits=0, misses=0, evictions=0)
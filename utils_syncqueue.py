@@ -0,0 +1,265 @@
+import atexit
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+
+import pandas as pd
+
+import database as db
+
+# Durable background upload queue for Drive sync.
+# sync_to_drive() only records a job in sync_jobs (one row per target, so the
+# same target queued again coalesces and only its latest file is sent); a
+# worker thread uploads due jobs and retries failures with exponential
+# backoff. Jobs survive restarts and simply wait while the machine is offline.
+# The queue lives in its own SQLite file: its bookkeeping writes must not
+# count as data writes (database's read cache, DB snapshot triggers).
+QUEUE_DB = os.environ.get("AUTOBILLER_SYNC_QUEUE", "sync_queue.db")
+BACKOFF_BASE = 5        # seconds before the first retry
+BACKOFF_MAX = 3600      # cap (offline for hours: try at least hourly)
+IDLE_WAIT = 60          # re-check the table at least this often
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "sync")
+
+_schema_ready = set()
+
+@contextmanager
+def _queue_session():
+    """Short-lived connection to QUEUE_DB; commits on success, rolls back on error."""
+    with closing(sqlite3.connect(QUEUE_DB, timeout=db.BUSY_TIMEOUT_SEC)) as conn:
+        if QUEUE_DB not in _schema_ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute('''CREATE TABLE IF NOT EXISTS sync_jobs (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            target TEXT UNIQUE NOT NULL,
+                            src_path TEXT NOT NULL,
+                            subfolder TEXT NOT NULL,
+                            dest_filename TEXT,
+                            version INTEGER NOT NULL DEFAULT 1,
+                            attempts INTEGER NOT NULL DEFAULT 0,
+                            next_attempt_at REAL NOT NULL,
+                            last_error TEXT,
+                            created_at REAL NOT NULL,
+                            updated_at REAL NOT NULL
+                        )''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sync_jobs_due ON sync_jobs (next_attempt_at)")
+            _schema_ready.add(QUEUE_DB)
+        with conn:
+            yield conn
+
+def backoff_delay(attempts):
+    """Seconds until retry number `attempts` (1-based), with +-10% jitter."""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(0.9, 1.1)
+
+def _target(subfolder, dest_filename, src_path):
+    return f"{subfolder}/{dest_filename or os.path.basename(src_path)}"
+
+def enqueue(src_path, subfolder, dest_filename=None):
+    """
+    Queue src_path for upload to <subfolder>/<dest_filename>. A pending job
+    for the same target is replaced (its backoff reset), not duplicated.
+    """
+    src_path = os.path.abspath(src_path)
+    now = time.time()
+    with _queue_session() as conn:
+        conn.execute("""INSERT INTO sync_jobs (target, src_path, subfolder, dest_filename, next_attempt_at, created_at, updated_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT (target) DO UPDATE SET
+                            src_path = excluded.src_path,
+                            version = version + 1,
+                            attempts = 0,
+                            next_attempt_at = excluded.next_attempt_at,
+                            last_error = NULL,
+                            updated_at = excluded.updated_at""",
+                     (_target(subfolder, dest_filename, src_path), src_path, subfolder, dest_filename, now, now, now))
+    get_sync_queue().wake()
+
+_queued_generation = {}
+_builders = {}  # abs src_path -> build(), run by the worker just before the upload
+
+def register_builder(src_path, build):
+    """
+    Files derived from the database (e.g. the master ledger .xlsx) are built
+    by the worker right before they are sent, so queuing one is instant and
+    several queued changes coalesce into one build.
+    """
+    _builders[os.path.abspath(src_path)] = build
+
+def enqueue_on_change(src_path, subfolder, generation):
+    """
+    enqueue() once per data change: skipped when this target was already
+    queued at the same write generation (database.get_write_generation()).
+    The first call in a process always queues (startup sync).
+    """
+    target = _target(subfolder, None, src_path)
+    if _queued_generation.get(target) == generation:
+        return False
+    enqueue(src_path, subfolder)
+    _queued_generation[target] = generation
+    return True
+
+def snapshot_database(path=None):
+    """Consistent copy of the live (WAL) database via the SQLite backup API."""
+    path = path or os.path.join(SNAPSHOT_DIR, os.path.basename(db.DB_FILE))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    src = sqlite3.connect(db.DB_FILE)
+    dst = sqlite3.connect(tmp)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+    os.replace(tmp, path)
+    return path
+
+class SyncQueue:
+    """Worker thread draining sync_jobs through handler(src_path, subfolder, dest_filename) -> bool."""
+
+    def __init__(self):
+        self.handler = None
+        self._thread = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.uploaded = 0
+        self.dropped = 0
+        self.last_success = None
+        self.last_error = None
+
+    def start(self, handler):
+        """Set the upload handler and start the worker if it isn't running (idempotent)."""
+        with self._lock:
+            self.handler = handler
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="drive-sync", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def wake(self):
+        self._wake.set()
+
+    def retry_now(self):
+        """Make every waiting job due immediately (e.g. back online)."""
+        with _queue_session() as conn:
+            conn.execute("UPDATE sync_jobs SET next_attempt_at = ?", (time.time(),))
+        self.wake()
+
+    def _next_job(self):
+        """(due job or None, seconds until the next job is due)."""
+        with _queue_session() as conn:
+            row = conn.execute("""SELECT id, version, src_path, subfolder, dest_filename, attempts, next_attempt_at
+                                  FROM sync_jobs ORDER BY next_attempt_at LIMIT 1""").fetchone()
+        if row is None:
+            return None, IDLE_WAIT
+        wait = row[6] - time.time()
+        return (row, 0) if wait <= 0 else (None, min(wait, IDLE_WAIT))
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                job, wait = self._next_job()
+            except Exception as e:
+                self.last_error = f"Queue Error: {e}"
+                job, wait = None, BACKOFF_BASE
+            if job is None:
+                self._wake.wait(wait)
+                self._wake.clear()
+                continue
+            self._process(*job[:6])
+
+    def _process(self, job_id, version, src_path, subfolder, dest_filename, attempts):
+        target = _target(subfolder, dest_filename, src_path)
+        build = _builders.get(src_path)
+        if build is None and not os.path.exists(src_path):
+            # Nothing left to send; retrying cannot help
+            with _queue_session() as conn:
+                conn.execute("DELETE FROM sync_jobs WHERE id = ? AND version = ?", (job_id, version))
+            self.dropped += 1
+            self.last_error = f"{target}: file no longer exists"
+            return
+
+        error = None
+        try:
+            upload_path = src_path
+            if build is not None:
+                build()
+            elif os.path.abspath(db.DB_FILE) == src_path:
+                # Upload a consistent snapshot of the live database
+                upload_path = snapshot_database()
+                dest_filename = dest_filename or os.path.basename(src_path)
+            if not self.handler(upload_path, subfolder, dest_filename):
+                error = "Upload failed"
+        except Exception as e:
+            error = str(e)
+
+        with _queue_session() as conn:
+            # A job re-queued meanwhile (version bumped) stays pending for its newer file
+            if error is None:
+                conn.execute("DELETE FROM sync_jobs WHERE id = ? AND version = ?", (job_id, version))
+            else:
+                conn.execute("""UPDATE sync_jobs SET attempts = attempts + 1, next_attempt_at = ?,
+                                    last_error = ?, updated_at = ?
+                                WHERE id = ? AND version = ?""",
+                             (time.time() + backoff_delay(attempts + 1), error, time.time(), job_id, version))
+        if error is None:
+            self.uploaded += 1
+            self.last_success = time.time()
+        else:
+            self.last_error = f"{target}: {error}"
+
+    def status(self):
+        with _queue_session() as conn:
+            pending, failing, next_due = conn.execute(
+                "SELECT count(*), COALESCE(SUM(attempts > 0), 0), MIN(next_attempt_at) FROM sync_jobs").fetchone()
+        return {
+            'running': self.is_running(),
+            'pending': pending,
+            'failing': failing,
+            'next_attempt_in': max(0.0, next_due - time.time()) if next_due else None,
+            'uploaded': self.uploaded,
+            'dropped': self.dropped,
+            'last_success': self.last_success,
+            'last_error': self.last_error,
+        }
+
+    def jobs(self):
+        """Pending jobs for display, soonest first."""
+        query = """
+        SELECT target, attempts, next_attempt_at, last_error, updated_at
+        FROM sync_jobs ORDER BY next_attempt_at
+        """
+        with _queue_session() as conn:
+            df = pd.read_sql(query, conn)
+        now = time.time()
+        df['next_attempt_in'] = (df.pop('next_attempt_at') - now).clip(lower=0).round()
+        df['queued'] = pd.to_datetime(df.pop('updated_at'), unit='s')
+        return df
+
+_sync_queue = None
+_sync_queue_lock = threading.Lock()
+
+def get_sync_queue():
+    global _sync_queue
+    with _sync_queue_lock:
+        if _sync_queue is None:
+            _sync_queue = SyncQueue()
+            atexit.register(_sync_queue.stop)
+        return _sync_queue
+
+def start_sync_worker(handler):
+    """Start (or keep) the background worker uploading through handler."""
+    get_sync_queue().start(handler)
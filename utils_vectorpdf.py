@@ -0,0 +1,477 @@
+import os
+import re
+import threading
+from datetime import date, datetime
+
+from fpdf import FPDF
+from openpyxl.styles.colors import COLOR_INDEX
+from openpyxl.utils import range_boundaries
+
+import utils_excel as xls_gen
+
+# Native PDF renderer: each Excel template is compiled once (per template
+# version) into page geometry plus drawing ops - fills, borders and static
+# text. A document is the cached ops replayed on a fresh FPDF, plus text for
+# the cells the generator filled in. No office process involved.
+#
+# Page setup mirrors setup_page_layout(): A4 portrait, 0.75" side / 0.25"
+# top-bottom margins, fit to one page wide, centered horizontally.
+# Bump RENDER_VERSION when the output changes (invalidates cached PDFs).
+RENDER_VERSION = 1
+PAGE_W, PAGE_H = 210.0, 297.0
+MARGIN_X = 0.75 * 25.4
+MARGIN_Y = 0.25 * 25.4
+PT = 25.4 / 72  # mm per point
+PX = PT * 0.75  # mm per screen pixel (96 dpi)
+CELL_PAD = 2 * PX
+LINE_SPACING = 1.2
+
+# Excel border style -> (width in pt, dash pattern in mm or None)
+BORDER_STYLES = {
+    'hair': (0.25, None), 'thin': (0.5, None), 'medium': (1.0, None), 'thick': (1.5, None),
+    'double': (0.5, None), 'dotted': (0.5, (0.3, 0.6)), 'dashed': (0.5, (1.5, 1.0)),
+    'mediumDashed': (1.0, (1.5, 1.0)), 'dashDot': (0.5, (1.5, 0.6)),
+    'mediumDashDot': (1.0, (1.5, 0.6)), 'dashDotDot': (0.5, (1.5, 0.6)),
+    'mediumDashDotDot': (1.0, (1.5, 0.6)), 'slantDashDot': (1.0, (1.5, 0.6)),
+}
+SUM_FORMULA = re.compile(r"^=SUM\(([A-Z]+\d+:[A-Z]+\d+)\)$", re.IGNORECASE)
+
+def _rgb(color, default=None):
+    """openpyxl Color -> (r, g, b); theme colors fall back to default."""
+    if color is None:
+        return default
+    try:
+        if color.type == 'rgb' and isinstance(color.rgb, str) and len(color.rgb) >= 6:
+            value = color.rgb[-6:]
+        elif color.type == 'indexed' and color.indexed < len(COLOR_INDEX):
+            value = COLOR_INDEX[color.indexed][-6:]
+        else:
+            return default
+        return tuple(int(value[i:i + 2], 16) for i in (0, 2, 4))
+    except (TypeError, ValueError):
+        return default
+
+def _font_spec(font):
+    """(core font family, style, size pt, rgb). Core fonts only: Times / Helvetica / Courier."""
+    name = (font.name or "").lower()
+    if any(n in name for n in ("times", "bookman", "georgia", "cambria", "garamond")):
+        family = "Times"
+    elif "courier" in name or "consolas" in name:
+        family = "Courier"
+    else:
+        family = "Helvetica"
+    style = ("B" if font.b else "") + ("I" if font.i else "") + ("U" if font.u else "")
+    return family, style, float(font.sz or 11), _rgb(font.color, (0, 0, 0))
+
+def _latin1(text):
+    # Core PDF fonts are latin-1 only
+    return text.replace("₹", "Rs.").encode("latin-1", "replace").decode("latin-1")
+
+def _format_date(value, number_format):
+    fmt = number_format.lower()
+    if "d" in fmt and "m" in fmt and "y" in fmt:
+        py = (fmt.split(" ")[0].replace("yyyy", "%Y").replace("yy", "%y")
+              .replace("mm", "%m").replace("dd", "%d"))
+        try:
+            return value.strftime(py)
+        except ValueError:
+            pass
+    return value.strftime("%Y-%m-%d")
+
+def _format_number(value, number_format):
+    sections = number_format.split(";")
+    if value == 0 and len(sections) >= 3 and '"-"' in sections[2]:
+        return "-"
+    section = sections[0]
+    if section in ("General", "@", ""):
+        if float(value).is_integer():
+            return str(int(value))
+        return f"{value:.10g}"
+    # Drop literals / spacing codes, keep the digit pattern
+    pattern = re.sub(r'"[^"]*"|_.|\*.|\\.|\[[^\]]*\]', "", section)
+    percent = "%" in pattern
+    if percent:
+        value *= 100
+    decimals = len(re.match(r"[0#]*", pattern.split(".", 1)[1]).group()) if "." in pattern else 0
+    text = f"{value:,.{decimals}f}" if "," in pattern else f"{value:.{decimals}f}"
+    return text + ("%" if percent else "")
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def format_value(value, number_format="General"):
+    """Cell value as Excel would display it (common number/date formats only)."""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, (datetime, date)):
+        return _format_date(value, number_format or "General")
+    if isinstance(value, (int, float)):
+        return _format_number(value, number_format or "General")
+    return str(value)
+
+def _evaluate(ws, cell):
+    """Formula result for the few formulas templates use (=SUM(range)); else ''."""
+    match = SUM_FORMULA.match(str(cell.value).replace(" ", ""))
+    if not match:
+        return ""
+    min_col, min_row, max_col, max_row = range_boundaries(match.group(1))
+    total = 0
+    for r in range(min_row, max_row + 1):
+        for c in range(min_col, max_col + 1):
+            v = ws._cells.get((r, c))
+            if v is not None and _is_number(v.value):
+                total += v.value
+    return total
+
+class _Measure:
+    """Scratch FPDF for string widths (wrapping is decided in unscaled sheet units)."""
+    def __init__(self):
+        self.pdf = FPDF(unit="mm")
+        self.lock = threading.Lock()
+
+    def width(self, family, style, size, text):
+        with self.lock:
+            self.pdf.set_font(family, style.replace("U", ""), size)
+            return self.pdf.get_string_width(text)
+
+_measure = _Measure()
+
+def _wrap(text, width, family, style, size):
+    lines = []
+    for para in text.split("\n"):
+        line = ""
+        for word in para.split(" "):
+            trial = f"{line} {word}" if line else word
+            if line and _measure.width(family, style, size, trial) > width:
+                lines.append(line)
+                line = word
+            else:
+                line = trial
+        lines.append(line)
+    return lines
+
+def _text_ops(cell, box, text, value):
+    """
+    Drawing ops (in sheet mm) for one cell's displayed text inside box (x, y, w, h).
+    value is the cell's (evaluated) value, used for General alignment.
+    """
+    if text == "":
+        return []
+    family, style, size, rgb = _font_spec(cell.font)
+    align = cell.alignment
+    text = _latin1(text)
+    x, y, w, h = box
+
+    if align.wrap_text:
+        lines = _wrap(text, w - 2 * CELL_PAD, family, style, size)
+    else:
+        lines = [text.replace("\n", " ")]
+
+    line_h = size * LINE_SPACING * PT
+    block_h = line_h * len(lines)
+    if align.vertical == "top":
+        top = y + PX
+    elif align.vertical in ("center", "justify", "distributed"):
+        top = y + (h - block_h) / 2
+    else:  # Excel default: bottom
+        top = y + h - block_h - PX
+
+    horizontal = align.horizontal or "general"
+    if horizontal == "general":
+        horizontal = "right" if _is_number(value) else "left"
+
+    ops = []
+    for i, line in enumerate(lines):
+        if not line:
+            continue
+        text_w = _measure.width(family, style, size, line)
+        if horizontal in ("center", "centerContinuous"):
+            tx = x + (w - text_w) / 2
+        elif horizontal == "right":
+            tx = x + w - CELL_PAD - text_w
+        else:
+            tx = x + CELL_PAD + (align.indent or 0) * 3 * PX
+        baseline = top + i * line_h + (line_h + size * 0.7 * PT) / 2
+        ops.append(('text', family, style, size, rgb, tx, baseline, line, text_w, None))
+    return ops
+
+def _cell_signature(cell):
+    f, a = cell.font, cell.alignment
+    return (cell.value, f.name, f.sz, f.b, f.i, f.u, repr(f.color),
+            a.horizontal, a.vertical, a.wrap_text, cell.number_format)
+
+class CompiledTemplate:
+    """Geometry and static drawing ops of one worksheet template."""
+    def __init__(self, ws):
+        self.max_row = ws.max_row
+        self.max_col = ws.max_column
+        self.merge_boxes = {}  # anchor (row, col) -> (max_row, max_col)
+        self.merge_of = {}     # every cell of a merge -> (min_row, min_col, max_row, max_col)
+        self.covered = set()   # non-anchor cells inside merges
+        for rng in ws.merged_cells.ranges:
+            bounds = (rng.min_row, rng.min_col, rng.max_row, rng.max_col)
+            self.merge_boxes[(rng.min_row, rng.min_col)] = (rng.max_row, rng.max_col)
+            for r in range(rng.min_row, rng.max_row + 1):
+                for c in range(rng.min_col, rng.max_col + 1):
+                    self.merge_of[(r, c)] = bounds
+                    if (r, c) != (rng.min_row, rng.min_col):
+                        self.covered.add((r, c))
+
+        self.xs = self._column_edges(ws)
+        self.ys = self._row_edges(ws)
+        sheet_w = self.xs[-1]
+        self.scale = min(1.0, (PAGE_W - 2 * MARGIN_X) / sheet_w) if sheet_w else 1.0
+        self.x0 = (PAGE_W - sheet_w * self.scale) / 2
+        self.pages = self._paginate(ws)
+
+        # Static ops per page; static text keyed by cell so filled cells can replace it
+        self.shape_ops = [[] for _ in self.pages]
+        self.static_text = [{} for _ in self.pages]
+        self.signatures = {}
+        for cell in ws._cells.values():
+            key = (cell.row, cell.column)
+            if cell.row > self.max_row or cell.column > self.max_col:
+                continue
+            page = self.page_of(cell.row)
+            # Covered merge cells still carry the merge's outer borders
+            self.shape_ops[page].extend(self._shape_ops(cell))
+            if key in self.covered or cell.value is None:
+                continue
+            self.signatures[key] = _cell_signature(cell)
+            if not (isinstance(cell.value, str) and cell.value.startswith("=")):
+                self.static_text[page][key] = self.cell_text(ws, cell, cell.value)
+        # Fills first so borders stay visible on top
+        for page_ops in self.shape_ops:
+            fills = [op for op in page_ops if op[0] == 'fill']
+            lines = [op for op in page_ops if op[0] == 'line']
+            page_ops[:] = fills + lines
+
+    def _column_edges(self, ws):
+        default = ws.sheet_format.defaultColWidth or (ws.sheet_format.baseColWidth or 8) + 0.71
+        widths = {c: default for c in range(1, self.max_col + 1)}
+        for dim in ws.column_dimensions.values():
+            lo, hi = dim.min or 0, dim.max or 0
+            for c in range(max(lo, 1), min(hi, self.max_col) + 1):
+                widths[c] = 0 if dim.hidden else (dim.width if dim.width else default)
+        edges = [0.0]
+        for c in range(1, self.max_col + 1):
+            px = int(((256 * widths[c] + int(128 / 7)) / 256) * 7) if widths[c] else 0
+            edges.append(edges[-1] + px * PX)
+        return edges
+
+    def _row_edges(self, ws):
+        default = ws.sheet_format.defaultRowHeight or 15
+        edges = [0.0]
+        for r in range(1, self.max_row + 1):
+            dim = ws.row_dimensions.get(r)
+            height = 0 if dim is not None and dim.hidden else (dim.height if dim is not None and dim.height else default)
+            edges.append(edges[-1] + height * PT)
+        return edges
+
+    def _paginate(self, ws):
+        """[(first_row, last_row)] per page, honoring manual row breaks."""
+        usable = (PAGE_H - 2 * MARGIN_Y) / self.scale
+        manual = {brk.id for brk in ws.row_breaks.brk}
+        pages, start = [], 1
+        for r in range(1, self.max_row + 1):
+            too_tall = self.ys[r] - self.ys[start - 1] > usable
+            if r > start and too_tall:
+                pages.append((start, r - 1))
+                start = r
+            if r in manual and r < self.max_row:
+                pages.append((start, r))
+                start = r + 1
+        pages.append((start, self.max_row))
+        return pages
+
+    def page_of(self, row):
+        for i, (first, last) in enumerate(self.pages):
+            if row <= last:
+                return i
+        return len(self.pages) - 1
+
+    def box(self, row, col):
+        """(x, y, w, h) in sheet mm of the cell or the merged range it anchors."""
+        last_row, last_col = self.merge_boxes.get((row, col), (row, col))
+        last_row, last_col = min(last_row, self.max_row), min(last_col, self.max_col)
+        x, y = self.xs[col - 1], self.ys[row - 1]
+        return x, y, self.xs[last_col] - x, self.ys[last_row] - y
+
+    def _shape_ops(self, cell):
+        ops = []
+        key = (cell.row, cell.column)
+        x, y = self.xs[cell.column - 1], self.ys[cell.row - 1]
+        x2, y2 = self.xs[cell.column], self.ys[cell.row]
+        fill = cell.fill
+        if key not in self.covered and fill is not None and fill.fill_type == "solid":
+            rgb = _rgb(fill.fgColor)
+            if rgb is not None and rgb != (255, 255, 255):
+                bx, by, bw, bh = self.box(cell.row, cell.column)
+                ops.append(('fill', bx, by, bw, bh, rgb))
+        # Inside a merge only the edges on the merge's outline are drawn (as Excel does)
+        min_row, min_col, max_row, max_col = self.merge_of.get(key, key + key)
+        outline = {'left': cell.column == min_col, 'right': cell.column == max_col,
+                   'top': cell.row == min_row, 'bottom': cell.row == max_row}
+        border = cell.border
+        for side, coords in (('left', (x, y, x, y2)), ('right', (x2, y, x2, y2)),
+                             ('top', (x, y, x2, y)), ('bottom', (x, y2, x2, y2))):
+            if not outline[side]:
+                continue
+            edge = getattr(border, side)
+            if edge is None or not edge.style or edge.style not in BORDER_STYLES:
+                continue
+            width, dash = BORDER_STYLES[edge.style]
+            ops.append(('line', *coords, width, _rgb(edge.color, (0, 0, 0)), dash, edge.style == 'double'))
+        return ops
+
+    def _empty(self, ws, row, col):
+        cell = ws._cells.get((row, col))
+        return (row, col) not in self.merge_of and (cell is None or cell.value is None)
+
+    def cell_text(self, ws, cell, value):
+        """
+        (text ops, overflow cells) for one cell. Like Excel: merged and wrapped
+        cells (and numbers) are clipped to their box; other text spills into
+        empty neighbours and is clipped at the first occupied one.
+        """
+        key = (cell.row, cell.column)
+        box = self.box(*key)
+        ops = _text_ops(cell, box, format_value(value, cell.number_format), value)
+        if not ops:
+            return ops, ()
+        x, y, w, h = box
+        left = min(op[5] for op in ops)
+        right = max(op[5] + op[8] for op in ops)
+        boxed = key in self.merge_boxes or cell.alignment.wrap_text
+        if not boxed and left >= x and right <= x + w:
+            return ops, ()
+        span = ()
+        if boxed or _is_number(value):
+            clip = box
+        else:
+            lo = hi = cell.column
+            while lo > 1 and self.xs[lo - 1] > left and self._empty(ws, cell.row, lo - 1):
+                lo -= 1
+            while hi < self.max_col and self.xs[hi] < right and self._empty(ws, cell.row, hi + 1):
+                hi += 1
+            clip = (self.xs[lo - 1], y, self.xs[hi] - self.xs[lo - 1], h)
+            span = tuple((cell.row, c) for c in range(lo, hi + 1) if c != cell.column)
+        return [op[:-1] + (clip,) for op in ops], span
+
+    def dynamic_text(self, ws):
+        """Per-page text ops for cells that differ from the template, and the static cells they replace."""
+        pages = [[] for _ in self.pages]
+        replaced = set()
+        for cell in ws._cells.values():
+            key = (cell.row, cell.column)
+            if key in self.covered or cell.row > self.max_row or cell.column > self.max_col:
+                continue
+            if cell.value is None:
+                if key in self.signatures:
+                    replaced.add(key)
+                continue
+            formula = isinstance(cell.value, str) and cell.value.startswith("=")
+            if not formula and self.signatures.get(key) == _cell_signature(cell):
+                continue
+            replaced.add(key)
+            value = _evaluate(ws, cell) if formula else cell.value
+            pages[self.page_of(cell.row)].extend(self.cell_text(ws, cell, value)[0])
+        # Static text that spilled into a cell which is now filled gets re-clipped
+        for page, static in enumerate(self.static_text):
+            for key, (ops, span) in static.items():
+                if key not in replaced and any(not self._empty(ws, *k) for k in span):
+                    replaced.add(key)
+                    pages[page].extend(self.cell_text(ws, ws._cells[key], ws._cells[key].value)[0])
+        return pages, replaced
+
+_compiled = {}
+_compiled_lock = threading.Lock()
+
+def get_compiled(template_path):
+    """CompiledTemplate for template_path, rebuilt whenever template_version() changes."""
+    if not os.path.isabs(template_path):
+        template_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), template_path)
+    version = xls_gen.template_version(template_path)
+    entry = _compiled.get(template_path)
+    if entry is None or entry[0] != version:
+        with _compiled_lock:
+            entry = _compiled.get(template_path)
+            if entry is None or entry[0] != version:
+                entry = _compiled[template_path] = (version, CompiledTemplate(xls_gen.load_template(template_path).active))
+    return entry[1]
+
+def clear_compiled_cache():
+    with _compiled_lock:
+        _compiled.clear()
+
+def _replay(pdf, ops, compiled, page_index):
+    s = compiled.scale
+    first_row = compiled.pages[page_index][0]
+    y_origin = compiled.ys[first_row - 1]
+
+    def X(x):
+        return compiled.x0 + x * s
+
+    def Y(y):
+        return MARGIN_Y + (y - y_origin) * s
+
+    for op in ops:
+        kind = op[0]
+        if kind == 'fill':
+            _, x, y, w, h, rgb = op
+            pdf.set_fill_color(*rgb)
+            pdf.rect(X(x), Y(y), w * s, h * s, style="F")
+        elif kind == 'line':
+            _, x1, y1, x2, y2, width, rgb, dash, double = op
+            pdf.set_draw_color(*rgb)
+            pdf.set_line_width(max(width * PT * s, 0.1))
+            if dash:
+                pdf.set_dash_pattern(dash[0] * s, dash[1] * s)
+            else:
+                pdf.set_dash_pattern()
+            if double:
+                # Offset perpendicular to the line
+                dx, dy = (0.3, 0) if x1 == x2 else (0, 0.3)
+                pdf.line(X(x1) - dx, Y(y1) - dy, X(x2) - dx, Y(y2) - dy)
+                pdf.line(X(x1) + dx, Y(y1) + dy, X(x2) + dx, Y(y2) + dy)
+            else:
+                pdf.line(X(x1), Y(y1), X(x2), Y(y2))
+        elif kind == 'text':
+            _, family, style, size, rgb, x, baseline, text, _, clip = op
+            if clip:
+                # rect_clip is a bare q/Q: keep fpdf's font/color bookkeeping in a local context
+                cx, cy, cw, ch = clip
+                with pdf.local_context(), pdf.rect_clip(X(cx), Y(cy), cw * s, ch * s):
+                    pdf.set_font(family, style, size * s)
+                    pdf.set_text_color(*rgb)
+                    pdf.text(X(x), Y(baseline), text)
+            else:
+                pdf.set_font(family, style, size * s)
+                pdf.set_text_color(*rgb)
+                pdf.text(X(x), Y(baseline), text)
+    pdf.set_dash_pattern()
+
+def render_workbook_pdf(wb, template_path):
+    """PDF bytes for a workbook filled from template_path (active sheet)."""
+    compiled = get_compiled(template_path)
+    ws = wb.active
+    dynamic, replaced = compiled.dynamic_text(ws)
+
+    pdf = FPDF(unit="mm", format="A4")
+    pdf.set_auto_page_break(False)
+    pdf.set_margins(0, 0, 0)
+    for page_index in range(len(compiled.pages)):
+        pdf.add_page()
+        static = [op for key, (ops, _) in compiled.static_text[page_index].items() if key not in replaced for op in ops]
+        _replay(pdf, compiled.shape_ops[page_index] + static + dynamic[page_index], compiled, page_index)
+    return bytes(pdf.output())
+
+def generate_invoice_pdf(invoice_data, template_path=xls_gen.INVOICE_TEMPLATE):
+    """Invoice PDF straight from the Excel template, same payload as generate_invoice_excel."""
+    return render_workbook_pdf(xls_gen.fill_invoice_workbook(invoice_data, template_path), template_path)
+
+def generate_challan_pdf(challan_data, template_path=xls_gen.CHALLAN_TEMPLATE):
+    """Challan PDF straight from the Excel template, same payload as generate_challan_excel."""
+    return render_workbook_pdf(xls_gen.fill_challan_workbook(challan_data, template_path), template_path)
@@ -0,0 +1,72 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from functools import lru_cache
+
+# Rupees/paise in words, Indian numbering (thousand, lakh, crore).
+# Integer wording matches num2words(n, lang='en_IN').title(), which this replaces.
+ONES = ["Zero", "One", "Two", "Three", "Four", "Five", "Six", "Seven", "Eight", "Nine", "Ten",
+        "Eleven", "Twelve", "Thirteen", "Fourteen", "Fifteen", "Sixteen", "Seventeen", "Eighteen", "Nineteen"]
+TENS = ["", "", "Twenty", "Thirty", "Forty", "Fifty", "Sixty", "Seventy", "Eighty", "Ninety"]
+# (divisor, name), largest first; crores can themselves exceed 99 ("One Hundred Crore")
+GROUPS = [(10_000_000, "Crore"), (100_000, "Lakh"), (1_000, "Thousand")]
+
+def _below_hundred(n):
+    if n < 20:
+        return ONES[n]
+    tens, ones = divmod(n, 10)
+    return TENS[tens] + (f"-{ONES[ones]}" if ones else "")
+
+def _below_thousand(n):
+    hundreds, rest = divmod(n, 100)
+    if not hundreds:
+        return _below_hundred(rest)
+    words = f"{ONES[hundreds]} Hundred"
+    return f"{words} And {_below_hundred(rest)}" if rest else words
+
+@lru_cache(maxsize=4096)
+def number_to_words(n):
+    """Whole number in words: 1234567 -> 'Twelve Lakh, Thirty-Four Thousand, Five Hundred And Sixty-Seven'."""
+    if n < 0:
+        return f"Minus {number_to_words(-n)}"
+    if n < 1000:
+        return _below_thousand(n)
+    parts = []
+    for divisor, name in GROUPS:
+        count, n = divmod(n, divisor)
+        if count:
+            parts.append(f"{number_to_words(count)} {name}")
+    words = ", ".join(parts)
+    if not n:
+        return words
+    # num2words style: "One Thousand And Five" but "One Lakh, One Hundred"
+    return f"{words} And {_below_hundred(n)}" if n < 100 else f"{words}, {_below_thousand(n)}"
+
+def to_paise(amount):
+    """Amount (float/Decimal/str/numpy) rounded half-up to whole paise."""
+    return int((Decimal(str(amount)) * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+@lru_cache(maxsize=4096)
+def _paise_in_words(paise):
+    sign = "Minus " if paise < 0 else ""
+    rupees, paise = divmod(abs(paise), 100)
+    if rupees and paise:
+        words = f"{number_to_words(rupees)} Rupees And {number_to_words(paise)} Paise"
+    elif paise:
+        words = f"{number_to_words(paise)} Paise"
+    else:
+        # Same wording invoices have always printed: "One Thousand And Fifty Only"
+        words = number_to_words(rupees)
+    return f"{sign}{words} Only"
+
+def amount_in_words(amount):
+    """
+    1050 -> 'One Thousand And Fifty Only',
+    656.25 -> 'Six Hundred And Fifty-Six Rupees And Twenty-Five Paise Only'.
+    Anything that isn't a finite number (NaN, blank, text, unhashable values)
+    falls back to '<amount> Only', as before. The memo is keyed by whole paise
+    (_paise_in_words), so 1050, 1050.0 and "1050" share one entry.
+    """
+    try:
+        paise = to_paise(amount)
+    except (InvalidOperation, ValueError, TypeError):
+        return f"{amount} Only"
+    return _paise_in_words(paise)